@@ -0,0 +1,154 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cold start benchmark of the plugin: Kodi starts a new interpreter for every
+plugin invocation, so each action is run in a fresh process, with the stubs
+of benchmarks/stubs, a synthetic library and the bundled lists.
+
+The time from the start of main.py to the end of the action is compared to
+the budget of the action, and the heavy modules imported by the action are
+reported. The exit code is 1 if an action is over its budget.
+
+usage: python benchmarks/coldstart.py [--size 10000] [--repeat 5]
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import shutil
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..'))
+
+# budget of each action in ms, from the start of main.py to the end of the directory
+BUDGETS = [
+    ('root folder', '', 40),
+    ('list_folders by_genre', 'action=list_folders&id=by_genre', 40),
+    ('list_movies 100 movies', 'action=list_movies&id=AFI-100_years_100_laughs', 80),
+    ('list_movies 264 movies', 'action=list_movies&id=BFI-greatest_films_of_all_time', 120),
+    ('lists_for_movie', 'action=lists_for_movie&tmdb=239', 50),
+    # after lists_for_movie, which builds the lists index
+    ('widget 10 random picks', 'action=widget&folder=master&mode=random&filter=all&count=10', 60)
+]
+
+# modules an action should only import if it needs them
+HEAVY_MODULES = ['requests', 'requests_cache', 'sqlite3', 'cProfile']
+
+def child(size, paramstring):
+    """
+    Run one plugin invocation and print its measures as JSON.
+    """
+    sys.path.insert(0, os.path.join(BENCHMARKS_DIR, 'stubs'))
+    sys.path.insert(0, ADDON_DIR)
+
+    import runpy
+    import pkgutil # imported by runpy on its first use, it isn't part of the plugin startup
+    import xbmc
+    import xbmcaddon
+    from synthetic_library import SyntheticLibrary
+
+    xbmcaddon.profile_path = os.environ['JLOM_PROFILE']
+    xbmcaddon.settings.update(json.loads(os.environ['JLOM_SETTINGS']))
+    xbmc.jsonrpc_backend = SyntheticLibrary(size).handle
+    # the library lives in the Kodi process, the garbage collector of the plugin doesn't scan it
+    gc.freeze()
+    sys.argv = ['plugin://plugin.video.jlom/', '1', '?' + paramstring]
+
+    start = time.perf_counter()
+    runpy.run_path(os.path.join(ADDON_DIR, 'main.py'), run_name='__main__')
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print(json.dumps({
+        'ms': elapsed,
+        'jsonrpc_calls': xbmc.jsonrpc_calls,
+        'modules': [name for name in HEAVY_MODULES if name in sys.modules]
+    }))
+
+def invoke(size, paramstring, env):
+    """
+    Run one plugin invocation in a new process, returns its measures.
+    """
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(size), paramstring],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run(size, repeat, settings):
+    """
+    Run every action of BUDGETS, returns {action: measures}.
+    """
+    profile = tempfile.mkdtemp(prefix='jlom-coldstart-')
+    env = dict(os.environ, JLOM_PROFILE=profile, JLOM_SETTINGS=json.dumps(settings))
+    results = {}
+    try:
+        for name, paramstring, budget in BUDGETS:
+            # the first invocation builds the indexes kept by the service, it isn't measured
+            invoke(size, paramstring, env)
+            measures = [invoke(size, paramstring, env) for i in range(repeat)]
+            results[name] = {
+                'median_ms': statistics.median(m['ms'] for m in measures),
+                'budget_ms': budget,
+                'jsonrpc_calls': measures[0]['jsonrpc_calls'],
+                'modules': measures[0]['modules']
+            }
+    finally:
+        shutil.rmtree(profile, ignore_errors=True)
+    return results
+
+def print_results(size, results):
+    """
+    Print the results, returns the number of actions over their budget.
+    """
+    over = 0
+    print(f'\nCold start, library of {size} movies')
+    print(f'{"action":<28} {"median ms":>10} {"budget ms":>10} {"rpc calls":>9}  heavy modules')
+    for name, measures in results.items():
+        status = ''
+        if measures['median_ms'] > measures['budget_ms']:
+            status = '  OVER BUDGET'
+            over += 1
+        print(f'{name:<28} {measures["median_ms"]:>10.1f} {measures["budget_ms"]:>10} {measures["jsonrpc_calls"]:>9}  '
+              f'{", ".join(measures["modules"]) or "-"}{status}')
+    return over
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(int(sys.argv[2]), sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Cold start benchmark of the plugin')
+    parser.add_argument('--size', type=int, default=10000, help='library size')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each action')
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    settings = {
+        'lists_source': True, # bundled lists
+        'details_level': 0
+    }
+    results = run(args.size, args.repeat, settings)
+    over = print_results(args.size, results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+
+    sys.exit(1 if over else 0)
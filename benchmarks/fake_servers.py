@@ -0,0 +1,259 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Local HTTP server standing in for the lists server and for Radarr, so the
+network code of the addon can be measured without GitHub or a real Radarr.
+
+/lists/ serves a lists folder (the bundled lists by default) with its
+manifest, ETags and conditional requests like GitHub. /radarr/api/v3/
+answers the Radarr v3 endpoints used by the addon: system/status,
+rootfolder, qualityprofile, movie, movie/import and queue, adding a movie
+Radarr already has fails with its 400 "already added" response.
+
+Latency, server errors and dropped connections can be injected, and the
+requests are counted by kind.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LISTS_DIR = os.path.join(BENCHMARKS_DIR, '..', 'resources', 'lists')
+
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'tools'))
+from build_manifest import build_manifest
+
+RADARR_API = '/radarr/api/v3/'
+ALREADY_ADDED = "This movie has already been added"
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, like GitHub and Radarr
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.fake.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.fake.handle(self, 'POST')
+
+    def send_json(self, status, value, headers=None):
+        body = json.dumps(value).encode('utf-8') if value is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, header in (headers or {}).items():
+            self.send_header(name, header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, header in (headers or {}).items():
+            self.send_header(name, header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'null')
+
+class FakeServer:
+    """
+    The lists server and Radarr on one local port.
+    Faults, which can be changed while the server runs:
+    latency in seconds before each answer, error_rate the part of the requests
+    answered with a 503, drop_rate the part of the connections closed without an answer.
+    import_endpoint tells if Radarr has the bulk import endpoint.
+    """
+
+    def __init__(self, lists_dir=LISTS_DIR, api_key='benchmark', seed=0):
+        self.lists_dir = lists_dir
+        self.api_key = api_key
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latency = 0
+        self.error_rate = 0
+        self.drop_rate = 0
+        self.import_endpoint = True
+        self.manifest = json.dumps(build_manifest(lists_dir)).encode('utf-8')
+        self.radarr_movies = {}
+        self.counters = {}
+        self.httpd = None
+
+    def set_faults(self, latency=0, error_rate=0, drop_rate=0, import_endpoint=True):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.import_endpoint = import_endpoint
+
+    def set_radarr_movies(self, tmdb_ids):
+        """
+        Set the movies Radarr has, a third of them downloaded.
+        """
+        with self.lock:
+            self.radarr_movies = {}
+            for tmdbid in tmdb_ids:
+                self.add_radarr_movie(tmdbid, has_file=len(self.radarr_movies) % 3 == 0)
+
+    def start(self):
+        """
+        Start serving in a background thread, on a free port.
+        """
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True # requests made to wait by the latency don't block the exit
+        self.httpd.fake = self
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/'
+
+    @property
+    def lists_url(self):
+        return self.url + 'lists/'
+
+    @property
+    def radarr_url(self):
+        return self.url + 'radarr/'
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def reset_counters(self):
+        with self.lock:
+            counters = self.counters
+            self.counters = {}
+        return counters
+
+    def handle(self, request, method):
+        """
+        Answer a request, after the injected faults.
+        """
+        path = request.path.split('?', 1)[0]
+        if path.startswith('/lists/'):
+            self.count('lists_requests') # whatever the answer, the request wasn't served by the cache
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            drop = self.rng.random() < self.drop_rate
+            error = not drop and self.rng.random() < self.error_rate
+        try:
+            if drop:
+                self.count('dropped')
+                request.close_connection = True
+                return
+            if error:
+                self.count('errors')
+                request.send_json(503, {'message': 'injected error'})
+                return
+
+            if path.startswith('/lists/') and method == 'GET':
+                self.handle_lists(request, path[len('/lists/'):])
+            elif path.startswith(RADARR_API):
+                self.handle_radarr(request, method, path[len(RADARR_API):])
+            else:
+                self.count('not_found')
+                request.send_json(404, None)
+        except (BrokenPipeError, ConnectionResetError):
+            self.count('client_gone') # the client gave up waiting, timed out
+
+    def handle_lists(self, request, file_path):
+        if file_path == 'manifest.json':
+            content = self.manifest
+        else:
+            parts = file_path.split('/')
+            full_path = os.path.join(self.lists_dir, *parts)
+            if len(parts) != 2 or '..' in parts or not os.path.isfile(full_path):
+                self.count('lists_not_found')
+                request.send_json(404, None)
+                return
+            with open(full_path, 'rb') as f:
+                content = f.read()
+
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            self.count('lists_not_modified')
+            request.send_body(304, b'', {'ETag': etag})
+            return
+        self.count('lists')
+        request.send_body(200, content, {'ETag': etag, 'Content-Type': 'text/plain; charset=utf-8'})
+
+    def add_radarr_movie(self, tmdbid, title='', monitored=True, has_file=False):
+        movie = {
+            'id': len(self.radarr_movies) + 1,
+            'tmdbId': tmdbid,
+            'title': title or f'Movie {tmdbid}',
+            'monitored': monitored,
+            'hasFile': has_file
+        }
+        self.radarr_movies[tmdbid] = movie
+        return movie
+
+    def handle_radarr(self, request, method, endpoint):
+        if request.headers.get('X-Api-Key') != self.api_key:
+            self.count('radarr_unauthorized')
+            request.send_json(401, {'message': 'Unauthorized'})
+            return
+        self.count(f'radarr {method} {endpoint}')
+
+        if method == 'GET' and endpoint == 'system/status':
+            request.send_json(200, {'appName': 'Radarr', 'version': '5.2.6.8376'})
+        elif method == 'GET' and endpoint == 'rootfolder':
+            request.send_json(200, [{'id': 1, 'path': '/movies', 'accessible': True, 'freeSpace': 10 ** 12}])
+        elif method == 'GET' and endpoint == 'qualityprofile':
+            request.send_json(200, [{'id': 1, 'name': 'Any'}, {'id': 4, 'name': 'HD-1080p'}])
+        elif method == 'GET' and endpoint == 'movie':
+            with self.lock:
+                request.send_json(200, list(self.radarr_movies.values()))
+        elif method == 'GET' and endpoint == 'queue':
+            with self.lock:
+                # every 4th movie without file is downloading
+                records = [{'movieId': movie['id'], 'status': 'downloading', 'trackedDownloadStatus': 'ok'}
+                           for movie in self.radarr_movies.values() if not movie['hasFile'] and movie['id'] % 4 == 0]
+            request.send_json(200, {'page': 1, 'totalRecords': len(records), 'records': records})
+        elif method == 'POST' and endpoint == 'movie':
+            movie_data = request.read_json()
+            with self.lock:
+                if movie_data['tmdbId'] in self.radarr_movies:
+                    answer = (400, [{'propertyName': 'TmdbId', 'errorMessage': ALREADY_ADDED,
+                                     'attemptedValue': movie_data['tmdbId'], 'severity': 'error'}])
+                else:
+                    answer = (201, self.add_radarr_movie(movie_data['tmdbId'], movie_data.get('title', '')))
+            request.send_json(*answer)
+        elif method == 'POST' and endpoint == 'movie/import' and self.import_endpoint:
+            movies_data = request.read_json()
+            with self.lock:
+                added = [self.add_radarr_movie(movie_data['tmdbId'], movie_data.get('title', ''))
+                         for movie_data in movies_data if movie_data['tmdbId'] not in self.radarr_movies]
+            request.send_json(200, added)
+        else:
+            if endpoint == 'movie/import':
+                request.read_json() # the body is read so the connection can be kept
+            request.send_json(404, {'message': 'NotFound'})
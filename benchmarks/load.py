@@ -0,0 +1,241 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Load benchmark of the network code paths: the distant lists and Radarr are
+served by the local stand-ins of fake_servers.py, the library by the
+synthetic one. Each scenario runs plugin invocations in new processes,
+several at a time like a skin refreshing widgets while the user browses,
+with the faults of the scenario injected in the servers.
+
+For each scenario the end-to-end latency of the invocations, the requests
+the server received and the hit ratio of the list requests are reported:
+the part answered without reaching the server, by the requests cache or by
+the circuit breaker. The Radarr scenarios also report the results of the
+added movies.
+
+usage: python benchmarks/load.py [--size 1000] [--jsonrpc-latency 0.005]
+                                 [--only <scenario>...] [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..'))
+
+from fake_servers import FakeServer
+from synthetic_library import lists_tmdb_ids
+
+# Plugin invocations of a browsing session, each list is shown twice
+BROWSE = [
+    '',
+    'action=list_folders&id=by_genre',
+    'action=list_movies&id=AFI-100_years_100_laughs',
+    'action=list_movies&id=BFI-greatest_films_of_all_time',
+    'action=list_folders&id=by_genre',
+    'action=list_movies&id=AFI-100_years_100_laughs',
+    'action=list_movies&id=BFI-greatest_films_of_all_time',
+    ''
+]
+
+# Movies added to Radarr by the Radarr scenarios, half of them are already in Radarr
+RADARR_ADD = 'radarr_add=40'
+
+# (name, faults of the server, invocations, concurrent invocations, Radarr enabled, keep the previous profile)
+SCENARIOS = [
+    ('browse cold cache', {}, BROWSE, 4, False, False),
+    ('browse warm cache', {}, BROWSE, 4, False, True),
+    ('browse slow server', {'latency': 0.2}, BROWSE, 4, False, False),
+    ('browse server errors', {'error_rate': 1.0}, BROWSE, 4, False, False),
+    ('browse dropped connections', {'drop_rate': 0.5}, BROWSE, 4, False, False),
+    ('browse server timeout', {'latency': 6}, BROWSE, 4, False, False),
+    ('browse with radarr states', {}, BROWSE, 4, True, False),
+    ('radarr add, import endpoint', {}, [RADARR_ADD], 1, True, False),
+    ('radarr add, one by one', {'import_endpoint': False}, [RADARR_ADD], 1, True, False),
+    ('radarr add, slow radarr', {'import_endpoint': False, 'latency': 0.1}, [RADARR_ADD], 1, True, False),
+]
+
+def child(size, jsonrpc_latency, paramstring):
+    """
+    Run one plugin invocation, or add movies to Radarr, and print its measures as JSON.
+    """
+    sys.path.insert(0, os.path.join(BENCHMARKS_DIR, 'stubs'))
+    sys.path.insert(0, ADDON_DIR)
+
+    import runpy
+    import xbmc
+    import xbmcaddon
+    import xbmcplugin
+    from synthetic_library import SyntheticLibrary
+
+    xbmcaddon.profile_path = os.environ['JLOM_PROFILE']
+    xbmcaddon.settings.update(json.loads(os.environ['JLOM_SETTINGS']))
+    xbmc.jsonrpc_backend = SyntheticLibrary(size, latency=jsonrpc_latency).handle
+    sys.argv = ['plugin://plugin.video.jlom/', '1', '?' + paramstring]
+
+    # the plugin logs its timings when it ends, the list requests are counted from them
+    timings = {}
+    log = xbmc.log
+    def log_timings(msg, level=xbmc.LOGDEBUG):
+        if msg.startswith('jlom timings: '):
+            for name, timing in json.loads(msg[len('jlom timings: '):])['phases'].items():
+                timings[name] = timings.get(name, 0) + timing['count']
+        log(msg, level)
+    xbmc.log = log_timings
+
+    results = {}
+    start = time.perf_counter()
+    if paramstring.startswith('radarr_add='):
+        # the dialogs of the plugin are skipped, the movies of a list are added like "Add all to Radarr"
+        from resources.lib import radarr
+        tmdb_ids = json.loads(os.environ['JLOM_RADARR_ADD'])
+        movies_data = [radarr.get_movie_data({'id': tmdbid}, '/movies', 1) for tmdbid in tmdb_ids]
+        for result in radarr.add_movies(movies_data).values():
+            results[result] = results.get(result, 0) + 1
+    else:
+        runpy.run_path(os.path.join(ADDON_DIR, 'main.py'), run_name='__main__')
+    elapsed = (time.perf_counter() - start) * 1000
+
+    from resources.lib.timing import log_timings
+    log_timings('load') # the phases not logged by the plugin, the Radarr scenarios
+    print(json.dumps({
+        'ms': elapsed,
+        'items': len(xbmcplugin.directory),
+        'list_requests': timings.get('list: http', 0),
+        'results': results
+    }))
+
+def invoke(size, jsonrpc_latency, paramstring, env):
+    """
+    Run one invocation in a new process, returns its measures, or None if it failed.
+    """
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(size), str(jsonrpc_latency), paramstring],
+                             env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        print(f'{paramstring or "root"} failed:\n{process.stderr.strip()}', file=sys.stderr)
+        return None
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+def run(size, jsonrpc_latency, only=None):
+    """
+    Run the scenarios, returns {scenario: measures}.
+    """
+    # half of the movies added to Radarr are already there
+    tmdb_ids = lists_tmdb_ids()[:int(RADARR_ADD.split('=')[1])]
+    server = FakeServer()
+    server.start()
+
+    results = {}
+    profile = None
+    try:
+        for name, faults, invocations, concurrency, radarr_enable, keep_profile in SCENARIOS:
+            if only and name not in only:
+                continue
+            if profile is None or not keep_profile:
+                if profile is not None:
+                    shutil.rmtree(profile, ignore_errors=True)
+                profile = tempfile.mkdtemp(prefix='jlom-load-')
+            settings = {
+                'lists_source': False,
+                'lists_url': server.lists_url,
+                'details_level': 0,
+                'radarr_enable': radarr_enable,
+                'radarr_url': server.radarr_url,
+                'radarr_token': server.api_key
+            }
+            env = dict(os.environ, JLOM_PROFILE=profile, JLOM_SETTINGS=json.dumps(settings),
+                       JLOM_RADARR_ADD=json.dumps(tmdb_ids))
+
+            server.set_radarr_movies(tmdb_ids[::2])
+            server.set_faults(**faults)
+            server.reset_counters()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                measures = list(executor.map(lambda paramstring: invoke(size, jsonrpc_latency, paramstring, env), invocations))
+            wall = (time.perf_counter() - start) * 1000
+            server.set_faults()
+            counters = server.reset_counters()
+
+            done = [m for m in measures if m is not None]
+            latencies = [m['ms'] for m in done] or [0]
+            list_requests = sum(m['list_requests'] for m in done)
+            radarr_results = {}
+            for m in done:
+                for result, count in m['results'].items():
+                    radarr_results[result] = radarr_results.get(result, 0) + count
+            results[name] = {
+                'invocations': len(invocations),
+                'concurrency': concurrency,
+                'failed': len(invocations) - len(done),
+                'empty': sum(1 for m in done if not m['items'] and not m['results']),
+                'median_ms': statistics.median(latencies),
+                'p95_ms': percentile(latencies, 95),
+                'max_ms': max(latencies),
+                'wall_ms': wall,
+                'list_requests': list_requests,
+                'cache_hit_ratio': 1 - counters.get('lists_requests', 0) / list_requests if list_requests else None,
+                'server': counters,
+                'radarr_results': radarr_results
+            }
+    finally:
+        server.stop()
+        if profile is not None:
+            shutil.rmtree(profile, ignore_errors=True)
+    return results
+
+def print_results(size, results):
+    print(f'\nLoad, library of {size} movies')
+    print(f'{"scenario":<30} {"runs":>5} {"median ms":>10} {"p95 ms":>8} {"max ms":>8} {"wall ms":>8} {"cache hits":>10} {"failed":>6}')
+    for name, measures in results.items():
+        ratio = measures['cache_hit_ratio']
+        print(f'{name:<30} {measures["invocations"]:>2}/{measures["concurrency"]:<2} {measures["median_ms"]:>10.1f} '
+              f'{measures["p95_ms"]:>8.1f} {measures["max_ms"]:>8.1f} {measures["wall_ms"]:>8.0f} '
+              f'{"-" if ratio is None else f"{ratio:.0%}":>10} {measures["failed"] + measures["empty"]:>6}')
+        server = ', '.join(f'{counter} {count}' for counter, count in sorted(measures['server'].items()))
+        print(f'    server: {server or "no request"}')
+        if measures['radarr_results']:
+            print(f'    radarr: {", ".join(f"{result} {count}" for result, count in sorted(measures["radarr_results"].items()))}')
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        child(int(sys.argv[2]), float(sys.argv[3]), sys.argv[4])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Load benchmark of the plugin with local lists and Radarr servers')
+    parser.add_argument('--size', type=int, default=1000, help='library size')
+    parser.add_argument('--jsonrpc-latency', type=float, default=0, help='seconds taken by each JSON-RPC call')
+    parser.add_argument('--only', nargs='+', help='scenarios to run')
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.size, args.jsonrpc_latency, args.only)
+    print_results(args.size, results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
@@ -0,0 +1,229 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Offline benchmarks of the plugin: the Kodi modules are replaced by the stubs
+of benchmarks/stubs and the library by a synthetic one, the bundled lists
+are used.
+
+For each library size, every action is run several times and the median
+latency, the JSON-RPC calls and the peak memory are reported.
+
+usage: python benchmarks/run.py [--sizes 1000 10000 50000] [--repeat 5]
+                                [--json results.json] [--compare previous.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, 'stubs'))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+import xbmc
+import xbmcaddon
+import xbmcplugin
+
+from synthetic_library import SyntheticLibrary
+
+def reset_file(path):
+    """
+    Remove a file of the profile folder to measure its creation.
+    """
+    def reset():
+        if os.path.exists(path):
+            os.remove(path)
+    return reset
+
+def reset_coverage(main):
+    """
+    Change the library version to measure the coverage computation.
+    """
+    def reset():
+        main.get_library_index()["version"] = str(time.time())
+    return reset
+
+def reset_widgets():
+    """
+    Remove the widgets pools to measure their creation.
+    """
+    from resources.lib import widgets
+    shutil.rmtree(widgets.WIDGETS_DIR, ignore_errors=True)
+
+def reset_flat_lists():
+    """
+    Remove the flattened folders and the cached directories to measure the flattening.
+    """
+    from resources.lib import flatten, directory_cache
+    shutil.rmtree(flatten.FLAT_DIR, ignore_errors=True)
+    flatten._subtrees.clear()
+    directory_cache.clear_directory_cache()
+
+def reset_consensus():
+    """
+    Forget the most recommended movies to measure their computation.
+    """
+    from resources.lib import lists_index
+    conn = lists_index.open_lists_index()
+    with conn:
+        conn.execute("DELETE FROM meta WHERE key = 'consensus'")
+    conn.close()
+
+def scenarios(main):
+    """
+    Get the benchmarked actions as (name, setup, action) tuples,
+    setup is run before each measure and isn't measured.
+    """
+    from resources.lib import library, lists_index, directory_cache
+
+    def build_tmdb_index():
+        main.library_index = main.load_library_index()
+
+    return [
+        ('build tmdb index', reset_file(library.INDEX_FILE), build_tmdb_index),
+        ('root folder', None, lambda: main.router('')),
+        ('list_folders by_genre', None, lambda: main.router('action=list_folders&id=by_genre')),
+        ('list_movies 100 movies', directory_cache.clear_directory_cache, lambda: main.router('action=list_movies&id=AFI-100_years_100_laughs')),
+        ('list_movies 264 movies', directory_cache.clear_directory_cache, lambda: main.router('action=list_movies&id=BFI-greatest_films_of_all_time')),
+        ('list_movies 264 cached', None, lambda: main.router('action=list_movies&id=BFI-greatest_films_of_all_time')),
+        ('list_movies 264 filtered', directory_cache.clear_directory_cache,
+         lambda: main.router('action=list_movies&id=BFI-greatest_films_of_all_time&genres=18,35&year_min=1950&year_max=1979&sort=-year')),
+        ('build lists index', reset_file(lists_index.LISTS_INDEX_FILE), lists_index.update_lists_index),
+        ('check lists index', None, lists_index.update_lists_index),
+        ('lists_for_movie', None, lambda: main.router('action=lists_for_movie&tmdb=239')),
+        ('widget pool', reset_widgets, lambda: main.router('action=widget&folder=master&mode=random&filter=all&count=10')),
+        ('widget 10 random picks', None, lambda: main.router('action=widget&folder=master&mode=random&filter=all&count=10')),
+        ('flatten by_genre', reset_flat_lists, lambda: main.router('action=list_movies&id=flat:by_genre')),
+        ('flatten by_genre saved', directory_cache.clear_directory_cache, lambda: main.router('action=list_movies&id=flat:by_genre')),
+        ('most recommended', reset_consensus, lambda: main.router('action=list_movies&id=most_recommended_all')),
+        ('most recommended cached', None, lambda: main.router('action=list_movies&id=most_recommended_all')),
+        ('compute coverage', reset_coverage(main), lambda: main.router('')),
+        ('root folder with coverage', None, lambda: main.router('')),
+    ]
+
+def measure(setup, action, repeat):
+    """
+    Run an action repeat times and measure it, then once more to measure the memory.
+    """
+    latencies = []
+    for n in range(repeat):
+        if setup is not None:
+            setup()
+        xbmcplugin.reset()
+        xbmc.jsonrpc_calls = 0
+        xbmc.jsonrpc_methods = 0
+        start = time.perf_counter()
+        action()
+        latencies.append((time.perf_counter() - start) * 1000)
+    jsonrpc_calls, jsonrpc_methods, items = xbmc.jsonrpc_calls, xbmc.jsonrpc_methods, len(xbmcplugin.directory)
+
+    # memory is measured apart, tracemalloc slows everything down
+    if setup is not None:
+        setup()
+    xbmcplugin.reset()
+    tracemalloc.start()
+    action()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'median_ms': statistics.median(latencies),
+        'min_ms': min(latencies),
+        'jsonrpc_calls': jsonrpc_calls,
+        'jsonrpc_methods': jsonrpc_methods,
+        'items': items,
+        'peak_kib': peak / 1024
+    }
+
+def run(sizes, repeat, settings):
+    """
+    Run all the benchmarks, returns {size: {action: measures}}.
+    """
+    results = {}
+    for size in sizes:
+        profile = tempfile.mkdtemp(prefix='jlom-benchmark-')
+        xbmcaddon.profile_path = profile
+        xbmcaddon.settings.clear()
+        xbmcaddon.settings.update(settings)
+
+        library = SyntheticLibrary(size)
+        xbmc.jsonrpc_backend = library.handle
+
+        # the plugin modules read the profile path when imported, they are imported again for each size
+        for name in list(sys.modules):
+            if name == 'main' or name.startswith('resources'):
+                del sys.modules[name]
+        # the plugin reads its url and handle from the command line
+        sys.argv = ['plugin://plugin.video.jlom/', '1', '']
+        import main
+
+        results[size] = {}
+        try:
+            for name, setup, action in scenarios(main):
+                results[size][name] = measure(setup, action, repeat)
+        finally:
+            shutil.rmtree(profile, ignore_errors=True)
+    return results
+
+def print_results(results, previous=None):
+    """
+    Print the results, with the change from the previous results if given.
+    """
+    for size, actions in results.items():
+        print(f'\nLibrary of {size} movies')
+        print(f'{"action":<28} {"median ms":>10} {"min ms":>9} {"rpc calls":>9} {"rpc methods":>11} {"items":>6} {"peak KiB":>10}')
+        for name, measures in actions.items():
+            line = (f'{name:<28} {measures["median_ms"]:>10.1f} {measures["min_ms"]:>9.1f} {measures["jsonrpc_calls"]:>9} '
+                    f'{measures["jsonrpc_methods"]:>11} {measures["items"]:>6} {measures["peak_kib"]:>10.0f}')
+            before = (previous or {}).get(str(size), {}).get(name)
+            if before is not None and before['median_ms'] > 0:
+                line += f'  ({(measures["median_ms"] / before["median_ms"] - 1) * 100:+.0f}% time)'
+            print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the plugin')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='library sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each action')
+    parser.add_argument('--full-details', action='store_true', help='use the full library details level')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='compare with results saved by --json')
+    args = parser.parse_args()
+
+    settings = {
+        'lists_source': True, # bundled lists
+        'details_level': 1 if args.full_details else 0,
+        'show_coverage': True,
+        'show_consensus': True,
+        'consensus_min_lists': 3,
+        'consensus_size': 250
+    }
+    results = run(args.sizes, args.repeat, settings)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    print_results(results, previous)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
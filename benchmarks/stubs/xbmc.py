@@ -0,0 +1,88 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Minimal stand-in for the Kodi xbmc module, used by the benchmarks.
+JSON-RPC calls are sent to jsonrpc_backend and counted.
+"""
+
+import json
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGWARNING = 2
+LOGERROR = 3
+LOGFATAL = 4
+LOGNONE = 5
+
+PLAYLIST_VIDEO = 1
+
+# function receiving the JSON-RPC request string and returning the response string
+jsonrpc_backend = None
+# number of executeJSONRPC calls and of methods called (a batch counts each of its methods)
+jsonrpc_calls = 0
+jsonrpc_methods = 0
+# minimum level of the messages printed by log
+log_level = LOGWARNING
+
+def log(msg, level=LOGDEBUG):
+    if level >= log_level:
+        print(f'[xbmc.log {level}] {msg}')
+
+def executeJSONRPC(request):
+    global jsonrpc_calls, jsonrpc_methods
+    jsonrpc_calls += 1
+    query = json.loads(request)
+    jsonrpc_methods += len(query) if isinstance(query, list) else 1
+    if jsonrpc_backend is None:
+        return json.dumps({"jsonrpc": "2.0", "id": query.get("id") if isinstance(query, dict) else None, "result": {}})
+    return jsonrpc_backend(request)
+
+def executebuiltin(function, wait=False):
+    pass
+
+def sleep(time):
+    pass
+
+def getInfoLabel(label):
+    return ''
+
+def getCondVisibility(condition):
+    return False
+
+class Actor:
+    def __init__(self, name='', role='', order=-1, thumbnail=''):
+        self.name = name
+        self.role = role
+        self.order = order
+        self.thumbnail = thumbnail
+
+class PlayList:
+    def __init__(self, playlist):
+        self.items = []
+
+    def clear(self):
+        self.items = []
+
+class Player:
+    def isPlaying(self):
+        return False
+
+class Monitor:
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=0):
+        return False
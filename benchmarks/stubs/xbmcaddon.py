@@ -0,0 +1,94 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Minimal stand-in for the Kodi xbmcaddon module, used by the benchmarks.
+Settings default to the values of resources/settings.xml and can be
+overridden with settings.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+# addon folder, the root of the repository
+ADDON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+# addon profile folder, set by the benchmark to a temporary folder
+profile_path = os.path.join(ADDON_PATH, 'benchmarks', 'profile')
+# settings overriding the defaults
+settings = {}
+
+def _read_defaults():
+    defaults = {}
+    root = ET.parse(os.path.join(ADDON_PATH, 'resources', 'settings.xml')).getroot()
+    for setting in root.iter('setting'):
+        default = setting.find('default')
+        value = default.text if default is not None and default.text is not None else ''
+        if setting.get('type') == 'boolean':
+            value = value == 'true'
+        elif setting.get('type') == 'integer':
+            value = int(value or 0)
+        defaults[setting.get('id')] = value
+    return defaults
+
+_defaults = _read_defaults()
+
+def _version():
+    return ET.parse(os.path.join(ADDON_PATH, 'addon.xml')).getroot().get('version')
+
+class Addon:
+    def __init__(self, id=None):
+        pass
+
+    def getAddonInfo(self, id):
+        return {
+            'id': 'plugin.video.jlom',
+            'name': 'Just Lists Of Movies',
+            'path': ADDON_PATH,
+            'profile': profile_path,
+            'version': _version()
+        }[id]
+
+    def _get(self, id):
+        return settings.get(id, _defaults.get(id, ''))
+
+    def getSetting(self, id):
+        value = self._get(id)
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return str(value)
+
+    def getSettingBool(self, id):
+        return bool(self._get(id))
+
+    def getSettingInt(self, id):
+        return int(self._get(id) or 0)
+
+    def getSettingString(self, id):
+        return str(self._get(id))
+
+    def setSetting(self, id, value):
+        settings[id] = value
+
+    def setSettingBool(self, id, value):
+        settings[id] = value
+
+    def setSettingInt(self, id, value):
+        settings[id] = value
+
+    def setSettingString(self, id, value):
+        settings[id] = value
+
+    def getLocalizedString(self, id):
+        return str(id)
@@ -0,0 +1,144 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Minimal stand-in for the Kodi xbmcgui module, used by the benchmarks.
+Dialogs are never shown: they return the "cancelled" value.
+"""
+
+NOTIFICATION_INFO = 'info'
+NOTIFICATION_WARNING = 'warning'
+NOTIFICATION_ERROR = 'error'
+
+class InfoTagVideo:
+    """
+    Records every value set, like the real InfoTag it accepts any setter.
+    """
+    def __init__(self):
+        self.values = {}
+
+    def __getattr__(self, name):
+        if not name.startswith('set'):
+            raise AttributeError(name)
+        def setter(*args):
+            self.values[name[3:]] = args[0] if len(args) == 1 else args
+        return setter
+
+    def getUniqueID(self, key):
+        return self.values.get('UniqueIDs', {}).get(key, '')
+
+class ListItem:
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        self.label = label
+        self.label2 = label2
+        self.path = path
+        self.art = {}
+        self.properties = {}
+        self.context_menu = []
+        self.info_tag = InfoTagVideo()
+
+    def getLabel(self):
+        return self.label
+
+    def setLabel(self, label):
+        self.label = label
+
+    def setLabel2(self, label):
+        self.label2 = label
+
+    def setPath(self, path):
+        self.path = path
+
+    def setArt(self, values):
+        self.art.update(values)
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def getProperty(self, key):
+        return self.properties.get(key, '')
+
+    def addContextMenuItems(self, items, replaceItems=False):
+        self.context_menu.extend(items)
+
+    def getVideoInfoTag(self):
+        return self.info_tag
+
+class Dialog:
+    def notification(self, heading, message, icon=NOTIFICATION_INFO, time=5000, sound=True):
+        pass
+
+    def ok(self, heading, message):
+        return True
+
+    def yesno(self, heading, message, *args, **kwargs):
+        return False
+
+    def select(self, heading, options, *args, **kwargs):
+        return -1
+
+    def multiselect(self, heading, options, *args, **kwargs):
+        return None
+
+    def contextmenu(self, options):
+        return -1
+
+    def numeric(self, type, heading, defaultt='', *args, **kwargs):
+        return ''
+
+    def input(self, heading, defaultt='', *args, **kwargs):
+        return ''
+
+    def textviewer(self, heading, text, usemono=False):
+        pass
+
+class DialogProgress:
+    def create(self, heading, message=''):
+        pass
+
+    def update(self, percent, message=''):
+        pass
+
+    def iscanceled(self):
+        return False
+
+    def close(self):
+        pass
+
+class DialogProgressBG:
+    def create(self, heading, message=''):
+        pass
+
+    def update(self, percent=0, heading='', message=''):
+        pass
+
+    def isFinished(self):
+        return False
+
+    def close(self):
+        pass
+
+class Window:
+    def __init__(self, existingWindowId=-1):
+        self.properties = {}
+
+    def getProperty(self, key):
+        return self.properties.get(key, '')
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def clearProperty(self, key):
+        self.properties.pop(key, None)
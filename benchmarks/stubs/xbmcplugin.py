@@ -0,0 +1,62 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Minimal stand-in for the Kodi xbmcplugin module, used by the benchmarks.
+The items of the directory being created are kept in directory.
+"""
+
+SORT_METHOD_NONE = 0
+SORT_METHOD_LABEL = 1
+SORT_METHOD_TITLE = 9
+SORT_METHOD_VIDEO_YEAR = 18
+SORT_METHOD_VIDEO_RATING = 19
+SORT_METHOD_DURATION = 8
+SORT_METHOD_PLAYCOUNT = 39
+SORT_METHOD_UNSORTED = 40
+
+# (url, list_item, is_folder) of the items added since the last reset
+directory = []
+# number of endOfDirectory calls
+end_of_directory_calls = 0
+
+def reset():
+    global end_of_directory_calls
+    directory.clear()
+    end_of_directory_calls = 0
+
+def setPluginCategory(handle, category):
+    pass
+
+def setContent(handle, content):
+    pass
+
+def addSortMethod(handle, sortMethod, labelMask='', label2Mask=''):
+    pass
+
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    directory.append((url, listitem, isFolder))
+    return True
+
+def addDirectoryItems(handle, items, totalItems=0):
+    directory.extend(items)
+    return True
+
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    global end_of_directory_calls
+    end_of_directory_calls += 1
+
+def setResolvedUrl(handle, succeeded, listitem):
+    pass
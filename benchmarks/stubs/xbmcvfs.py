@@ -0,0 +1,41 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Minimal stand-in for the Kodi xbmcvfs module, used by the benchmarks.
+"""
+
+import os
+
+def translatePath(path):
+    return path
+
+def mkdir(path):
+    os.makedirs(path, exist_ok=True)
+    return True
+
+def mkdirs(path):
+    os.makedirs(path, exist_ok=True)
+    return True
+
+def exists(path):
+    return os.path.exists(path)
+
+def delete(path):
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,189 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Synthetic Kodi movie library answering the JSON-RPC requests of the addon,
+so the benchmarks can run without Kodi.
+
+Part of the library movies come from the bundled lists, so they are found
+when the lists are displayed, the others are random movies.
+"""
+
+import os
+import json
+import time
+import random
+
+LISTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'lists')
+
+def lists_tmdb_ids():
+    """
+    Get the tmdb ids of all the movies of the bundled lists.
+    """
+    ids = set()
+    movie_list_dir = os.path.join(LISTS_DIR, 'movie_list')
+    for file_name in os.listdir(movie_list_dir):
+        with open(os.path.join(movie_list_dir, file_name), 'r', encoding='utf-8') as f:
+            for movie in json.load(f)['movies']:
+                ids.add(movie['id'])
+    return sorted(ids)
+
+GENRES = ['Action', 'Comedy', 'Drama', 'Horror', 'Romance', 'Thriller', 'Western']
+
+class SyntheticLibrary:
+    """
+    A library of size movies.
+    in_lists is the part of the library movies taken from the bundled lists,
+    without_tmdb the part of the movies without a tmdb id.
+    latency is the time in seconds taken by each JSON-RPC call, Kodi answering
+    through its JSON-RPC server.
+
+    Only the random values of a movie are kept, its properties are built when
+    requested, so libraries of hundreds of thousands of movies stay cheap.
+    """
+
+    def __init__(self, size, in_lists=0.5, without_tmdb=0.02, seed=0, latency=0):
+        rng = random.Random(seed)
+        pool = lists_tmdb_ids()
+        nb_in_lists = min(len(pool), int(size * in_lists))
+        tmdb_ids = rng.sample(pool, nb_in_lists)
+        # the other movies get tmdb ids that aren't in any list
+        next_id = 10000000
+        while len(tmdb_ids) < size:
+            tmdb_ids.append(next_id)
+            next_id += 1
+        rng.shuffle(tmdb_ids)
+
+        self.latency = latency
+        # {movieid: (tmdb id or None, year, genres, rating, votes, playcount, runtime)}
+        self.movies = {}
+        for movieid, tmdbid in enumerate(tmdb_ids, 1):
+            year = rng.randint(1920, 2024)
+            has_tmdb = rng.random() >= without_tmdb
+            self.movies[movieid] = (
+                str(tmdbid) if has_tmdb else None,
+                year,
+                rng.sample(GENRES, 2),
+                round(rng.uniform(1, 10), 1),
+                str(rng.randint(10, 100000)),
+                rng.choice([0, 0, 0, 1, 2]),
+                rng.randint(70, 200) * 60
+            )
+
+    def get_property(self, movieid, name):
+        """
+        Build a property of a movie.
+        """
+        tmdbid, year, genres, rating, votes, playcount, runtime = self.movies[movieid]
+        if name in ('label', 'title', 'originaltitle'):
+            return f'Movie {movieid}'
+        if name == 'year':
+            return year
+        if name == 'premiered':
+            return f'{year}-01-01'
+        if name == 'genre':
+            return genres
+        if name == 'rating':
+            return rating
+        if name == 'votes':
+            return votes
+        if name == 'playcount':
+            return playcount
+        if name == 'runtime':
+            return runtime
+        if name == 'uniqueid':
+            uniqueid = {'imdb': f'tt{movieid:07d}'}
+            if tmdbid is not None:
+                uniqueid['tmdb'] = tmdbid
+            return uniqueid
+        if name == 'imdbnumber':
+            return f'tt{movieid:07d}'
+        if name == 'director':
+            return [f'Director {movieid % 500}']
+        if name == 'writer':
+            return [f'Writer {movieid % 700}']
+        if name == 'studio':
+            return [f'Studio {movieid % 50}']
+        if name == 'country':
+            return ['France']
+        if name == 'mpaa':
+            return 'PG-13'
+        if name == 'plot':
+            return 'A synthetic movie. ' * 20
+        if name == 'file':
+            return f'/movies/movie_{movieid}.mkv'
+        if name == 'resume':
+            return {'position': 0, 'total': 0}
+        if name in ('setid', 'top250', 'userrating'):
+            return 0
+        if name in ('showlink', 'tag'):
+            return []
+        if name == 'dateadded':
+            return '2024-01-01 00:00:00'
+        if name == 'cast':
+            return [{'name': f'Actor {movieid % 1000 + n}', 'role': f'Role {n}', 'order': n, 'thumbnail': ''} for n in range(15)]
+        if name == 'streamdetails':
+            return {'video': [{'codec': 'h264', 'width': 1920, 'height': 1080}], 'audio': [{'codec': 'ac3', 'channels': 6}], 'subtitle': []}
+        if name == 'art':
+            return {'poster': f'image://poster_{movieid}.jpg/', 'fanart': f'image://fanart_{movieid}.jpg/'}
+        if name == 'fanart':
+            return f'image://fanart_{movieid}.jpg/'
+        if name == 'thumbnail':
+            return f'image://poster_{movieid}.jpg/'
+        if name == 'ratings':
+            return {'default': {'default': True, 'rating': 7.0, 'votes': 1000}}
+        return '' # sorttitle, tagline, plotoutline, trailer, lastplayed, set
+
+    def handle(self, request):
+        """
+        Answer a JSON-RPC request string, single or batch.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        query = json.loads(request)
+        if isinstance(query, list):
+            return json.dumps([self.call(item) for item in query])
+        return json.dumps(self.call(query))
+
+    def call(self, query):
+        method = query.get('method')
+        params = query.get('params', {})
+        response = {'jsonrpc': '2.0', 'id': query.get('id')}
+
+        if method == 'VideoLibrary.GetMovies':
+            limits = params.get('limits', {})
+            movieids = list(self.movies)
+            start = limits.get('start', 0)
+            end = min(limits.get('end', len(movieids)), len(movieids))
+            response['result'] = {
+                'movies': [self.select(movieid, params.get('properties', [])) for movieid in movieids[start:end]],
+                'limits': {'start': start, 'end': end, 'total': len(movieids)}
+            }
+        elif method == 'VideoLibrary.GetMovieDetails':
+            movieid = params.get('movieid')
+            if movieid not in self.movies:
+                response['error'] = {'code': -32602, 'message': 'Invalid params.'}
+            else:
+                response['result'] = {'moviedetails': self.select(movieid, params.get('properties', []))}
+        else:
+            response['result'] = 'OK'
+
+        return response
+
+    def select(self, movieid, properties):
+        result = {'movieid': movieid, 'label': f'Movie {movieid}'}
+        for name in properties:
+            result[name] = self.get_property(movieid, name)
+        return result
@@ -0,0 +1,31 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+from urllib.parse import urlencode
+
+import xbmc
+import xbmcgui
+
+if __name__ == '__main__':
+    # Context menu of the library movies: show the lists containing the movie
+    list_item = sys.listitem
+    tmdbid = list_item.getVideoInfoTag().getUniqueID('tmdb')
+
+    if not tmdbid:
+        xbmcgui.Dialog().notification('jlom', 'This movie doesn\'t have a tmdb id', xbmcgui.NOTIFICATION_WARNING)
+    else:
+        url = 'plugin://plugin.video.jlom/?' + urlencode({'action': 'lists_for_movie', 'tmdb': tmdbid})
+        xbmc.executebuiltin(f'ActivateWindow(Videos,{url},return)')
@@ -16,18 +16,28 @@
 import os
 import sys
 from urllib.parse import urlencode, parse_qsl
-import json
 import datetime
 
 import xbmc
 import xbmcgui
 import xbmcplugin
-from xbmcaddon import Addon
 from xbmcvfs import translatePath, mkdir
 
-import requests
-import requests_cache
-import StorageServer
+from resources.lib.settings import get_addon, get_setting_bool, get_setting_int
+from resources.lib.library import ADDON_USER_DATA_FOLDER, find_movie, get_movies_details, load_library_index
+from resources.lib.timing import phase, get_timings, log_timings
+from resources.lib.circuit_breaker import HostUnavailable
+from resources.lib.lists import get_list, get_list_signature, prefetch_lists, sync_lists
+from resources.lib.lists_index import update_lists_index, is_lists_index_empty, is_lists_index_outdated, get_movie_lists
+from resources.lib.coverage import get_coverage
+from resources.lib.consensus import CONSENSUS_FOLDER_ID, get_consensus_folder, is_consensus_list, get_consensus_list, get_consensus_signature
+from resources.lib.artwork import TMDB_IMAGE_BASE_URL, get_art_size, get_art_url, request_artwork_warmup
+from resources.lib.columns import build_columns, select, parse_filters, get_filters_params
+from resources.lib.widgets import MODES, FILTERS, get_pool, pick_movies
+from resources.lib.flatten import FLAT_LIST_PREFIX, get_flat_list_id, is_flat_list, get_flat_list, get_flat_signature
+from resources.lib.directory_cache import content_signature, get_cached_directory, save_directory
+from resources.lib.diagnostics import record_invocation, get_diagnostics_text
+from resources.lib import radarr
 #import web_pdb;
 
 # Get the plugin url in plugin:// notation.
@@ -35,13 +45,10 @@ URL = sys.argv[0]
 # Get a plugin handle as an integer number.
 HANDLE = int(sys.argv[1])
 # Get addon base path
-ADDON_PATH = translatePath(Addon().getAddonInfo('path'))
+ADDON_PATH = translatePath(get_addon().getAddonInfo('path'))
 ICONS_DIR = os.path.join(ADDON_PATH, 'resources', 'images', 'icons')
 FANART_DIR = os.path.join(ADDON_PATH, 'resources', 'images', 'fanart')
 
-#TMDB url for poster and fanart
-TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
-
 GENRES = {
     28: "Action",
     12: "Adventure",
@@ -64,8 +71,20 @@ GENRES = {
     37: "Western"
 }
 
-#global tmdb to local dbid index
-tmdb_index = {}
+#number of invocation profiles kept when profiling is enabled
+PROFILES_KEPT = 20
+
+#global library index maintained by the service, loaded by the actions using it
+library_index = None
+
+def get_library_index():
+    """
+    Get the library index maintained by the service, loaded on first use.
+    """
+    global library_index
+    if library_index is None:
+        library_index = load_library_index()
+    return library_index
 
 def get_url(**kwargs):
     """
@@ -74,9 +93,53 @@ def get_url(**kwargs):
     return '{}?{}'.format(URL, urlencode(kwargs))
 
 
-def list_folders(folder_list):
+def get_folder_list(list_id):
+    """
+    Get a folder list, the virtual folder of the most recommended movies is shown in the master list.
+    """
+    if list_id == CONSENSUS_FOLDER_ID:
+        return get_consensus_folder()
+
+    folder_list = get_list("folder_list", list_id)
+    if list_id == "master" and folder_list is not None and get_setting_bool('show_consensus') == True:
+        folder_list = dict(folder_list, folders=folder_list['folders'] + [
+            {"title": "Most recommended", "id": CONSENSUS_FOLDER_ID, "type": "folder_list"}])
+    return folder_list
+
+def get_movie_list(list_id):
+    """
+    Get a movie list, the most recommended lists are computed from the lists index
+    and the flattened folders from the lists below them.
+    """
+    if is_consensus_list(list_id):
+        return get_consensus_list(list_id, get_library_index())
+    if is_flat_list(list_id):
+        return get_flat_list(list_id[len(FLAT_LIST_PREFIX):])
+    return get_list("movie_list", list_id)
+
+def get_movie_list_signature(list_id):
+    """
+    Get the signature of a movie list without reading it, or None if it has to be read.
+    """
+    if is_consensus_list(list_id):
+        return get_consensus_signature(list_id)
+    if is_flat_list(list_id):
+        return get_flat_signature(list_id[len(FLAT_LIST_PREFIX):])
+    return get_list_signature("movie_list", list_id)
+
+def get_movie_list_context_menu(list_id, radarr_enable):
+    """
+    Get the context menu of a movie list item.
+    """
+    context_menu = [('Filter this list...', 'RunPlugin(%s)' % get_url(action='filter_list', id=list_id))]
+    if radarr_enable == True:
+        context_menu.append(('Add missing movies to Radarr', 'RunPlugin(%s)' % get_url(action='radarr_add_list', id=list_id)))
+    return context_menu
+
+def list_folders(folder_list, folder_id=None):
     """
     Create the list of folders in the Kodi interface.
+    With folder_id, the first item shows all the movies of the lists below the folder.
     """
     if folder_list == None:
         return
@@ -90,14 +153,40 @@ def list_folders(folder_list):
     # Set plugin content
     xbmcplugin.setContent(HANDLE, 'movies')
     xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_UNSORTED)
+
+    # Get the library coverage of the lists if it is displayed
+    coverage = None
+    if get_setting_bool('show_coverage') == True:
+        with phase('folders: coverage'):
+            coverage = get_coverage(get_library_index())
+
+    # Read the Radarr setting once for the whole list
+    radarr_enable = get_setting_bool('radarr_enable')
+
+    # All the movies of the folder in one list, the virtual folder only leads to computed lists
+    if folder_id is not None and folder_id != CONSENSUS_FOLDER_ID:
+        list_id = get_flat_list_id(folder_id)
+        list_item = xbmcgui.ListItem(label='All movies of this folder')
+        info_tag = list_item.getVideoInfoTag()
+        info_tag.setMediaType('set')
+        info_tag.setTitle(f"{folder_list['title']} - All movies")
+        list_item.setProperty('SpecialSort', 'top')
+        list_item.addContextMenuItems(get_movie_list_context_menu(list_id, radarr_enable))
+        xbmcplugin.addDirectoryItem(HANDLE, get_url(action='list_movies', id=list_id), list_item, True)
     
     # Iterate through folders
     for folder in folders:
 
         title = folder["title"]
 
+        # Show how many movies of the list are in the library
+        label = title
+        if coverage is not None and (folder["type"], folder["id"]) in coverage:
+            total, owned, watched = coverage[(folder["type"], folder["id"])]
+            label = f"{title}  [owned {owned} / {total} (watched {watched})]"
+
         # Create a list item with a text label.
-        list_item = xbmcgui.ListItem(label=title)
+        list_item = xbmcgui.ListItem(label=label)
         
         # Set additional info for the list item using its InfoTag.
         info_tag = list_item.getVideoInfoTag()
@@ -109,6 +198,7 @@ def list_folders(folder_list):
             url = get_url(action='list_folders', id=folder["id"])
         elif folder["type"] == "movie_list":
             url = get_url(action='list_movies', id=folder["id"])
+            list_item.addContextMenuItems(get_movie_list_context_menu(folder["id"], radarr_enable))
         
         # is_folder = True means that this item opens a sub-list of lower level items.
         is_folder = True
@@ -119,54 +209,6 @@ def list_folders(folder_list):
     # Finish creating a virtual folder.
     xbmcplugin.endOfDirectory(HANDLE)
 
-def build_tmdbid_to_dbid_index():
-    """
-    Get a mapping of TMDB IDs to local database IDs for all movies in the library.
-    Returns a dictionary where keys are TMDB IDs and values are local database IDs. 
-    """
-
-    #Construct the JSON-RPC query
-    json_query = {
-        "jsonrpc": "2.0",
-        "method": "VideoLibrary.GetMovies",
-        "params": {
-            "properties": ["uniqueid"]
-        },
-        "id": "libMovies"
-    }
-
-    # Notify user about index building
-    xbmcgui.Dialog().notification('jlom', 'Building movies index...', xbmcgui.NOTIFICATION_INFO)
-
-    # Execute the JSON-RPC query
-    response = xbmc.executeJSONRPC(json.dumps(json_query))
-
-    # Parse the response
-    result = json.loads(response)
-
-    """Build a dict {tmdb: movieid}."""
-    nbmissingids = 0
-    index = {}
-    for movie in result.get("result", {}).get("movies", []):
-        uniqueid = movie.get("uniqueid")
-        if not isinstance(uniqueid, dict): # uniqueid is missing or not a dict
-            nbmissingids += 1
-            continue
-
-        tmdbid = uniqueid.get("tmdb")
-        if tmdbid is None: # tmdb id is missing
-            nbmissingids += 1
-            continue
-
-        movieid = movie.get("movieid")
-        if movieid is not None:
-            index[tmdbid] = movieid
-
-    if nbmissingids > 0:
-        xbmcgui.Dialog().notification('jlom', f'{nbmissingids} movies don\'t have a tmdb id\n and won\'t be found in the lists!', xbmcgui.NOTIFICATION_WARNING, 10000)
-
-    return index
-
 def play_media(dbid):
 
     #clear the playlist
@@ -184,413 +226,454 @@ def play_media(dbid):
     
     xbmcplugin.setResolvedUrl(HANDLE, True, listitem=play_item)
 
-def get_movie_details(id):
-    
-    #Construct the JSON-RPC query
-    json_query = {
-        "jsonrpc": "2.0",
-        "method": "VideoLibrary.GetMovieDetails",
-        "params": {
-            "movieid": id,
-            "properties": [
-                "title",
-                "genre",
-                "year",
-                "rating",
-                "director",
-                "trailer",
-                "tagline",
-                "plot",
-                "plotoutline",
-                "originaltitle",
-                "lastplayed",
-                "playcount",
-                "writer",
-                "studio",
-                "mpaa",
-                "cast",
-                "country",
-                "imdbnumber",
-                "runtime",
-                "set",
-                "showlink",
-                "streamdetails",
-                "top250",
-                "votes",
-                "fanart",
-                "thumbnail",
-                "file",
-                "sorttitle",
-                "resume",
-                "setid",
-                "dateadded",
-                "tag",
-                "art",
-                "userrating",
-                "ratings",
-                "premiered",
-                "uniqueid"
-            ]
-        },
-        "id": "1"
-    }
-
-    # Execute the JSON-RPC query
-    response = xbmc.executeJSONRPC(json.dumps(json_query))
-
-    # Parse the response
-    result = json.loads(response)
-
-    return result
-
-
-def list_movies(movie_list):
+# InfoTag setter of each library movie detail
+INFO_SETTERS = {
+    "title": "setTitle",
+    "genre": "setGenres",
+    "year": "setYear",
+    "rating": "setRating",
+    "director": "setDirectors",
+    "trailer": "setTrailer",
+    "tagline": "setTagLine",
+    "plot": "setPlot",
+    "plotoutline": "setPlotOutline",
+    "originaltitle": "setOriginalTitle",
+    "lastplayed": "setLastPlayed",
+    "playcount": "setPlaycount",
+    "writer": "setWriters",
+    "studio": "setStudios",
+    "mpaa": "setMpaa",
+    "country": "setCountries",
+    "imdbnumber": "setIMDBNumber",
+    "runtime": "setDuration",
+    "set": "setSet",
+    "showlink": "setShowLinks",
+    "top250": "setTop250",
+    "file": "setFilenameAndPath",
+    "sorttitle": "setSortTitle",
+    "setid": "setSetId",
+    "dateadded": "setDateAdded",
+    "tag": "setTags",
+    "userrating": "setUserRating",
+    "premiered": "setPremiered",
+    "uniqueid": "setUniqueIDs"
+}
+
+def get_info_from_details(movie_details):
     """
-    Create the list of movies in the Kodi interface.
+    Get the InfoTag calls setting the library movie details, as [setter, arguments] pairs.
+    Only the properties present in the details are set, so it works with both details levels.
+    """
+
+    info = []
+    for key, setter in INFO_SETTERS.items():
+        if movie_details.get(key) is not None:
+            info.append([setter, [movie_details.get(key)]])
+
+    if movie_details.get("cast") is not None:
+        actors = []
+        for actor in movie_details.get("cast"):
+            actors.append([actor.get("name"), actor.get("role"), actor.get("order"), actor.get("thumbnail")])
+        info.append(["setCast", [actors]])
+    if movie_details.get("votes"):
+        info.append(["setVotes", [int(movie_details.get("votes"))]])
+    if movie_details.get("resume") is not None:
+        info.append(["setResumePoint", [movie_details.get("resume").get("position"), movie_details.get("resume").get("total")]])
+    #stream details
+    #fanart and thumbnail
+    #art
+    #info_tag.setRatings(...) # todo: implement
+    return info
+
+def render_directory(directory):
+    """
+    Create a directory in the Kodi interface from its resolved items.
+    """
+
+    # Set subtitle
+    xbmcplugin.setPluginCategory(HANDLE, directory['category'])
+    # Set plugin content
+    xbmcplugin.setContent(HANDLE, directory['content'])
+    for sort_method in directory['sort_methods']:
+        xbmcplugin.addSortMethod(HANDLE, sort_method)
+
+    for item in directory['items']:
+        list_item = xbmcgui.ListItem(label=item['label'])
+        if item.get('art'):
+            list_item.setArt(item['art'])
+        if item.get('info'):
+            info_tag = list_item.getVideoInfoTag()
+            for setter, args in item['info']:
+                if setter == "setCast":
+                    args = [[xbmc.Actor(*actor) for actor in args[0]]]
+                getattr(info_tag, setter)(*args)
+        for key, value in item.get('properties', {}).items():
+            list_item.setProperty(key, value)
+        if item.get('context'):
+            list_item.addContextMenuItems([tuple(entry) for entry in item['context']])
+
+        # Add our item to the Kodi virtual folder listing.
+        with phase('movies: addDirectoryItem'):
+            xbmcplugin.addDirectoryItem(HANDLE, item['url'], list_item, item['folder'])
+
+    # Finish creating a virtual folder.
+    xbmcplugin.endOfDirectory(HANDLE)
+
+    # Ask the service to load the TMDB artwork in the texture cache before it is scrolled to
+    if get_setting_bool('artwork_warmup') == True:
+        urls = [url for item in directory['items'] for url in item.get('art', {}).values()
+                if url.startswith(TMDB_IMAGE_BASE_URL)]
+        if urls:
+            request_artwork_warmup(urls)
+
+def resolve_movies(movie_list, page=1, page_params=None, filters=None, list_settings=True):
+    """
+    Resolve the items of a list of movies: library lookups, details and labels.
+    Returns a directory for render_directory, it only holds JSON values so it can be cached.
+    With a page size set, only the given page is resolved, followed by a "Next page" item
+    calling the plugin with page_params and the next page number.
+    filters are the ones of columns.select, they can also sort the list.
+    list_settings tells if the page size and "hide not in library" settings apply, not for the widgets.
     """
 
-    if movie_list == None:
-        return
-    
     #get the movies!
     movies = movie_list["movies"]
     ordered_by = movie_list["ordered_by"]
 
     # Read the "hide not in library" setting once for the whole list
-    hide_not_in_library = Addon().getSettingBool('hide_not_in_library')
-
-    # Set subtitle
-    xbmcplugin.setPluginCategory(HANDLE, movie_list['title'])
-    # Set plugin content
-    xbmcplugin.setContent(HANDLE, 'movies')
-
-    if ordered_by == "":
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_NONE) #default
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_TITLE)
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_VIDEO_YEAR)
+    hide_not_in_library = list_settings and get_setting_bool('hide_not_in_library')
+
+    filters = filters or {}
+
+    directory = {'category': movie_list['title'], 'content': 'movies', 'sort_methods': [], 'items': []}
+    if filters:
+        directory['category'] += ' (filtered)'
+
+    if 'sort' in filters:
+        directory['sort_methods'] = [xbmcplugin.SORT_METHOD_UNSORTED, #default, the order of the filters
+                                     xbmcplugin.SORT_METHOD_VIDEO_YEAR,
+                                     xbmcplugin.SORT_METHOD_TITLE]
+    elif ordered_by == "":
+        directory['sort_methods'] = [xbmcplugin.SORT_METHOD_NONE, #default
+                                     xbmcplugin.SORT_METHOD_TITLE,
+                                     xbmcplugin.SORT_METHOD_VIDEO_YEAR]
     elif ordered_by == "rank":
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_UNSORTED) #default
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_VIDEO_YEAR)
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_TITLE)
+        directory['sort_methods'] = [xbmcplugin.SORT_METHOD_UNSORTED, #default
+                                     xbmcplugin.SORT_METHOD_VIDEO_YEAR,
+                                     xbmcplugin.SORT_METHOD_TITLE]
     elif ordered_by == "year":
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_VIDEO_YEAR)#default
-        xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_TITLE)
+        directory['sort_methods'] = [xbmcplugin.SORT_METHOD_VIDEO_YEAR, #default
+                                     xbmcplugin.SORT_METHOD_TITLE]
+
+    # Find the movies in the local database using the tmdb index, then the imdb and title indexes,
+    # the values used by the filters are packed in columns in the same pass
+    with phase('movies: index lookup'):
+        columns = build_columns(movies, get_library_index())
+    sources = columns["source"]
+    xbmc.log(f'movies found by tmdb id: {sources.count("tmdb")}, imdb id: {sources.count("imdb")}, '
+             f'title: {sources.count("title")}, not found: {sources.count(None)}', level=xbmc.LOGDEBUG)
+
+    # Keep the movies matching the filters, and only the ones in the library if the setting is enabled,
+    # the position in the whole list is kept as the rank
+    with phase('movies: filter'):
+        positions = select(columns, filters, in_library=hide_not_in_library)
+    movieids = columns["movieid"]
+    entries = [(index, movies[index], movieids[index] or None, sources[index]) for index in positions]
+
+    # Only keep the requested page
+    page_size = get_setting_int('page_size') if list_settings else 0
+    nbpages = 1
+    if page_size > 0:
+        nbpages = max(1, (len(entries) + page_size - 1) // page_size)
+        page = min(page, nbpages)
+        entries = entries[(page - 1) * page_size:page * page_size]
+
+    # Get the details of all the movies found with a single request
+    movies_details = get_movies_details([local_id for index, movie, local_id, source in entries if local_id is not None])
+
+    # Get the Radarr state of the movies not in the library, from the cached Radarr index
+    radarr_index = {}
+    if get_setting_bool('radarr_enable') == True and any(local_id is None for index, movie, local_id, source in entries):
+        with phase('movies: radarr index'):
+            radarr_index = radarr.get_radarr_index()
 
     # Iterate through movies.
-    for index, movie in enumerate(movies):
-
-        #try to find the movie in the local database using the tmdb index
-        local_id = tmdb_index.get(str(movie['id']))
-
-        # Skip movies not in the local library if the setting is enabled
-        if local_id is None and hide_not_in_library:
-            continue
+    for index, movie, local_id, source in entries:
 
-        # Create a list item with a text label
+        # Create an item with a text label
         if ordered_by == "rank":
             movie_label = str(index+1) + " - " + movie['title']
         else:
             movie_label = movie['title']
 
-        list_item = xbmcgui.ListItem(label= movie_label)
-
-        # Set graphics (thumbnail, fanart, banner, poster, landscape etc.) for the list item.
+        item = {'label': movie_label, 'art': {}, 'info': [], 'properties': {}}
+        # number of lists recommending the movie, for the most recommended lists and the flattened folders
+        if 'lists' in movie:
+            item['properties']['RecommendedBy'] = str(movie['lists'])
+        # lists of a flattened folder containing the movie
+        if 'list_titles' in movie:
+            item['properties']['Lists'] = ' / '.join(movie['list_titles'])
+        # best rank of the movie in the ranked lists, for the most recommended lists and the flattened folders
+        if movie.get('best_rank') is not None:
+            item['properties']['BestRank'] = str(movie['best_rank'])
+
+        # Set graphics (thumbnail, fanart, banner, poster, landscape etc.) for the item.
         if movie['poster_path'] != None:
-            list_item.setArt({'poster': TMDB_IMAGE_BASE_URL+movie['poster_path']})
+            item['art']['poster'] = get_art_url('poster', movie['poster_path'])
         if movie['backdrop_path'] != None:
-            list_item.setArt({'fanart': TMDB_IMAGE_BASE_URL+movie['backdrop_path']})
+            item['art']['fanart'] = get_art_url('fanart', movie['backdrop_path'])
         
-        # Set additional info for the list item via InfoTag.
-        info_tag = list_item.getVideoInfoTag()
-        info_tag.setMediaType('movie')
-        info_tag.setTitle(movie['title'])
-        info_tag.setOriginalTitle(movie['original_title'])
-        info_tag.setYear(int(movie['release_date'][0:4]) if movie['release_date'] != "" else None)
+        # Set additional info for the item via InfoTag.
+        info = item['info']
+        info.append(["setMediaType", ['movie']])
+        info.append(["setTitle", [movie['title']]])
+        info.append(["setOriginalTitle", [movie['original_title']]])
+        info.append(["setYear", [int(movie['release_date'][0:4]) if movie['release_date'] != "" else None]])
         genres = []
         for genre_id in movie.get("genre_ids", []):
             genres.append(GENRES.get(genre_id, "Unknown"))
-        info_tag.setGenres(genres)
-        info_tag.setPlot(movie['overview'])
+        info.append(["setGenres", [genres]])
+        info.append(["setPlot", [movie['overview']]])
         
         #if found, make it playable
         if local_id != None :
-            #get the movie details from the db
-            movie_details = get_movie_details(local_id).get("result", {}).get("moviedetails", {})
+            #get the movie details from the bulk request
+            movie_details = movies_details.get(int(local_id), {})
             
             #set info from db
-            info_tag.setDbId(int(local_id))
-            info_tag.setPath(f'videodb://movies/titles/{local_id}')
-            
-            info_tag.setTitle(movie_details.get("title"))
-            info_tag.setGenres(movie_details.get("genre"))
-            info_tag.setYear(movie_details.get("year"))
-            info_tag.setRating(movie_details.get("rating"))
-            info_tag.setDirectors(movie_details.get("director"))
-            info_tag.setTrailer(movie_details.get("trailer"))
-            info_tag.setTagLine(movie_details.get("tagline"))
-            info_tag.setPlot(movie_details.get("plot"))
-            info_tag.setPlotOutline(movie_details.get("plotoutline"))
-            info_tag.setOriginalTitle(movie_details.get("originaltitle"))
-            info_tag.setLastPlayed(movie_details.get("lastplayed"))
-            info_tag.setPlaycount(movie_details.get("playcount"))
-            info_tag.setWriters(movie_details.get("writer"))
-            info_tag.setStudios(movie_details.get("studio"))
-            info_tag.setMpaa(movie_details.get("mpaa"))
-            actors = []
-            for actor in movie_details.get("cast"):
-                actors.append(xbmc.Actor(actor.get("name"), actor.get("role"), actor.get("order"), actor.get("thumbnail")))
-            info_tag.setCast(actors)
-            info_tag.setCountries(movie_details.get("country"))
-            info_tag.setIMDBNumber(movie_details.get("imdbnumber"))
-            info_tag.setDuration(movie_details.get("runtime"))
-            info_tag.setSet(movie_details.get("set"))
-            info_tag.setShowLinks(movie_details.get("showlink"))
-            #stream details
-            info_tag.setTop250(movie_details.get("top250"))
-            info_tag.setVotes(int(movie_details.get("votes")))
-            #fanart and thumbnail
-            info_tag.setFilenameAndPath(movie_details.get("file"))
-            info_tag.setSortTitle(movie_details.get("sorttitle"))
-            info_tag.setResumePoint(movie_details.get("resume").get("position"), movie_details.get("resume").get("total"))
-            info_tag.setSetId(movie_details.get("setid"))
-            info_tag.setDateAdded(movie_details.get("dateadded"))
-            info_tag.setTags(movie_details.get("tag"))
-            #art
-            info_tag.setUserRating(movie_details.get("userrating"))
-            #info_tag.setRatings(...) # todo: implement
-            info_tag.setPremiered(movie_details.get("premiered"))
-            info_tag.setUniqueIDs(movie_details.get("uniqueid"))
+            info.append(["setDbId", [int(local_id)]])
+            info.append(["setPath", [f'videodb://movies/titles/{local_id}']])
+            info.extend(get_info_from_details(movie_details))
             
             #difference between available and not available item 
-            list_item.setProperty('IsPlayable', 'true')            
+            item['properties']['IsPlayable'] = 'true'
+            # how the movie was found in the library: tmdb, imdb or title
+            item['properties']['MatchSource'] = source
             
             if ordered_by == "rank":
-                info_tag.setTagLine("Ranked %s" % (str(index +1)))
+                info.append(["setTagLine", ["Ranked %s" % (str(index +1))]])
             
             # Direct play url
-            url = f'videodb://movies/titles/{local_id}'
+            item['url'] = f'videodb://movies/titles/{local_id}'
         #if not ...
         else:
-            list_item.setProperty('IsPlayable', 'false')
+            item['properties']['IsPlayable'] = 'false'
+            # Show the Radarr state of the movie if Radarr has it
+            radarr_state = radarr_index.get(str(movie['id']))
+            status = radarr.STATE_LABELS[radarr_state] if radarr_state is not None else "Not in your libray"
+            if radarr_state is not None:
+                item['properties']['RadarrState'] = radarr_state
             if ordered_by == "rank":
-                info_tag.setTagLine("Ranked %s\n" % (str(index +1)) + "Not in your libray")
+                info.append(["setTagLine", ["Ranked %s\n" % (str(index +1)) + status]])
             else:
-                info_tag.setTagLine("Not in your libray")
+                info.append(["setTagLine", [status]])
             #set unique id, useful for other addons
-            info_tag.setUniqueIDs({'tmdb': str(movie['id'])})
+            info.append(["setUniqueIDs", [{'tmdb': str(movie['id'])}]])
 
             # recursive call to offer to search using global search addon
-            url = get_url(action='other_action', id=movie['id'], title=movie['original_title'])
+            item['url'] = get_url(action='other_action', id=movie['id'], title=movie['original_title'])
 
-        # Add the list item to a virtual Kodi folder.
-        is_folder = False
+        # Offer to show the other lists containing this movie
+        item['context'] = [['Lists containing this movie', 'Container.Update(%s)' % get_url(action='lists_for_movie', tmdb=movie['id'])]]
 
-        # Add our item to the Kodi virtual folder listing.
-        xbmcplugin.addDirectoryItem(HANDLE, url, list_item, is_folder)
+        # is_folder = False means that this item doesn't open a sub-list
+        item['folder'] = False
 
-    # Finish creating a virtual folder.
-    xbmcplugin.endOfDirectory(HANDLE)
+        directory['items'].append(item)
 
-def get_local_list(list_type, list_id):
-    """
-    Get a list from the local filesystem
-    """
-
-    list_path = os.path.join(ADDON_PATH, 'resources', 'lists', list_type, f"{list_id}.json")
-    xbmc.log(f'list path: {list_path}',level=xbmc.LOGDEBUG)
-
-    try:
-        with open(list_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        xbmc.log("Error reading local list file", level=xbmc.LOGERROR)
-        raise
+    # Link to the next page, kept at the bottom whatever the sort method
+    if page < nbpages and page_params is not None:
+        directory['items'].append({
+            'label': f'Next page ({page + 1}/{nbpages})',
+            'properties': {'SpecialSort': 'bottom'},
+            'url': get_url(**page_params, page=page + 1),
+            'folder': True
+        })
 
+    return directory
 
-def get_distant_list(list_type, list_id):
+def list_movies(movie_list, page=1, page_params=None, filters=None):
     """
-    Get a list from the configured URL
+    Create the list of movies in the Kodi interface.
+    With a page size set, only the given page is created, followed by a "Next page" item
+    calling the plugin with page_params and the next page number.
     """
 
-    list_url = Addon().getSettingString('lists_url')
-    list_url = list_url if list_url.endswith('/') else list_url + '/'
-    list_url += f"{list_type}/{list_id}.json"
-    xbmc.log(f'list url: {list_url}',level=xbmc.LOGDEBUG)
+    if movie_list == None:
+        return
 
-    try:
-        response = requests.get(list_url, timeout=5)
-        #log if response was from cache
-        from_cache = getattr(response, 'from_cache', False)
-        xbmc.log(f'GitHub requests cached: {from_cache}',level=xbmc.LOGDEBUG)
-    except requests.exceptions.RequestException as e:
-        xbmc.log("Error requesting list url",level=xbmc.LOGERROR)
-        raise
-    else:
-        if response.status_code == 200:
-            return json.loads(response.text)
-        else:
-            return None
+    render_directory(resolve_movies(movie_list, page, page_params, filters))
 
-def get_list(list_type, list_id):
+def show_movie_list(list_id, page=1, filters=None):
     """
-    Get a list, either from the local filesystem or from the configured URL depending on the settings.
+    Create the list of movies of a movie list, from the directory cache when it is up to date.
+    The cached directory depends on the list content, the library version, the filters and
+    the settings used to resolve it, any change gives another key.
     """
 
-    if Addon().getSettingBool('lists_source') == True:
-        return get_local_list(list_type, list_id)
-    else:
-        return get_distant_list(list_type, list_id)
+    # the most recommended lists are computed from the lists index, built the first time
+    if is_consensus_list(list_id) and (is_lists_index_empty() or is_lists_index_outdated()):
+        if not update_lists_index_dialog():
+            return
 
+    filters = filters or {}
+    page_params = {'action': 'list_movies', 'id': list_id, **get_filters_params(filters)}
+    cache_size = get_setting_int('directory_cache_size')
+    if cache_size == 0:
+        list_movies(get_movie_list(list_id), page, page_params, filters)
+        return
+
+    # The signature of the list content, the list is only read if it is needed to get it
+    movie_list = None
+    signature = get_movie_list_signature(list_id)
+    if signature is None:
+        movie_list = get_movie_list(list_id)
+        if movie_list is None:
+            return
+        signature = content_signature(movie_list)
+
+    radarr_version = radarr.get_radarr_index_version() if get_setting_bool('radarr_enable') == True else None
+    key = ['movie_list', list_id, signature, page, sorted(get_filters_params(filters).items()),
+           get_library_index()["version"], radarr_version,
+           get_setting_bool('hide_not_in_library'), get_setting_int('page_size'), get_setting_int('details_level'),
+           get_art_size('poster'), get_art_size('fanart')]
+
+    directory = get_cached_directory(key)
+    if directory is None:
+        if movie_list is None:
+            movie_list = get_movie_list(list_id)
+            if movie_list is None:
+                return
+        directory = resolve_movies(movie_list, page, page_params, filters)
+        save_directory(key, directory, cache_size)
+
+    render_directory(directory)
 
 def radarr_add_movie(movie_data):
     """
     Add a movie to Radarr
     """
 
-    # Get Radarr URL and API token from addon settings
-    radarr_url = Addon().getSettingString('radarr_url')
-    radarr_token = Addon().getSettingString('radarr_token')
-
-    # Build the API endpoint URL
-    api_url = radarr_url if radarr_url.endswith('/') else radarr_url + '/'
-    api_url += "api/v3/movie"
-
-    # Set request headers with API key
-    headers = {
-        'X-Api-Key': radarr_token
-    }
-
-    try:
-        # Send POST request to Radarr to add the movie
-        response = requests.post(api_url, headers=headers, json=movie_data, timeout=5)
-    except requests.exceptions.RequestException as e:
-        # Log error if request fails
-        xbmc.log("Error adding movie to Radarr : exception", level=xbmc.LOGERROR)
-        xbmc.log(f"{e}", level=xbmc.LOGERROR)
+    result = radarr.add_movie(movie_data)
+    if result != radarr.FAILED:
+        # Radarr has the movie now, show it in the lists without requesting Radarr again
+        radarr.set_radarr_states({str(movie_data['tmdbId']): radarr.STATE_MONITORED})
+
+    if result == radarr.ADDED:
+        xbmc.log("Movie added to Radarr")
+        xbmcgui.Dialog().notification('Radarr', 'Movie added successfully', xbmcgui.NOTIFICATION_INFO)
+        return True
+    elif result == radarr.EXISTS:
+        xbmc.log("Movie already exists in Radarr")
+        xbmcgui.Dialog().notification('Radarr', 'Movie already exists in Radarr', xbmcgui.NOTIFICATION_INFO)
         return False
     else:
-        # Success: movie added (HTTP 200 or 201)
-        if response.status_code in [200, 201]:
-            xbmc.log("Movie added to Radarr")
-            xbmcgui.Dialog().notification('Radarr', 'Movie added successfully', xbmcgui.NOTIFICATION_INFO)
-            return True
-        # Bad request (HTTP 400)
-        elif response.status_code == 400:
-            data = response.json()
-            error_message = data[0].get('errorMessage')
-            # Movie may already exist
-            if error_message == "This movie has already been added":
-                xbmc.log("Movie already exists in Radarr")
-                xbmcgui.Dialog().notification('Radarr', 'Movie already exists in Radarr', xbmcgui.NOTIFICATION_INFO)
-            # Other errors
-            else:
-                xbmcgui.Dialog().notification('Radarr', 'Failed to add movie to Radarr', xbmcgui.NOTIFICATION_ERROR)
-                xbmc.log(f"Failed to add movie to Radarr: {error_message}")
-            return False
-        else:
-            xbmcgui.Dialog().notification('Radarr', 'Failed to add movie to Radarr', xbmcgui.NOTIFICATION_ERROR)
-            xbmc.log(f"Failed to add movie to Radarr: {response.status_code} - {response.text}")
-            return False
+        xbmcgui.Dialog().notification('Radarr', 'Failed to add movie to Radarr', xbmcgui.NOTIFICATION_ERROR)
+        return False
 
-def radarr_add_movie_dialogs(id):
+def radarr_options_dialogs():
     """
-    Add a movie to Radarr with user dialogs for folder and quality selection.
+    Check the Radarr connection and ask for the root folder and the quality profile.
+    Returns (root_folder_path, quality_profile_id) or None if cancelled or error.
     """
 
     # Check Radarr connection before proceeding
-    if not radarr_check_connection():
+    if not radarr.check_connection():
         xbmcgui.Dialog().notification('Radarr', 'Connection failed', xbmcgui.NOTIFICATION_ERROR)
-        return
+        return None
     
     # Ask user to select a root folder for the movie
     root_folder_path = radarr_root_folders_dialog()
     if root_folder_path is None:
         xbmcgui.Dialog().notification('Radarr', 'No root folder selected', xbmcgui.NOTIFICATION_ERROR)
-        return
+        return None
     
     # Ask user to select a quality profile for the movie
     quality_profile_id = radarr_quality_profiles_dialog()
     if quality_profile_id is None:
         xbmcgui.Dialog().notification('Radarr', 'No quality profile selected', xbmcgui.NOTIFICATION_ERROR)
+        return None
+
+    return root_folder_path, quality_profile_id
+
+def radarr_add_movie_dialogs(id):
+    """
+    Add a movie to Radarr with user dialogs for folder and quality selection.
+    """
+
+    options = radarr_options_dialogs()
+    if options is None:
         return
 
     # Prepare movie data for Radarr API
-    movie_data = {
-        'tmdbId': id,  # The TMDB ID of the movie
-        'rootFolderPath': root_folder_path,  # Selected root folder path
-        'qualityProfileId': str(quality_profile_id),  # Selected quality profile ID
-        'monitored': True,  # Monitor the movie for downloads
-        'addOptions': {'searchForMovie': True}  # Search for the movie after adding
-    }
+    movie_data = radarr.get_movie_data({'id': id}, *options)
     
     # Send the request to add the movie to Radarr
     return radarr_add_movie(movie_data)
 
-def radarr_check_connection():
+def radarr_add_list_dialogs(list_id):
     """
-    Check Radarr connection by requesting system status endpoint.
-    Returns True if connection is successful, False otherwise.
+    Add all the movies of a list missing from the library to Radarr.
+    The root folder and the quality profile are asked once for the whole list.
     """
 
-    # Get Radarr URL and API token from addon settings
-    radarr_url = Addon().getSettingString('radarr_url')
-    radarr_token = Addon().getSettingString('radarr_token')
+    movie_list = get_movie_list(list_id)
+    if movie_list is None:
+        return
 
-    # Build the API endpoint URL for system status
-    api_url = radarr_url if radarr_url.endswith('/') else radarr_url + '/'
-    api_url += "api/v3/system/status"
+    # Find the movies missing from the library
+    library_index = get_library_index()
+    missing = [movie for movie in movie_list["movies"] if find_movie(library_index, movie)[0] is None]
 
-    # Set request headers with API key
-    headers = {
-        'X-Api-Key': radarr_token
-    }
+    # and the ones Radarr doesn't have yet
+    radarr_index = radarr.get_radarr_index()
+    missing = [movie for movie in missing if str(movie['id']) not in radarr_index]
+    if not missing:
+        xbmcgui.Dialog().notification('Radarr', 'All the movies of the list are in the library or in Radarr', xbmcgui.NOTIFICATION_INFO)
+        return
 
-    try:
-        # Send GET request to Radarr system status endpoint
-        with requests_cache.disabled(): #disable caching for this request
-            response = requests.get(api_url, headers=headers, timeout=5)
-    except requests.exceptions.RequestException as e:
-        # Log error if request fails
-        xbmc.log("Error requesting Radarr status", level=xbmc.LOGERROR)
-        return False
-    else:
-        # Return True if status code is 200 (OK), otherwise False
-        if response.status_code == 200:
-            return True
-        else:
-            return False
+    if not xbmcgui.Dialog().yesno('Radarr', f'Add the {len(missing)} movies of "{movie_list["title"]}" missing from the library to Radarr?'):
+        return
 
-def radarr_get_root_folders():
-    """
-    Get the list of Radarr root folders from the Radarr API.
-    Returns a list of root folder objects or None if the request fails.
-    """
-    # Get Radarr URL and API token from addon settings
-    radarr_url = Addon().getSettingString('radarr_url')
-    radarr_token = Addon().getSettingString('radarr_token')
+    options = radarr_options_dialogs()
+    if options is None:
+        return
 
-    # Build the API endpoint URL for root folders
-    api_url = radarr_url if radarr_url.endswith('/') else radarr_url + '/'
-    api_url += "api/v3/rootfolder"
+    dialog = xbmcgui.DialogProgress()
+    dialog.create('Radarr', f'Adding {len(missing)} movies...')
 
-    # Set request headers with API key
-    headers = {
-        'X-Api-Key': radarr_token
-    }
+    def progress(done, total):
+        dialog.update(int(done * 100 / total), f'Adding movies... {done}/{total}')
 
     try:
-        # Send GET request to Radarr root folders endpoint
-        with requests_cache.disabled(): #disable caching for this request
-            response = requests.get(api_url, headers=headers, timeout=5)
-    except requests.exceptions.RequestException as e:
-        xbmc.log("Error requesting Radarr root folders", level=xbmc.LOGERROR)
-        raise
-    else:
-        # Return list of root folders if status code is 200 (OK)
-        if response.status_code == 200:
-            return json.loads(response.text)
-        else:
-            return None
+        results = radarr.add_movies([radarr.get_movie_data(movie, *options) for movie in missing],
+                                    progress, dialog.iscanceled)
+    finally:
+        dialog.close()
+
+    # Radarr has the movies now, show them in the lists without requesting Radarr again
+    radarr.set_radarr_states({str(tmdbid): radarr.STATE_MONITORED for tmdbid, result in results.items()
+                              if result != radarr.FAILED})
+
+    # Summarize the results, with the titles of the movies that failed
+    counts = {radarr.ADDED: 0, radarr.EXISTS: 0, radarr.FAILED: 0}
+    failed = []
+    for movie in missing:
+        result = results.get(int(movie['id']))
+        if result is None:
+            continue
+        counts[result] += 1
+        if result == radarr.FAILED:
+            failed.append(movie.get('title', str(movie['id'])))
+    not_sent = len(missing) - len(results)
+
+    summary = f'Added: {counts[radarr.ADDED]}\nAlready in Radarr: {counts[radarr.EXISTS]}\nFailed: {counts[radarr.FAILED]}'
+    if not_sent:
+        summary += f'\nCancelled: {not_sent}'
+    if failed:
+        summary += '\n\nFailed: ' + ', '.join(failed[:10]) + (' ...' if len(failed) > 10 else '')
+    xbmc.log(f"Radarr bulk add of {list_id}: {counts}, cancelled: {not_sent}", level=xbmc.LOGINFO)
+    xbmcgui.Dialog().ok('Radarr', summary)
 
 def radarr_root_folders_dialog():
     """
@@ -598,7 +681,7 @@ def radarr_root_folders_dialog():
     Returns the selected folder path or None if cancelled or error.
     """
     # Get root folders from Radarr
-    root_folders = radarr_get_root_folders()
+    root_folders = radarr.get_root_folders()
     if root_folders is None:
         xbmcgui.Dialog().notification('Radarr', 'Error retrieving root folders', xbmcgui.NOTIFICATION_ERROR)
         return None
@@ -615,45 +698,13 @@ def radarr_root_folders_dialog():
     else:
         return root_folders[selected]['path']
 
-def radarr_get_quality_profiles():
-    """
-    Get the list of Radarr quality profiles from the Radarr API.
-    Returns a list of quality profile objects or None if the request fails.
-    """
-    # Get Radarr URL and API token from addon settings
-    radarr_url = Addon().getSettingString('radarr_url')
-    radarr_token = Addon().getSettingString('radarr_token')
-
-    # Build the API endpoint URL for quality profiles
-    api_url = radarr_url if radarr_url.endswith('/') else radarr_url + '/'
-    api_url += "api/v3/qualityprofile"
-
-    # Set request headers with API key
-    headers = {
-        'X-Api-Key': radarr_token
-    }
-
-    try:
-        # Send GET request to Radarr quality profiles endpoint
-        with requests_cache.disabled(): #disable caching for this request
-            response = requests.get(api_url, headers=headers, timeout=5)
-    except requests.exceptions.RequestException as e:
-        xbmc.log("Error requesting Radarr quality profiles", level=xbmc.LOGERROR)
-        raise
-    else:
-        # Return list of quality profiles if status code is 200 (OK)
-        if response.status_code == 200:
-            return json.loads(response.text)
-        else:
-            return None
-
 def radarr_quality_profiles_dialog():
     """
     Show a dialog to select a Radarr quality profile.
     Returns the selected profile ID or None if cancelled or error.
     """
     # Get quality profiles from Radarr
-    profiles = radarr_get_quality_profiles()
+    profiles = radarr.get_quality_profiles()
     if profiles is None:
         xbmcgui.Dialog().notification('Radarr', 'Error retrieving quality profiles', xbmcgui.NOTIFICATION_ERROR)
         return None
@@ -670,10 +721,203 @@ def radarr_quality_profiles_dialog():
     else:
         return profiles[selected]['id']
 
+def prefetch_lists_dialog():
+    """
+    Prefetch all the distant lists showing the progress in a background dialog.
+    """
+
+    if get_setting_bool('lists_source') == True:
+        xbmcgui.Dialog().notification('jlom', 'Local lists are used, nothing to prefetch', xbmcgui.NOTIFICATION_INFO)
+        return
+
+    dialog = xbmcgui.DialogProgressBG()
+    dialog.create('jlom', 'Prefetching lists...')
+
+    def progress(done, total, list_id):
+        dialog.update(int(done * 100 / total), 'jlom', f'Prefetching lists... {done}/{total}')
+
+    try:
+        nblists = prefetch_lists(progress, xbmc.Monitor().abortRequested)
+    finally:
+        dialog.close()
+
+    xbmcgui.Dialog().notification('jlom', f'{nblists} lists prefetched', xbmcgui.NOTIFICATION_INFO)
+
+def update_lists_index_dialog():
+    """
+    Update the lists index showing the progress in a dialog.
+    Returns False if the user cancelled it.
+    """
+
+    dialog = xbmcgui.DialogProgress()
+    dialog.create('jlom', 'Indexing lists...')
+
+    def progress(done, total):
+        dialog.update(int(done * 100 / total), f'Indexing lists... {done}/{total}')
+
+    try:
+        update_lists_index(progress=progress, abort=dialog.iscanceled)
+        return not dialog.iscanceled()
+    finally:
+        dialog.close()
+
+def list_movie_lists(tmdbid):
+    """
+    Create the list of the lists containing a movie in the Kodi interface.
+    """
+
+    # the index is built the first time, then kept up to date by the service
+    if is_lists_index_empty() or is_lists_index_outdated():
+        if not update_lists_index_dialog():
+            return
+
+    movie_lists = get_movie_lists(tmdbid)
+
+    # Set subtitle
+    xbmcplugin.setPluginCategory(HANDLE, 'Lists containing this movie')
+    # Set plugin content
+    xbmcplugin.setContent(HANDLE, 'movies')
+    xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_UNSORTED)
+    xbmcplugin.addSortMethod(HANDLE, xbmcplugin.SORT_METHOD_TITLE)
+
+    for list_id, title, ordered_by, rank, size in movie_lists:
+
+        # Show the rank of the movie in the ranked lists
+        if ordered_by == "rank":
+            label = f"{title} (#{rank}/{size})"
+        else:
+            label = title
+
+        list_item = xbmcgui.ListItem(label=label)
+        info_tag = list_item.getVideoInfoTag()
+        info_tag.setMediaType('set')
+        info_tag.setTitle(title)
+
+        url = get_url(action='list_movies', id=list_id)
+        xbmcplugin.addDirectoryItem(HANDLE, url, list_item, True)
+
+    if len(movie_lists) == 0:
+        xbmcgui.Dialog().notification('jlom', 'This movie is not in any list', xbmcgui.NOTIFICATION_INFO)
+
+    # Finish creating a virtual folder.
+    xbmcplugin.endOfDirectory(HANDLE)
+
+def show_widget(folder_id, mode, library_filter, count):
+    """
+    Create a widget: count movies picked from the lists below a folder, see widgets.pick_movies.
+    It never shows a dialog, a widget is refreshed by the skin in the background.
+    """
+
+    library_index = get_library_index()
+    pool = get_pool(folder_id, library_index)
+    if pool is None:
+        xbmc.log(f'widget: no lists below {folder_id}, or the lists index is empty', level=xbmc.LOGWARNING)
+        xbmcplugin.endOfDirectory(HANDLE)
+        return
+
+    try:
+        movies = pick_movies(folder_id, pool, library_index, mode, library_filter, count)
+    except (OSError, ValueError): # the service rewrote the pool meanwhile
+        pool = get_pool(folder_id, library_index)
+        movies = pick_movies(folder_id, pool, library_index, mode, library_filter, count)
+    # the widget filter already chose the movies, the settings of the lists don't apply
+    render_directory(resolve_movies({"title": "", "ordered_by": "", "movies": movies}, list_settings=False))
+
+def filter_list_dialogs(list_id):
+    """
+    Ask the filters of a movie list (genres, years, unwatched, runtime and order), then show the filtered list.
+    """
+
+    dialog = xbmcgui.Dialog()
+
+    genre_ids = list(GENRES)
+    selected = dialog.multiselect('Genres (none for all)', [GENRES[genre_id] for genre_id in genre_ids])
+    if selected is None:
+        return
+    params = {'genres': ','.join(str(genre_ids[index]) for index in selected)}
+
+    params['year_min'] = dialog.numeric(0, 'From year (empty for any)')
+    params['year_max'] = dialog.numeric(0, 'To year (empty for any)')
+    if dialog.yesno('jlom', 'Only the movies not watched yet?'):
+        params['unwatched'] = '1'
+    params['max_runtime'] = dialog.numeric(0, 'Maximum runtime in minutes (empty for any)')
+
+    sort_orders = [('List order', None), ('Year, oldest first', 'year'), ('Year, newest first', '-year'),
+                   ('Runtime, shortest first', 'runtime'), ('Runtime, longest first', '-runtime')]
+    if is_consensus_list(list_id) or is_flat_list(list_id):
+        sort_orders += [('In the most lists first', '-lists'), ('Best rank first', 'rank')]
+    choice = dialog.select('Order', [label for label, sort in sort_orders])
+    if choice > 0:
+        params['sort'] = sort_orders[choice][1]
+
+    # only the valid filters are kept in the url
+    filters = get_filters_params(parse_filters(params))
+    xbmc.executebuiltin('Container.Update(%s)' % get_url(action='list_movies', id=list_id, **filters))
+
+def sync_lists_dialog():
+    """
+    Synchronize the distant lists showing the progress in a background dialog.
+    """
+
+    if get_setting_bool('lists_source') == True:
+        xbmcgui.Dialog().notification('jlom', 'Local lists are used, nothing to synchronize', xbmcgui.NOTIFICATION_INFO)
+        return
+
+    dialog = xbmcgui.DialogProgressBG()
+    dialog.create('jlom', 'Synchronizing lists...')
+
+    def progress(done, total, file_path):
+        dialog.update(int(done * 100 / total), 'jlom', f'Synchronizing lists... {done}/{total}')
+
+    try:
+        updated = sync_lists(progress, xbmc.Monitor().abortRequested)
+    except OSError: # requests errors are OSError
+        xbmcgui.Dialog().notification('jlom', 'Lists server unreachable', xbmcgui.NOTIFICATION_ERROR)
+        return
+    finally:
+        dialog.close()
+
+    if updated is None:
+        xbmcgui.Dialog().notification('jlom', 'The lists server has no manifest', xbmcgui.NOTIFICATION_WARNING)
+    else:
+        xbmcgui.Dialog().notification('jlom', f'{len(updated)} lists updated', xbmcgui.NOTIFICATION_INFO)
+
+def save_profile(profiler, action):
+    """
+    Save the profile of an invocation to the profiles folder of the addon profile,
+    only the last PROFILES_KEPT profiles are kept.
+    """
+
+    profiles_dir = os.path.join(ADDON_USER_DATA_FOLDER, 'profiles')
+    mkdir(profiles_dir) #make sure the folder exists
+
+    file_name = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f') + f'-{action}.pstats'
+    profiler.dump_stats(os.path.join(profiles_dir, file_name))
+    xbmc.log(f'profile saved: {file_name}', level=xbmc.LOGDEBUG)
+
+    for old_file in sorted(os.listdir(profiles_dir))[:-PROFILES_KEPT]:
+        os.remove(os.path.join(profiles_dir, old_file))
+
 def router(paramstring):
     """
     Router function that calls other functions
-    depending on the provided paramstring
+    depending on the provided paramstring.
+    An unreachable server, or a list that can't be read, is reported to the user
+    instead of failing the invocation.
+    """
+
+    try:
+        route(paramstring)
+    except OSError as e: # requests errors are OSError, HostUnavailable too
+        xbmc.log(f"Invocation stopped: {e}", level=xbmc.LOGWARNING)
+        message = str(e) if isinstance(e, HostUnavailable) else f"Lists unavailable ({type(e).__name__}), try again later"
+        xbmcgui.Dialog().notification('jlom', message, xbmcgui.NOTIFICATION_WARNING)
+        if HANDLE >= 0: # not a RunPlugin action
+            xbmcplugin.endOfDirectory(HANDLE, succeeded=False)
+
+def route(paramstring):
+    """
+    Call the function of the action of the paramstring.
     """
 
     # Parse a URL-encoded paramstring to the dictionary of
@@ -683,28 +927,63 @@ def router(paramstring):
     if not params:
         # If the plugin is called from Kodi UI without any parameters,
         # display the master list
-        list_folders(get_list("folder_list", "master"))
+        list_folders(get_folder_list("master"), "master")
     elif params['action'] == 'list_movies':
         # display a list of movies        
-        list_movies(get_list("movie_list", params['id']))
+        page = max(1, int(params['page'])) if params.get('page', '').isdigit() else 1
+        show_movie_list(params['id'], page, parse_filters(params))
     elif params['action'] == 'list_folders':
         # display a list of folders        
-        list_folders(get_list("folder_list", params['id']))
+        list_folders(get_folder_list(params['id']), params['id'])
     elif params['action'] == 'other_action':
         # last stage callback
 
         # the movie was not found in the library and we propose other actions
         other_actions = ['Search in library']
-        if Addon().getSettingBool('radarr_enable') == True :
-            other_actions.append('Add to Radarr')
+        radarr_state = None
+        if get_setting_bool('radarr_enable') == True :
+            # the add flow is skipped for the movies Radarr already has
+            radarr_state = radarr.get_radarr_index().get(params['id'])
+            if radarr_state is None:
+                other_actions.append('Add to Radarr')
+            else:
+                other_actions.append(radarr.STATE_LABELS[radarr_state])
         
         choice = xbmcgui.Dialog().contextmenu(other_actions)
         if choice == 0:
             #search in library
             xbmc.executebuiltin("RunScript(script.globalsearch,movies=true&searchstring=%s)"%(params['title']))
-        elif choice == 1:
+        elif choice == 1 and radarr_state is None:
             #add to Radarr
             radarr_add_movie_dialogs(params['id'])
+    elif params['action'] == 'widget':
+        # movies picked for a home screen widget
+        mode = params.get('mode') if params.get('mode') in MODES else 'random'
+        library_filter = params.get('filter') if params.get('filter') in FILTERS else 'unwatched'
+        count = int(params['count']) if params.get('count', '').isdigit() else 10
+        show_widget(params.get('folder', 'master'), mode, library_filter, count)
+    elif params['action'] == 'filter_list':
+        # ask the filters of a movie list and show it filtered
+        filter_list_dialogs(params['id'])
+    elif params['action'] == 'radarr_add_list':
+        # add the movies of a list missing from the library to Radarr
+        radarr_add_list_dialogs(params['id'])
+    elif params['action'] == 'lists_for_movie':
+        # display the lists containing a movie
+        list_movie_lists(params['tmdb'])
+    elif params['action'] == 'update_lists_index':
+        # check all the lists and index the ones that changed
+        if update_lists_index_dialog():
+            xbmcgui.Dialog().notification('jlom', 'Lists index updated', xbmcgui.NOTIFICATION_INFO)
+    elif params['action'] == 'prefetch':
+        # download all the distant lists in the background
+        prefetch_lists_dialog()
+    elif params['action'] == 'sync':
+        # download the distant lists that changed since the last synchronization
+        sync_lists_dialog()
+    elif params['action'] == 'diagnostics':
+        # show the caches state and the latencies of the last invocations
+        xbmcgui.Dialog().textviewer('jlom diagnostics', get_diagnostics_text(get_setting_int('requests_cache_size') * 1024 * 1024))
     else:
         # If the provided paramstring does not contain a supported action
         # we raise an exception. This helps to catch coding errors,
@@ -715,20 +994,27 @@ if __name__ == '__main__':
     #logging.basicConfig(level=logging.DEBUG)
     #web_pdb.set_trace()
 
-    #initialize requests cache
-    ADDON_USER_DATA_FOLDER = translatePath(Addon().getAddonInfo('profile'))
-    CACHE_FILE = translatePath(os.path.join(ADDON_USER_DATA_FOLDER, 'requests_cache'))
+    # We use string slicing to trim the leading '?' from the plugin call paramstring
+    paramstring = sys.argv[2][1:]
 
-    mkdir(ADDON_USER_DATA_FOLDER) #make sure the folder exists
-    requests_cache.install_cache( CACHE_FILE, backend='sqlite', expire_after=3600)  # Default expiration: 1 hour
+    # Profile the whole invocation if the hidden setting is enabled
+    profiler = None
+    if get_setting_bool('profile_dump') == True:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
 
+    # The requests cache and the library index are loaded by the actions needing them
+    # Call the router function and pass the plugin call parameters to it.
+    with phase('router'):
+        router(paramstring)
 
-    # instantiate the cache for the tmdb index
-    cache = StorageServer.StorageServer("jlom", 1)
+    action = dict(parse_qsl(paramstring)).get('action', 'root')
+    if profiler is not None:
+        profiler.disable()
+        save_profile(profiler, action)
 
-    # get data from cache or build it if not present
-    tmdb_index = cache.cacheFunction(build_tmdbid_to_dbid_index)
-    
-    # Call the router function and pass the plugin call parameters to it.
-    # We use string slicing to trim the leading '?' from the plugin call paramstring
-    router(sys.argv[2][1:])
+    # the latency and the requests cache use of the invocation, for the diagnostics
+    record_invocation(action, get_timings()['router']['ms'])
+
+    log_timings(paramstring or 'root')
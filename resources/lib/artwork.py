@@ -0,0 +1,155 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Artwork of the lists movies: the TMDB image URLs at the configured sizes, and
+the warm-up of the Kodi texture cache. The plugin asks the service to load
+the artwork of a list it just displayed, the service requests the images
+through the Kodi web server so Kodi caches them before they are scrolled to.
+"""
+
+import json
+from urllib.parse import quote
+
+import xbmc
+
+from resources.lib.settings import get_addon, get_setting_int
+from resources.lib.timing import phase
+
+TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/"
+
+# Sizes of the images by art type, the settings give the index of the size
+ART_SIZES = {
+    'poster': ['w185', 'w342', 'w500', 'original'],
+    'fanart': ['w780', 'w1280', 'original']
+}
+
+# Message sent to the service to warm up the artwork of a list
+WARM_ARTWORK_MESSAGE = 'warm_artwork'
+
+def get_art_size(art_type):
+    """
+    Get the configured size of an art type.
+    """
+    sizes = ART_SIZES[art_type]
+    index = get_setting_int(f'{art_type}_size')
+    return sizes[index] if 0 <= index < len(sizes) else sizes[0]
+
+def get_art_url(art_type, path):
+    """
+    Get the URL of a TMDB image at the configured size of its art type.
+    """
+    return TMDB_IMAGE_BASE_URL + get_art_size(art_type) + path
+
+def request_artwork_warmup(urls):
+    """
+    Ask the service to load the given images in the Kodi texture cache.
+    """
+    json_query = {
+        "jsonrpc": "2.0",
+        "method": "JSONRPC.NotifyAll",
+        "params": {
+            "sender": get_addon().getAddonInfo('id'),
+            "message": WARM_ARTWORK_MESSAGE,
+            "data": {"urls": urls}
+        },
+        "id": "warmArtwork"
+    }
+    xbmc.executeJSONRPC(json.dumps(json_query))
+
+def get_webserver():
+    """
+    Get the address of the Kodi web server as (url, auth), or None if it is disabled.
+    """
+    settings = ["services.webserver", "services.webserverport",
+                "services.webserverusername", "services.webserverpassword"]
+    json_query = [{
+        "jsonrpc": "2.0",
+        "method": "Settings.GetSettingValue",
+        "params": {"setting": setting},
+        "id": index
+    } for index, setting in enumerate(settings)]
+    response = json.loads(xbmc.executeJSONRPC(json.dumps(json_query)))
+    values = {item.get("id"): item.get("result", {}).get("value") for item in response}
+
+    if not values.get(0) or not values.get(1):
+        return None
+    auth = (values.get(2), values.get(3)) if values.get(3) else None
+    return f"http://127.0.0.1:{values[1]}", auth
+
+def get_uncached_urls(urls):
+    """
+    Get the images of urls which are not in the Kodi texture cache yet, with one batch request.
+    """
+    if not urls:
+        return []
+    json_query = [{
+        "jsonrpc": "2.0",
+        "method": "Textures.GetTextures",
+        "params": {
+            "properties": ["url"],
+            "filter": {"field": "url", "operator": "is", "value": url}
+        },
+        "id": index
+    } for index, url in enumerate(urls)]
+    with phase('artwork: texture lookup'):
+        response = json.loads(xbmc.executeJSONRPC(json.dumps(json_query)))
+    cached = {item.get("id") for item in response if item.get("result", {}).get("textures")}
+    return [url for index, url in enumerate(urls) if index not in cached]
+
+def get_texture_url(server_url, url):
+    """
+    Get the web server URL making Kodi cache an image.
+    """
+    return f"{server_url}/image/" + quote(f"image://{quote(url, safe='')}/", safe='')
+
+def warm_artwork(urls, abort=None):
+    """
+    Load the images of urls in the Kodi texture cache through the Kodi web server,
+    artwork_workers images at a time. abort is polled to stop early, it is optional.
+    Returns the number of images loaded.
+    """
+    urls = get_uncached_urls(list(dict.fromkeys(urls)))
+    if not urls:
+        return 0
+
+    webserver = get_webserver()
+    if webserver is None:
+        xbmc.log("The Kodi web server is disabled, the artwork can't be loaded in advance", level=xbmc.LOGWARNING)
+        return 0
+    server_url, auth = webserver
+
+    import requests
+    import requests_cache
+    with requests_cache.disabled(): # the images are cached by Kodi
+        session = requests.Session()
+    session.auth = auth
+
+    def load(url):
+        if abort is not None and abort():
+            return False
+        try:
+            response = session.get(get_texture_url(server_url, url), timeout=30)
+        except OSError as e: # requests errors are OSError
+            xbmc.log(f"Error loading {url} in the texture cache: {e}", level=xbmc.LOGDEBUG)
+            return False
+        return response.status_code == 200
+
+    workers = max(1, get_setting_int('artwork_workers'))
+    from concurrent.futures import ThreadPoolExecutor
+    with phase('artwork: warm-up'), ThreadPoolExecutor(max_workers=workers) as executor:
+        loaded = sum(executor.map(load, urls))
+    session.close()
+    return loaded
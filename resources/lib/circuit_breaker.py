@@ -0,0 +1,132 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Circuit breaker of the distant hosts (lists server, Radarr): after
+breaker_failures failed requests in a row, a host is considered unreachable
+and its requests fail right away for breaker_cooldown seconds, instead of
+each one waiting for its timeout. The state of the hosts is saved in the
+addon profile folder so it is shared by the plugin invocations and the service.
+"""
+
+import os
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+
+import xbmc
+
+from resources.lib.settings import get_setting_int
+from resources.lib.library import ADDON_USER_DATA_FOLDER, get_tmp_file
+
+# File holding the state of the hosts
+HOSTS_FILE = os.path.join(ADDON_USER_DATA_FOLDER, 'hosts.json')
+
+class HostUnavailable(OSError):
+    """
+    Raised instead of requesting a host considered unreachable,
+    an OSError like the requests errors so it is handled the same way.
+    """
+
+_lock = threading.Lock()
+_hosts = None
+_hosts_mtime = None
+
+def get_host(url):
+    return urlsplit(url).netloc
+
+def load_hosts():
+    """
+    Load the state of the hosts: {host: {"failures": count, "open_until": time}}.
+    It is read again when another process changed it. To be called with the lock held.
+    """
+    global _hosts, _hosts_mtime
+    try:
+        mtime = os.stat(HOSTS_FILE).st_mtime
+    except OSError:
+        mtime = None
+    if _hosts is None or mtime != _hosts_mtime:
+        try:
+            with open(HOSTS_FILE, 'r', encoding='utf-8') as f:
+                _hosts = json.load(f)
+        except (OSError, ValueError):
+            _hosts = {}
+        _hosts_mtime = mtime
+    return _hosts
+
+def save_hosts():
+    """
+    Save the state of the hosts. To be called with the lock held.
+    """
+    global _hosts_mtime
+    try:
+        os.makedirs(ADDON_USER_DATA_FOLDER, exist_ok=True)
+        tmp_file = get_tmp_file(HOSTS_FILE)
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(_hosts, f)
+        os.replace(tmp_file, HOSTS_FILE)
+        _hosts_mtime = os.stat(HOSTS_FILE).st_mtime
+    except OSError as e:
+        xbmc.log(f"Error saving the hosts state: {e}", level=xbmc.LOGWARNING)
+
+def check_host(url):
+    """
+    Raise HostUnavailable if the host of url is considered unreachable.
+    Once the cool-down is over, the next request is tried again.
+    """
+    host = get_host(url)
+    with _lock:
+        state = load_hosts().get(host)
+    if state is not None and state["open_until"] > time.time():
+        raise HostUnavailable(f"{host} is unreachable, retrying in {int(state['open_until'] - time.time())} s")
+
+def record_success(url):
+    host = get_host(url)
+    with _lock:
+        state = load_hosts().pop(host, None)
+        if state is not None:
+            if state["open_until"]:
+                xbmc.log(f"{host} is reachable again", level=xbmc.LOGINFO)
+            save_hosts()
+
+def record_failure(url):
+    host = get_host(url)
+    with _lock:
+        state = load_hosts().setdefault(host, {"failures": 0, "open_until": 0})
+        state["failures"] += 1
+        if state["failures"] >= max(1, get_setting_int('breaker_failures')):
+            state["open_until"] = time.time() + get_setting_int('breaker_cooldown')
+            xbmc.log(f"{host} is unreachable, its requests fail right away for {get_setting_int('breaker_cooldown')} s",
+                     level=xbmc.LOGWARNING)
+        save_hosts()
+
+def guarded_request(send, url, **kwargs):
+    """
+    Send a request with send(url, **kwargs) (requests.get, session.post...) unless the host
+    is considered unreachable. Errors and server errors count as failures of the host.
+    Raises HostUnavailable or the requests errors, which are OSError.
+    """
+    check_host(url)
+    try:
+        response = send(url, **kwargs)
+    except OSError:
+        record_failure(url)
+        raise
+    if response.status_code >= 500:
+        record_failure(url)
+    elif not getattr(response, 'from_cache', False): # a cached response doesn't tell anything about the host
+        record_success(url)
+    return response
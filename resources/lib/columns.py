@@ -0,0 +1,175 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Column oriented view of a movie list, used to filter and sort it: the values
+the filters need are packed in one array per field (year, genres bitmask,
+library id, watched flag, runtime, lists count and best rank of the merged
+lists), built in the pass matching the list with
+the library. Each criterion is then a scan of one array over the selected
+positions, without touching the movies dicts.
+"""
+
+from array import array
+
+from resources.lib.library import find_movie
+
+# Sort orders of the filtered lists, a leading "-" sorts in descending order
+SORT_KEYS = ('year', '-year', 'runtime', '-runtime', '-lists', 'rank')
+
+# Rank of the movies without rank, sorted after the ranked ones
+UNRANKED = 2 ** 32 - 1
+
+def build_columns(movies, library_index):
+    """
+    Build the columns of a movie list, matching its movies with the library.
+    Returns {"size", "year", "genres", "genre_bits", "movieid", "watched", "runtime", "lists", "rank", "source"}:
+    the genres bitmask uses genre_bits {genre id: bit}, movieid is 0 for a movie not in the library,
+    runtime is 0 when it is unknown and source is how the movie was found in the library.
+    lists and rank are the number of lists containing the movie and its best rank for the merged
+    lists (most recommended, flattened folders), 1 and its rank in the list otherwise.
+    """
+
+    size = len(movies)
+    years = array('H', bytes(2 * size))
+    genres = array('Q', bytes(8 * size))
+    movieids = array('l', bytes(array('l').itemsize * size))
+    watched = array('B', bytes(size))
+    runtimes = array('L', bytes(array('L').itemsize * size))
+    lists = array('H', bytes(2 * size))
+    ranks = array('L', bytes(array('L').itemsize * size))
+    sources = [None] * size
+    genre_bits = {}
+
+    library_watched = library_index["watched"]
+    library_runtimes = library_index.get("runtimes", {})
+
+    for position, movie in enumerate(movies):
+        release_date = movie.get('release_date') or ''
+        if release_date[:4].isdigit():
+            years[position] = int(release_date[:4])
+
+        mask = 0
+        for genre_id in movie.get('genre_ids', ()):
+            bit = genre_bits.get(genre_id)
+            if bit is None:
+                if len(genre_bits) == 64:
+                    continue # the bitmask is full, the other genres can't be filtered
+                bit = genre_bits[genre_id] = len(genre_bits)
+            mask |= 1 << bit
+        genres[position] = mask
+
+        lists[position] = min(movie.get('lists', 1), 65535)
+        rank = movie['best_rank'] if 'best_rank' in movie else movie.get('rank')
+        ranks[position] = rank if rank is not None else UNRANKED
+
+        movieid, sources[position] = find_movie(library_index, movie)
+        if movieid is not None:
+            movieids[position] = int(movieid)
+            watched[position] = movieid in library_watched
+            runtimes[position] = library_runtimes.get(str(movieid), 0)
+
+    return {
+        "size": size,
+        "year": years,
+        "genres": genres,
+        "genre_bits": genre_bits,
+        "movieid": movieids,
+        "watched": watched,
+        "runtime": runtimes,
+        "lists": lists,
+        "rank": ranks,
+        "source": sources
+    }
+
+def parse_filters(params):
+    """
+    Get the filters of a list from the route parameters:
+    genres (comma separated genre ids), year_min, year_max, unwatched (1) and max_runtime (minutes).
+    Returns a dict with the given filters only, invalid values are ignored.
+    """
+
+    filters = {}
+    if params.get('genres'):
+        genre_ids = [int(genre_id) for genre_id in params['genres'].split(',') if genre_id.strip().isdigit()]
+        if genre_ids:
+            filters['genres'] = genre_ids
+    for name in ('year_min', 'year_max', 'max_runtime'):
+        if params.get(name, '').isdigit():
+            filters[name] = int(params[name])
+    if params.get('unwatched') == '1':
+        filters['unwatched'] = True
+    if params.get('sort') in SORT_KEYS:
+        filters['sort'] = params['sort']
+    return filters
+
+def get_filters_params(filters):
+    """
+    Get the route parameters of filters, the reverse of parse_filters.
+    """
+
+    params = {}
+    for name, value in filters.items():
+        if name == 'genres':
+            params[name] = ','.join(str(genre_id) for genre_id in value)
+        elif name == 'unwatched':
+            params[name] = '1'
+        else:
+            params[name] = str(value)
+    return params
+
+def select(columns, filters, in_library=False):
+    """
+    Get the positions of the movies matching all the filters, in the list order
+    or in the sort order of the filters.
+    A movie whose year or runtime is unknown doesn't match a year or runtime filter,
+    only the runtimes of the library movies are known.
+    """
+
+    positions = range(columns["size"])
+
+    if in_library:
+        movieids = columns["movieid"]
+        positions = [i for i in positions if movieids[i]]
+
+    if 'genres' in filters:
+        bits = columns["genre_bits"]
+        mask = 0
+        for genre_id in filters['genres']:
+            if genre_id in bits:
+                mask |= 1 << bits[genre_id]
+        genres = columns["genres"]
+        positions = [i for i in positions if genres[i] & mask]
+
+    if 'year_min' in filters or 'year_max' in filters:
+        year_min = filters.get('year_min', 1)
+        year_max = filters.get('year_max', 65535)
+        years = columns["year"]
+        positions = [i for i in positions if year_min <= years[i] <= year_max]
+
+    if filters.get('unwatched'):
+        watched = columns["watched"]
+        positions = [i for i in positions if not watched[i]]
+
+    if 'max_runtime' in filters:
+        max_runtime = filters['max_runtime'] * 60
+        runtimes = columns["runtime"]
+        positions = [i for i in positions if 0 < runtimes[i] <= max_runtime]
+
+    if 'sort' in filters:
+        key = columns[filters['sort'].lstrip('-')]
+        positions = sorted(positions, key=key.__getitem__, reverse=filters['sort'].startswith('-'))
+
+    return list(positions)
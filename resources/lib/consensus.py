@@ -0,0 +1,167 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The "most recommended" movies: a list computed from the lists index, ranking
+the movies by the number of lists containing them, weighted by their rank in
+the ranked lists. It is computed with one query over the whole index and
+kept in the index until a list changes.
+"""
+
+import json
+
+from resources.lib.settings import get_setting_int
+from resources.lib.lists_index import open_lists_index, get_generation
+from resources.lib.library import find_movie
+
+# Virtual folder of the most recommended lists, shown in the master list
+CONSENSUS_FOLDER_ID = 'most_recommended'
+
+# Virtual movie lists: {list_id: (title, filter)}
+CONSENSUS_LISTS = {
+    'most_recommended_all': ('All movies', None),
+    'most_recommended_library': ('In my library', 'library'),
+    'most_recommended_unwatched': ('Unwatched in my library', 'unwatched')
+}
+
+# Score of a movie for one of the lists containing it, between 1 and 2:
+# more for a better rank in a ranked list, 1.5 in an unranked list
+CONSENSUS_SCORE = ("CASE WHEN lists.ordered_by = 'rank' AND lists.size > 0 "
+                   "THEN 2.0 - (entries.rank - 1.0) / lists.size ELSE 1.5 END")
+
+def get_consensus_folder():
+    """
+    Get the virtual folder list of the most recommended lists.
+    """
+
+    return {
+        "type": "folder_list",
+        "title": "Most recommended",
+        "folders": [{"title": title, "id": list_id, "type": "movie_list"}
+                    for list_id, (title, library_filter) in CONSENSUS_LISTS.items()]
+    }
+
+def is_consensus_list(list_id):
+    return list_id in CONSENSUS_LISTS
+
+def compute_consensus(conn, min_lists):
+    """
+    Rank the movies of the lists index in one query, by the sum of their CONSENSUS_SCORE.
+    Returns all the movies contained in at least min_lists lists, best first,
+    as [(tmdb, lists count, best rank in the ranked lists or None)].
+    """
+
+    return conn.execute(f"""
+        SELECT entries.tmdb, COUNT(DISTINCT entries.list_id) AS nblists,
+               MIN(CASE WHEN lists.ordered_by = 'rank' THEN entries.rank END)
+        FROM entries JOIN lists ON lists.list_id = entries.list_id
+        GROUP BY entries.tmdb
+        HAVING nblists >= ?
+        ORDER BY SUM({CONSENSUS_SCORE}) DESC, nblists DESC, entries.tmdb""", (min_lists,)).fetchall()
+
+def get_consensus_movies(conn):
+    """
+    Get the most recommended movies, computed again only when the lists index
+    or the settings changed. The whole ranking is kept in the consensus table,
+    the library filters pick their movies from it.
+    Returns (signature, [movie]), the consensus_size best movies having the fields
+    of the movie lists, the number of lists containing them and their best rank, as the flat lists.
+    """
+
+    min_lists = max(1, get_setting_int('consensus_min_lists'))
+    size = max(1, get_setting_int('consensus_size'))
+
+    conn.execute("CREATE TABLE IF NOT EXISTS consensus (position INTEGER PRIMARY KEY, tmdb INTEGER, lists INTEGER, best_rank INTEGER)")
+    signature = f"consensus:{get_generation(conn)}:{min_lists}:{size}"
+    row = conn.execute("SELECT value FROM meta WHERE key = 'consensus'").fetchone()
+    if row is not None:
+        cached = json.loads(row[0])
+        if cached["signature"] == signature:
+            return signature, cached["movies"]
+
+    ranking = compute_consensus(conn, min_lists)
+    with conn:
+        conn.execute("DELETE FROM consensus")
+        conn.executemany("INSERT INTO consensus VALUES (?, ?, ?, ?)",
+                         ((position, *movie) for position, movie in enumerate(ranking)))
+        movies = read_consensus_movies(conn, size)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('consensus', ?)",
+                     (json.dumps({"signature": signature, "movies": movies}),))
+
+    return signature, movies
+
+def read_consensus_movies(conn, size, library_index=None, library_filter=None):
+    """
+    Read the size best movies of the consensus table, keeping only the ones
+    passing the library filter if any.
+    """
+
+    # without library movies lacking a tmdb id, the others are skipped before decoding them
+    fallback = library_index is not None and (library_index["imdb"] or library_index["titles"])
+    movies = []
+    for tmdb, nblists, best_rank, data in conn.execute("""
+            SELECT consensus.tmdb, consensus.lists, consensus.best_rank, movies.data
+            FROM consensus JOIN movies ON movies.tmdb = consensus.tmdb
+            ORDER BY consensus.position"""):
+        if library_filter is not None and not fallback and str(tmdb) not in library_index["tmdb"]:
+            continue
+        movie = json.loads(data)
+        if library_filter is not None:
+            movieid = find_movie(library_index, movie)[0]
+            if movieid is None:
+                continue
+            if library_filter == 'unwatched' and movieid in library_index["watched"]:
+                continue
+        movie["lists"] = nblists
+        movie["best_rank"] = best_rank
+        movies.append(movie)
+        if len(movies) >= size:
+            break
+    return movies
+
+def get_consensus_signature(list_id):
+    """
+    Get the signature of a most recommended list, the library filters depend on
+    the library version which is part of the directory cache key.
+    """
+
+    conn = open_lists_index()
+    try:
+        return f"{get_consensus_movies(conn)[0]}:{CONSENSUS_LISTS[list_id][1]}"
+    finally:
+        conn.close()
+
+def get_consensus_list(list_id, library_index):
+    """
+    Get a most recommended list as a movie list, filtered with the library index.
+    The library filters apply to the whole ranking, the list keeps consensus_size movies.
+    """
+
+    title, library_filter = CONSENSUS_LISTS[list_id]
+
+    conn = open_lists_index()
+    try:
+        movies = get_consensus_movies(conn)[1]
+        if library_filter is not None:
+            movies = read_consensus_movies(conn, max(1, get_setting_int('consensus_size')), library_index, library_filter)
+    finally:
+        conn.close()
+
+    return {
+        "type": "movie_list",
+        "title": f"Most recommended - {title}",
+        "ordered_by": "rank",
+        "movies": movies
+    }
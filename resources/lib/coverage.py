@@ -0,0 +1,160 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Library coverage of the lists: how many movies of a list (or of all the lists
+below a folder) are in the library, and how many of them were watched.
+
+The counts are stored in the lists index database with the versions of the
+library index and of the lists index they were computed for. They are computed
+again only when one of them changes, and the service updates them movie by
+movie when the library changes.
+"""
+
+import json
+from collections import defaultdict
+
+from resources.lib.lists_index import open_lists_index, get_generation
+from resources.lib.library import find_movie
+
+def get_owned_and_watched(conn, library_index):
+    """
+    Get the tmdb ids of the library movies and of the watched ones, as sets of integers.
+    The library movies without tmdb id are found among the movies of the lists by imdb id or title.
+    """
+
+    owned = set()
+    watched = set()
+    for tmdbid, movieid in library_index["tmdb"].items():
+        if not str(tmdbid).isdigit():
+            continue
+        owned.add(int(tmdbid))
+        if movieid in library_index["watched"]:
+            watched.add(int(tmdbid))
+
+    if library_index.get("imdb") or library_index.get("titles"):
+        for tmdbid, data in conn.execute("SELECT tmdb, data FROM movies"):
+            if tmdbid in owned:
+                continue
+            movieid = find_movie(library_index, json.loads(data))[0]
+            if movieid is not None:
+                owned.add(tmdbid)
+                if movieid in library_index["watched"]:
+                    watched.add(tmdbid)
+    return owned, watched
+
+def get_parents(conn):
+    """
+    Get the parents of each lists tree node as {(type, id): [parent folder ids]}.
+    """
+
+    parents = defaultdict(list)
+    for parent_id, child_type, child_id in conn.execute("SELECT parent_id, child_type, child_id FROM tree"):
+        parents[(child_type, child_id)].append(parent_id)
+    return parents
+
+def get_ancestors(parents, node):
+    """
+    Get all the folders above a lists tree node, as ('folder_list', id) nodes.
+    """
+
+    ancestors = set()
+    pending = [node]
+    while pending:
+        for parent_id in parents.get(pending.pop(), []):
+            parent = ('folder_list', parent_id)
+            if parent not in ancestors:
+                ancestors.add(parent)
+                pending.append(parent)
+    return ancestors
+
+def compute_coverage(conn, owned, watched):
+    """
+    Compute the coverage of every movie list and folder list of the lists index.
+    A movie in several lists below a folder is only counted once for the folder.
+    Returns {(type, id): (total, owned, watched)}.
+    """
+
+    movies = defaultdict(set)
+    for tmdbid, list_id in conn.execute("SELECT tmdb, list_id FROM entries"):
+        movies[('movie_list', list_id)].add(tmdbid)
+
+    # add the movies of each list to all the folders above it
+    parents = get_parents(conn)
+    for node in list(movies):
+        for ancestor in get_ancestors(parents, node):
+            movies[ancestor] |= movies[node]
+
+    return {node: (len(tmdbids), len(tmdbids & owned), len(tmdbids & watched)) for node, tmdbids in movies.items()}
+
+def get_coverage(library_index):
+    """
+    Get the coverage of the lists for the given library index, computing it if it is outdated.
+    Returns {(type, id): (total, owned, watched)}, or None if the lists index wasn't built yet.
+    """
+
+    conn = open_lists_index()
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS coverage (type TEXT, id TEXT, total INTEGER, owned INTEGER, watched INTEGER, PRIMARY KEY (type, id))")
+
+        if conn.execute("SELECT COUNT(*) FROM lists").fetchone()[0] == 0:
+            return None
+
+        stamp = f"{library_index['version']}:{get_generation(conn)}"
+        row = conn.execute("SELECT value FROM meta WHERE key = 'coverage'").fetchone()
+        if row is not None and row[0] == stamp:
+            return {(type, id): (total, owned, watched) for type, id, total, owned, watched in conn.execute("SELECT * FROM coverage")}
+
+        coverage = compute_coverage(conn, *get_owned_and_watched(conn, library_index))
+        with conn:
+            conn.execute("DELETE FROM coverage")
+            conn.executemany("INSERT INTO coverage VALUES (?, ?, ?, ?, ?)",
+                             ((type, id, total, owned, watched) for (type, id), (total, owned, watched) in coverage.items()))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('coverage', ?)", (stamp,))
+        return coverage
+    finally:
+        conn.close()
+
+def apply_coverage_deltas(deltas, old_version, new_version):
+    """
+    Update the stored coverage after some library changes, without computing it again.
+    deltas is a list of (tmdb id, owned change, watched change).
+    Nothing is done if the stored coverage wasn't up to date with old_version,
+    it will then be computed again when needed.
+    """
+
+    conn = open_lists_index()
+    try:
+        generation = get_generation(conn)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'coverage'").fetchone()
+        if row is None or row[0] != f"{old_version}:{generation}":
+            return
+
+        parents = get_parents(conn)
+        with conn:
+            for tmdbid, owned_change, watched_change in deltas:
+                if not str(tmdbid).isdigit():
+                    continue
+                # the lists containing the movie and all the folders above them, each counted once
+                nodes = set()
+                for (list_id,) in conn.execute("SELECT DISTINCT list_id FROM entries WHERE tmdb = ?", (int(tmdbid),)):
+                    node = ('movie_list', list_id)
+                    nodes.add(node)
+                    nodes |= get_ancestors(parents, node)
+                conn.executemany("UPDATE coverage SET owned = owned + ?, watched = watched + ? WHERE type = ? AND id = ?",
+                                 ((owned_change, watched_change, type, id) for type, id in nodes))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('coverage', ?)", (f"{new_version}:{generation}",))
+    finally:
+        conn.close()
@@ -0,0 +1,244 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Usage of the addon and the diagnostics page. Each plugin invocation appends
+one line to the usage log: its action, its latency and its use of the
+requests cache, so concurrent invocations never rewrite a shared file. The
+service folds the log into the usage totals, with the last latencies of each
+action, when it maintains the requests cache; without the service, the
+invocation making the log too big folds it.
+"""
+
+import os
+import json
+import time
+import datetime
+
+import xbmc
+
+from resources.lib.library import ADDON_USER_DATA_FOLDER, INDEX_FILE, get_tmp_file
+from resources.lib.http_cache import pop_cache_usage, record_accesses, get_cache_file_size, count_cached_responses
+from resources.lib.lists_index import LISTS_INDEX_FILE
+from resources.lib.directory_cache import DIRECTORY_CACHE_DIR
+
+USAGE_LOG = os.path.join(ADDON_USER_DATA_FOLDER, 'usage.log')
+USAGE_FILE = os.path.join(ADDON_USER_DATA_FOLDER, 'usage.json')
+
+# Size of the usage log folded by the invocation writing past it, when the service doesn't fold it
+USAGE_LOG_MAX_SIZE = 256 * 1024
+
+# Latencies kept for each action
+LATENCIES_KEPT = 20
+
+CACHE_COUNTERS = ("hits", "revalidations", "misses", "bytes_saved")
+
+def record_invocation(action, ms):
+    """
+    Append the latency of an invocation and its use of the requests cache to the usage log.
+    The log is folded right away when it gets over USAGE_LOG_MAX_SIZE.
+    """
+    usage, accessed = pop_cache_usage()
+    entry = {"time": round(time.time(), 3), "action": action, "ms": round(ms, 1)}
+    if usage is not None:
+        entry["cache"] = usage
+        entry["accessed"] = accessed
+    try:
+        with open(USAGE_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            size = f.tell()
+        # the service isn't running or is disabled, the log doesn't grow without limit
+        if size > USAGE_LOG_MAX_SIZE:
+            record_accesses(fold_usage())
+    except OSError as e:
+        xbmc.log(f"Error writing the usage log: {e}", level=xbmc.LOGDEBUG)
+
+def load_usage():
+    """
+    Load the usage totals: {"since", "cache": {counter: total}, "latencies": {action: [[time, ms]]},
+    "maintenance": {"time", "removed"}}.
+    """
+    try:
+        with open(USAGE_FILE, 'r', encoding='utf-8') as f:
+            usage = json.load(f)
+    except (OSError, ValueError):
+        usage = {}
+    usage.setdefault("since", time.time())
+    usage.setdefault("cache", {})
+    usage.setdefault("latencies", {})
+    usage.setdefault("maintenance", None)
+    for counter in CACHE_COUNTERS:
+        usage["cache"].setdefault(counter, 0)
+    return usage
+
+def add_entry(usage, entry):
+    """
+    Add an entry of the usage log to the usage totals.
+    """
+    for counter, value in entry.get("cache", {}).items():
+        usage["cache"][counter] = usage["cache"].get(counter, 0) + value
+    if entry.get("ms") is not None:
+        latencies = usage["latencies"].setdefault(entry["action"], [])
+        latencies.append([entry["time"], entry["ms"]])
+        del latencies[:-LATENCIES_KEPT]
+
+def read_log(log_file):
+    entries = []
+    try:
+        with open(log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    pass # a line cut by a crash
+    except OSError:
+        pass
+    return entries
+
+def save_usage(usage):
+    tmp_file = get_tmp_file(USAGE_FILE)
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(usage, f, separators=(',', ':'))
+    os.replace(tmp_file, USAGE_FILE)
+
+def fold_usage():
+    """
+    Fold the usage log, and the use of the requests cache by the calling process, into the
+    usage totals. Returns the last use of the cached responses: {cache key: time}.
+    """
+    # the invocations starting meanwhile write a new log
+    log_file = get_tmp_file(USAGE_LOG)
+    try:
+        os.replace(USAGE_LOG, log_file)
+    except OSError:
+        log_file = None
+    entries = read_log(log_file) if log_file is not None else []
+
+    own_usage, own_accessed = pop_cache_usage()
+    if own_usage is not None:
+        entries.append({"time": time.time(), "cache": own_usage, "accessed": own_accessed})
+
+    usage = load_usage()
+    accessed = {}
+    for entry in entries:
+        add_entry(usage, entry)
+        for key, access_time in entry.get("accessed", {}).items():
+            accessed[key] = max(access_time, accessed.get(key, 0))
+    save_usage(usage)
+
+    if log_file is not None:
+        os.remove(log_file)
+    return accessed
+
+def record_maintenance(removed):
+    """
+    Record a maintenance of the requests cache which removed some responses.
+    """
+    usage = load_usage()
+    usage["maintenance"] = {"time": time.time(), "removed": removed}
+    save_usage(usage)
+
+def get_folder_size(folder):
+    """
+    Get (number of files, total size) of a folder.
+    """
+    count = size = 0
+    try:
+        for entry in os.scandir(folder):
+            if entry.is_file():
+                count += 1
+                size += entry.stat().st_size
+    except OSError:
+        pass
+    return count, size
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+def format_age(timestamp):
+    age = time.time() - timestamp
+    if age < 3600:
+        return f"{age / 60:.0f} min ago"
+    if age < 48 * 3600:
+        return f"{age / 3600:.1f} h ago"
+    return f"{age / 86400:.0f} days ago"
+
+def get_diagnostics_text(max_cache_size):
+    """
+    Get the diagnostics page: the requests cache size and use, the tmdb index,
+    the other caches and the last latencies of each action.
+    """
+    import statistics
+
+    usage = load_usage()
+    # the invocations the service didn't fold yet
+    for entry in read_log(USAGE_LOG):
+        add_entry(usage, entry)
+    lines = []
+
+    cache = usage["cache"]
+    entries = count_cached_responses()
+    requests = cache["hits"] + cache["revalidations"] + cache["misses"]
+    lines.append("[B]Requests cache[/B]")
+    lines.append(f"File: {format_size(get_cache_file_size())} of {format_size(max_cache_size)}, "
+                 f"{'unreadable' if entries is None else entries} responses")
+    lines.append(f"Since {format_time(usage['since'])}: {requests} requests, {cache['hits']} hits, "
+                 f"{cache['revalidations']} revalidations, {cache['misses']} misses")
+    if requests:
+        lines.append(f"Hit rate: {cache['hits'] / requests:.0%}, "
+                     f"without download: {(cache['hits'] + cache['revalidations']) / requests:.0%}")
+    lines.append(f"Downloads saved: {format_size(cache['bytes_saved'])}")
+    maintenance = usage["maintenance"]
+    if maintenance is not None:
+        lines.append(f"Last maintenance: {format_time(maintenance['time'])}, {maintenance['removed']} responses removed")
+    else:
+        lines.append("Last maintenance: never")
+
+    lines.append("")
+    lines.append("[B]Library index[/B]")
+    try:
+        with open(INDEX_FILE, 'r', encoding='utf-8') as f:
+            library_index = json.load(f)
+        lines.append(f"Updated: {format_time(library_index['updated'])} ({format_age(library_index['updated'])})")
+        lines.append(f"{len(library_index['tmdb'])} movies, {len(library_index.get('watched', []))} watched, "
+                     f"{format_size(os.stat(INDEX_FILE).st_size)}")
+    except (OSError, ValueError, KeyError):
+        lines.append("Not built yet")
+
+    lines.append("")
+    lines.append("[B]Other caches[/B]")
+    try:
+        lines.append(f"Lists index: {format_size(os.stat(LISTS_INDEX_FILE).st_size)}")
+    except OSError:
+        lines.append("Lists index: not built yet")
+    count, size = get_folder_size(DIRECTORY_CACHE_DIR)
+    lines.append(f"Directory cache: {count} directories, {format_size(size)}")
+
+    lines.append("")
+    lines.append("[B]Latencies of the last invocations (ms)[/B]")
+    if not usage["latencies"]:
+        lines.append("No invocation recorded yet")
+    for action, latencies in sorted(usage["latencies"].items()):
+        values = [ms for timestamp, ms in latencies]
+        lines.append(f"{action}: last {values[-1]:.0f} ({format_age(latencies[-1][0])}), "
+                     f"median {statistics.median(values):.0f}, max {max(values):.0f} of {len(values)}")
+    return "\n".join(lines)
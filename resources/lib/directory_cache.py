@@ -0,0 +1,104 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cache of the rendered directories: the fully resolved items of a directory
+are saved under a key made of everything they depend on, so reopening the
+directory only has to add the items again.
+Each directory is a file of the cache folder, the least recently used ones
+are removed when there are too many.
+"""
+
+import os
+import json
+import hashlib
+
+import xbmc
+
+from resources.lib.library import ADDON_USER_DATA_FOLDER, get_tmp_file
+from resources.lib.timing import phase
+
+DIRECTORY_CACHE_DIR = os.path.join(ADDON_USER_DATA_FOLDER, 'directories')
+
+def content_signature(content):
+    """
+    Compute the signature of some JSON content.
+    """
+    return hashlib.sha1(json.dumps(content).encode('utf-8')).hexdigest()
+
+def get_cache_file(key):
+    return os.path.join(DIRECTORY_CACHE_DIR, content_signature(key) + '.json')
+
+def get_cached_directory(key):
+    """
+    Get the directory saved with the given key, or None if there is none.
+    key is a list of JSON values.
+    """
+    cache_file = get_cache_file(key)
+    try:
+        with phase('directory cache: read'), open(cache_file, 'r', encoding='utf-8') as f:
+            directory = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # the file time gives the last use, for the eviction
+    try:
+        os.utime(cache_file)
+    except OSError:
+        pass
+    return directory
+
+def save_directory(key, directory, max_entries):
+    """
+    Save a directory with the given key, then remove the least recently used
+    directories to keep at most max_entries of them.
+    """
+    with phase('directory cache: write'):
+        try:
+            os.makedirs(DIRECTORY_CACHE_DIR, exist_ok=True)
+            cache_file = get_cache_file(key)
+            tmp_file = get_tmp_file(cache_file)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(directory, f, separators=(',', ':'))
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            xbmc.log(f"Error saving a directory to the cache: {e}", level=xbmc.LOGWARNING)
+            return
+
+        entries = []
+        for entry in os.scandir(DIRECTORY_CACHE_DIR):
+            if entry.name.endswith('.json'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        entries.sort()
+        for mtime, path in entries[:max(0, len(entries) - max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def clear_directory_cache():
+    """
+    Remove all the saved directories.
+    """
+    if not os.path.isdir(DIRECTORY_CACHE_DIR):
+        return
+    for entry in os.scandir(DIRECTORY_CACHE_DIR):
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
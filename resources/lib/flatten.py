@@ -0,0 +1,209 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Flattened folders: all the movies of the lists below a folder list, as one
+movie list. The folder lists of the subtree are read level by level and its
+movie lists all at once, concurrently, then the movies are merged by tmdb id,
+keeping the lists they come from and their best rank. The merged list is saved
+in the addon profile folder with the signatures of the lists it was built
+from, so the subtree is only read again when one of its lists changed.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+import xbmc
+
+from resources.lib.settings import get_setting_int
+from resources.lib.library import ADDON_USER_DATA_FOLDER, get_tmp_file
+from resources.lib.lists import get_list, get_list_signature
+from resources.lib.lists_index import read_folder_list
+from resources.lib.timing import phase
+
+# Virtual movie list of all the movies below a folder: FLAT_LIST_PREFIX + folder id
+FLAT_LIST_PREFIX = 'flat:'
+
+# Folder of the saved flattened lists
+FLAT_DIR = os.path.join(ADDON_USER_DATA_FOLDER, 'flat')
+
+# Subtrees walked by this invocation: {folder id: (title, [movie list id])}
+_subtrees = {}
+
+def get_flat_list_id(folder_id):
+    return FLAT_LIST_PREFIX + folder_id
+
+def is_flat_list(list_id):
+    return list_id.startswith(FLAT_LIST_PREFIX)
+
+def get_flat_file(folder_id):
+    return os.path.join(FLAT_DIR, hashlib.sha1(folder_id.encode('utf-8')).hexdigest() + '.json')
+
+def walk_subtree(folder_id):
+    """
+    Walk the folder lists below a folder, level by level, reading each level concurrently.
+    Returns (title of the folder, [ids of the movie lists below it, in the tree order]),
+    or None if the folder can't be read.
+    """
+    if folder_id in _subtrees:
+        return _subtrees[folder_id]
+
+    # {folder id: [(child type, child id)]}
+    children = {}
+    seen = {folder_id}
+    workers = max(1, get_setting_int('prefetch_workers'))
+    from concurrent.futures import ThreadPoolExecutor
+    with phase('flatten: folders'), ThreadPoolExecutor(max_workers=workers) as executor:
+        level = [folder_id]
+        while level:
+            next_level = []
+            for level_id, folder_list in zip(level, executor.map(read_folder_list, level)):
+                if folder_list is None:
+                    continue
+                children[level_id] = [(folder['type'], folder['id']) for folder in folder_list.get('folders', [])]
+                if level_id == folder_id:
+                    title = folder_list.get('title', folder_id)
+                for child_type, child_id in children[level_id]:
+                    if child_type == 'folder_list' and child_id not in seen:
+                        seen.add(child_id)
+                        next_level.append(child_id)
+            level = next_level
+
+    if folder_id not in children:
+        return None
+
+    # the movie lists in the order they are shown when browsing the folder, without duplicates
+    list_ids = []
+    pending = [folder_id]
+    visited = set()
+    while pending:
+        current = pending.pop()
+        if current in visited:
+            continue
+        visited.add(current)
+        subfolders = []
+        for child_type, child_id in children.get(current, []):
+            if child_type == 'movie_list':
+                if child_id not in list_ids:
+                    list_ids.append(child_id)
+            else:
+                subfolders.append(child_id)
+        pending.extend(reversed(subfolders))
+
+    _subtrees[folder_id] = (title, list_ids)
+    return _subtrees[folder_id]
+
+def get_subtree_signature(list_ids):
+    """
+    Get the signature of the movie lists of a subtree, None if one of them has to be read to know it.
+    """
+    signatures = [get_list_signature('movie_list', list_id) for list_id in list_ids]
+    if None in signatures:
+        return None
+    return hashlib.sha1(json.dumps([list_ids, signatures]).encode('utf-8')).hexdigest()
+
+def get_flat_signature(folder_id):
+    """
+    Get the signature of a flattened folder without reading its movie lists,
+    or None if they have to be read.
+    """
+    subtree = walk_subtree(folder_id)
+    if subtree is None:
+        return None
+    signature = get_subtree_signature(subtree[1])
+    return f"flat:{signature}" if signature is not None else None
+
+def read_movie_list(list_id):
+    """
+    Read a movie list of the subtree, returns None if it can't be read.
+    """
+    try:
+        return get_list('movie_list', list_id)
+    except (OSError, ValueError): # requests errors are OSError
+        xbmc.log(f"Flatten: can't read {list_id}", level=xbmc.LOGWARNING)
+        return None
+
+def merge_lists(movie_lists):
+    """
+    Merge movie lists, each movie once. A movie gets the number of lists containing it
+    ("lists"), their titles ("list_titles") and its best rank in the ranked ones ("best_rank").
+    The movies in the most lists come first, then the best ranked ones, then the tree order.
+    """
+    movies = {}
+    for movie_list in movie_lists:
+        ranked = movie_list.get('ordered_by') == 'rank'
+        for index, movie in enumerate(movie_list['movies']):
+            merged = movies.get(movie['id'])
+            if merged is None:
+                merged = movies[movie['id']] = dict(movie, lists=0, list_titles=[], best_rank=None)
+                merged.pop('rank', None)
+            merged['lists'] += 1
+            merged['list_titles'].append(movie_list['title'])
+            rank = movie.get('rank', index + 1) if ranked else None
+            if rank is not None and (merged['best_rank'] is None or rank < merged['best_rank']):
+                merged['best_rank'] = rank
+    return sorted(movies.values(), key=lambda movie: (-movie['lists'], movie['best_rank'] or float('inf')))
+
+def get_flat_list(folder_id):
+    """
+    Get all the movies below a folder as a movie list, or None if the folder can't be read.
+    The saved list is used while the lists of the subtree are unchanged, or for movie_list_ttl
+    hours when the lists are distant and not synchronized, like the requests cache.
+    """
+    subtree = walk_subtree(folder_id)
+    if subtree is None:
+        return None
+    title, list_ids = subtree
+    signature = get_subtree_signature(list_ids)
+
+    flat_file = get_flat_file(folder_id)
+    try:
+        with phase('flatten: read saved'), open(flat_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = None
+    if saved is not None and saved["list_ids"] == list_ids:
+        if signature is not None and saved["signature"] == signature:
+            return saved["list"]
+        if signature is None and time.time() - saved["created"] < get_setting_int('movie_list_ttl') * 3600:
+            return saved["list"]
+
+    workers = max(1, get_setting_int('prefetch_workers'))
+    from concurrent.futures import ThreadPoolExecutor
+    with phase('flatten: lists'), ThreadPoolExecutor(max_workers=workers) as executor:
+        movie_lists = [movie_list for movie_list in executor.map(read_movie_list, list_ids) if movie_list is not None]
+    with phase('flatten: merge'):
+        movie_list = {
+            "type": "movie_list",
+            "title": f"{title} - All movies",
+            "ordered_by": "",
+            "movies": merge_lists(movie_lists)
+        }
+
+    # a list that couldn't be read is read again next time
+    if len(movie_lists) == len(list_ids):
+        try:
+            os.makedirs(FLAT_DIR, exist_ok=True)
+            tmp_file = get_tmp_file(flat_file)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"signature": signature, "created": time.time(), "list_ids": list_ids, "list": movie_list},
+                          f, separators=(',', ':'))
+            os.replace(tmp_file, flat_file)
+        except OSError as e:
+            xbmc.log(f"Error saving the flattened {folder_id}: {e}", level=xbmc.LOGWARNING)
+
+    return movie_list
@@ -0,0 +1,197 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Usage and size of the requests cache of the distant lists. Each invocation
+counts the responses of the cache it used (hits, revalidations, misses and
+the bytes it didn't download) in memory; they are written with the usage of
+the invocation. requests-cache has no size limit, so the service trims the
+cache database: the expired responses not used for a while are removed, then
+the least recently used ones while the cache is over its size, and the file
+is vacuumed to give the space back.
+"""
+
+import os
+import time
+import threading
+
+import xbmc
+
+from resources.lib.library import ADDON_USER_DATA_FOLDER
+
+CACHE_FILE = os.path.join(ADDON_USER_DATA_FOLDER, 'requests_cache')
+# requests-cache adds the extension to the name of the sqlite cache
+CACHE_DB_FILE = CACHE_FILE + '.sqlite'
+
+# Expired responses unused for this long are removed, seconds
+EXPIRED_KEPT = 7 * 24 * 3600
+
+# Last use of the cached responses, kept in the cache database for the eviction
+ACCESS_TABLE = 'jlom_access'
+
+# Usage of the cache by this invocation, see record_response
+_usage_lock = threading.Lock()
+_usage = {"hits": 0, "revalidations": 0, "misses": 0, "bytes_saved": 0}
+# {cache key: time of use}
+_accessed = {}
+
+def record_response(response):
+    """
+    Count a response of the cached session: a hit when the cache answered alone,
+    a revalidation when the server confirmed the cached response, a miss otherwise.
+    """
+    from_cache = getattr(response, 'from_cache', False)
+    cache_key = getattr(response, 'cache_key', None)
+    with _usage_lock:
+        if from_cache:
+            _usage["revalidations" if getattr(response, 'revalidated', False) else "hits"] += 1
+            _usage["bytes_saved"] += len(response.content)
+        else:
+            _usage["misses"] += 1
+        if cache_key:
+            _accessed[cache_key] = time.time()
+
+def pop_cache_usage():
+    """
+    Get the usage of the cache since the last call and start over.
+    Returns ({"hits", "revalidations", "misses", "bytes_saved"}, {cache key: time of use}),
+    or (None, None) if the cache wasn't used.
+    """
+    with _usage_lock:
+        if not _accessed and not _usage["misses"]:
+            return None, None
+        usage = dict(_usage)
+        accessed = dict(_accessed)
+        for name in _usage:
+            _usage[name] = 0
+        _accessed.clear()
+    return usage, accessed
+
+def get_cached_response(url):
+    """
+    Get the cached response of a GET request whatever its age, without sending any request,
+    not even the revalidation of an expired response. Returns None if it isn't cached.
+    """
+    import requests
+    import requests_cache
+    try:
+        cache = requests_cache.get_cache()
+        if cache is None:
+            return None
+        return cache.get_response(cache.create_key(requests.Request('GET', url).prepare()))
+    except AttributeError: # requests-cache < 1.0
+        return None
+
+def get_cache_file_size():
+    try:
+        return os.stat(CACHE_DB_FILE).st_size
+    except OSError:
+        return 0
+
+def open_cache_db():
+    import sqlite3
+    # the plugin invocations write to the cache meanwhile, wait for them
+    return sqlite3.connect(CACHE_DB_FILE, timeout=30)
+
+def count_cached_responses():
+    """
+    Get the number of responses in the cache, None if the cache can't be read.
+    """
+    if not os.path.exists(CACHE_DB_FILE):
+        return 0
+    import sqlite3
+    try:
+        conn = open_cache_db()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+def save_accesses(conn, accessed):
+    """
+    Save the last uses of the cached responses, {cache key: time}, for the eviction.
+    """
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {ACCESS_TABLE} (key TEXT PRIMARY KEY, accessed REAL)")
+    if accessed:
+        conn.executemany(f"INSERT OR REPLACE INTO {ACCESS_TABLE} VALUES (?, ?)", accessed.items())
+
+def record_accesses(accessed):
+    """
+    Save the last uses of the cached responses without trimming the cache.
+    """
+    if not accessed or not os.path.exists(CACHE_DB_FILE):
+        return
+    import sqlite3
+    try:
+        conn = open_cache_db()
+        try:
+            with conn:
+                save_accesses(conn, accessed)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        xbmc.log(f"Error saving the uses of the requests cache: {e}", level=xbmc.LOGWARNING)
+
+def trim_requests_cache(max_size, accessed=None):
+    """
+    Record the last uses of the cached responses ({cache key: time}), then remove the expired
+    responses unused for EXPIRED_KEPT and the least recently used ones while the cache
+    takes more than max_size bytes. The file is vacuumed when it has much free space.
+    Returns the number of responses removed.
+    """
+    if not os.path.exists(CACHE_DB_FILE):
+        return 0
+
+    import sqlite3
+    conn = open_cache_db()
+    try:
+        with conn:
+            save_accesses(conn, accessed)
+
+            # the responses never used since they are recorded are the oldest, by expiration
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(responses)")]
+            expires = 'responses.expires' if 'expires' in columns else 'NULL' # requests-cache < 1.0
+            responses = conn.execute(f"""
+                SELECT responses.key, length(responses.value), {expires}, {ACCESS_TABLE}.accessed
+                FROM responses LEFT JOIN {ACCESS_TABLE} ON {ACCESS_TABLE}.key = responses.key
+                ORDER BY COALESCE({ACCESS_TABLE}.accessed, 0), {expires}""").fetchall()
+
+            now = time.time()
+            removed = []
+            total = sum(size or 0 for key, size, expires, last_use in responses)
+            for key, size, expires, last_use in responses:
+                unused = last_use is None or last_use < now - EXPIRED_KEPT
+                if total > max_size or (unused and expires is not None and expires < now - EXPIRED_KEPT):
+                    removed.append((key,))
+                    total -= size or 0
+
+            conn.executemany("DELETE FROM responses WHERE key = ?", removed)
+            conn.execute(f"DELETE FROM {ACCESS_TABLE} WHERE key NOT IN (SELECT key FROM responses)")
+            if 'redirects' in [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]:
+                conn.execute("DELETE FROM redirects WHERE value NOT IN (SELECT key FROM responses)")
+
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if freelist_count > page_count // 4:
+            try:
+                conn.execute("VACUUM")
+            except sqlite3.OperationalError as e: # a plugin invocation is using the cache
+                xbmc.log(f"Requests cache not vacuumed: {e}", level=xbmc.LOGDEBUG)
+    finally:
+        conn.close()
+
+    return len(removed)
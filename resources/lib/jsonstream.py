@@ -0,0 +1,170 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Streaming reader of the movie lists: the file is read by chunks and the
+movies are decoded one at a time, keeping only the fields the plugin uses,
+so neither the whole text nor the whole TMDB records are held in memory.
+This module doesn't depend on Kodi so it can be used by the tools.
+"""
+
+import re
+import json
+import codecs
+
+# Size of the chunks read from a file
+CHUNK_SIZE = 64 * 1024
+
+# Movie fields kept by the streaming reader, the ones used by the plugin
+MOVIE_FIELDS = (
+    "id",
+    "imdb_id",
+    "rank",
+    "title",
+    "original_title",
+    "release_date",
+    "genre_ids",
+    "overview",
+    "poster_path",
+    "backdrop_path"
+)
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Characters a number can continue with
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+class _ChunkReader:
+    """
+    Buffer over an iterator of text chunks, only the text not yet decoded is kept.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Read one more chunk, returns False at the end of the text.
+        """
+        if self.eof:
+            return False
+        # drop the decoded text
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        self.eof = True
+        return False
+
+    def peek(self):
+        """
+        Get the next character that isn't a whitespace, without consuming it.
+        Returns '' at the end of the text.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, characters):
+        """
+        Consume the next character that isn't a whitespace, it has to be one of characters.
+        """
+        character = self.peek()
+        if character == '' or character not in characters:
+            raise json.JSONDecodeError(f"Expecting one of {characters!r}", self.buffer, self.pos)
+        self.pos += 1
+        return character
+
+    def value(self):
+        """
+        Decode the next JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value may continue in the next chunk
+                if self.fill():
+                    continue
+                raise
+            # a number may continue in the next chunk too, even after the decoded part: "2." | "5e3"
+            if type(value) in (int, float) and _NUMBER_TAIL.match(self.buffer, end) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+def load_list(chunks, array_key="movies", fields=MOVIE_FIELDS):
+    """
+    Decode a JSON object from an iterator of text chunks.
+    The items of its array_key array are decoded one at a time, only their given fields are kept.
+    Raises ValueError if the text isn't a JSON object.
+    """
+
+    reader = _ChunkReader(chunks)
+    result = {}
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+        return result
+
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting a property name", reader.buffer, reader.pos)
+        reader.expect(':')
+
+        if key == array_key and reader.peek() == '[':
+            reader.pos += 1
+            items = []
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    item = reader.value()
+                    if isinstance(item, dict):
+                        # the keys are the strings of fields, shared by all the items
+                        item = {field: item[field] for field in fields if field in item}
+                    items.append(item)
+                    if reader.expect(',]') == ']':
+                        break
+            result[key] = items
+        else:
+            result[key] = reader.value()
+
+        if reader.expect(',}') == '}':
+            return result
+
+def file_chunks(f, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over the chunks of a text file.
+    """
+    return iter(lambda: f.read(chunk_size), '')
+
+def decode_chunks(byte_chunks, encoding='utf-8'):
+    """
+    Iterate over the text of chunks of bytes, a character may be split between two chunks.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in byte_chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
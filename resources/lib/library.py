@@ -0,0 +1,392 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Kodi library access shared by the plugin and the service:
+JSON-RPC queries and the tmdb to local dbid index.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+
+import xbmc
+import xbmcgui
+from xbmcvfs import translatePath, mkdir
+
+from resources.lib.settings import get_addon, get_setting_int
+from resources.lib.timing import phase
+
+# File holding the tmdb index, written by the service and read by the plugin
+ADDON_USER_DATA_FOLDER = translatePath(get_addon().getAddonInfo('profile'))
+INDEX_FILE = os.path.join(ADDON_USER_DATA_FOLDER, 'tmdb_index.json')
+
+# Movie properties requested from the library, the lean set skips the heavy
+# fields (cast, stream details, art...) that most skins don't show in lists
+MOVIE_DETAILS_PROPERTIES_LEAN = [
+    "title",
+    "genre",
+    "year",
+    "rating",
+    "director",
+    "tagline",
+    "plot",
+    "plotoutline",
+    "originaltitle",
+    "lastplayed",
+    "playcount",
+    "mpaa",
+    "imdbnumber",
+    "runtime",
+    "top250",
+    "votes",
+    "file",
+    "sorttitle",
+    "resume",
+    "setid",
+    "dateadded",
+    "userrating",
+    "premiered",
+    "uniqueid"
+]
+
+MOVIE_DETAILS_PROPERTIES_FULL = MOVIE_DETAILS_PROPERTIES_LEAN + [
+    "trailer",
+    "writer",
+    "studio",
+    "cast",
+    "country",
+    "set",
+    "showlink",
+    "streamdetails",
+    "fanart",
+    "thumbnail",
+    "tag",
+    "art",
+    "ratings"
+]
+
+def get_tmp_file(path):
+    """
+    Get the temporary file written before replacing path, unique to its writer:
+    concurrent plugin invocations and the service can save the same file at the same time.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def normalize_title(title):
+    """
+    Normalize a title to match the same movie with slightly different titles:
+    lower case, no accents, no punctuation and no leading article.
+    """
+    title = unicodedata.normalize('NFKD', title.replace('&', ' and '))
+    title = ''.join(c for c in title if not unicodedata.combining(c)).lower()
+    title = ' '.join(re.sub(r'[\W_]+', ' ', title).split())
+    for article in ('the ', 'a ', 'an '):
+        if title.startswith(article):
+            return title[len(article):]
+    return title
+
+def get_title_key(title, year):
+    """
+    Get the key of the title index for a title and a year, None if one of them is missing.
+    """
+    if not title or not year:
+        return None
+    title = normalize_title(title)
+    if not title:
+        return None
+    return f"{title}|{year}"
+
+def get_fallback_keys(movie):
+    """
+    Get the keys used to find a library movie without tmdb id: (imdb id, title keys).
+    """
+    uniqueid = movie.get("uniqueid") if isinstance(movie.get("uniqueid"), dict) else {}
+    imdbid = uniqueid.get("imdb") or movie.get("imdbnumber") or None
+    if imdbid is not None and not str(imdbid).startswith('tt'):
+        imdbid = None
+    title_keys = []
+    for title in (movie.get("title"), movie.get("originaltitle")):
+        key = get_title_key(title, movie.get("year"))
+        if key is not None and key not in title_keys:
+            title_keys.append(key)
+    return imdbid, title_keys
+
+# Properties of the library movies used by the index
+INDEX_PROPERTIES = ["uniqueid", "playcount", "imdbnumber", "title", "originaltitle", "year", "runtime"]
+
+def build_tmdbid_to_dbid_index(notify=True):
+    """
+    Get a mapping of TMDB IDs to local database IDs for all movies in the library.
+    Returns a dictionary where keys are TMDB IDs and values are local database IDs,
+    the list of the local database IDs of the watched movies,
+    the fallback keys of the movies without TMDB ID: {movieid: (imdb id, title keys)},
+    and the runtimes of the movies in seconds: {movieid: runtime}.
+    """
+
+    #Construct the JSON-RPC query
+    json_query = {
+        "jsonrpc": "2.0",
+        "method": "VideoLibrary.GetMovies",
+        "params": {
+            "properties": INDEX_PROPERTIES
+        },
+        "id": "libMovies"
+    }
+
+    # Notify user about index building
+    if notify:
+        xbmcgui.Dialog().notification('jlom', 'Building movies index...', xbmcgui.NOTIFICATION_INFO)
+
+    # Execute the JSON-RPC query
+    with phase('index: jsonrpc'):
+        response = xbmc.executeJSONRPC(json.dumps(json_query))
+
+    # Parse the response
+    with phase('index: parse'):
+        result = json.loads(response)
+
+    """Build a dict {tmdb: movieid}."""
+    index = {}
+    watched = []
+    fallback = {}
+    runtimes = {}
+    for movie in result.get("result", {}).get("movies", []):
+        movieid = movie.get("movieid")
+        if movieid is None:
+            continue
+        if movie.get("runtime"):
+            runtimes[movieid] = movie["runtime"]
+
+        if movie.get("playcount", 0) > 0:
+            watched.append(movieid)
+
+        uniqueid = movie.get("uniqueid")
+        tmdbid = uniqueid.get("tmdb") if isinstance(uniqueid, dict) else None
+        if tmdbid is None: # tmdb id is missing, the movie will be found by imdb id or title
+            fallback[movieid] = get_fallback_keys(movie)
+            continue
+
+        index[tmdbid] = movieid
+
+    if notify and fallback:
+        stats = get_match_stats(index, fallback)
+        lost = stats["none"]
+        message = f'{len(fallback)} movies don\'t have a tmdb id, {len(fallback) - lost} will be found by imdb id or title'
+        if lost:
+            message += f'\n{lost} won\'t be found in the lists!'
+        xbmcgui.Dialog().notification('jlom', message, xbmcgui.NOTIFICATION_WARNING, 10000)
+
+    return index, watched, fallback, runtimes
+
+def get_movie_index_entry(movieid):
+    """
+    Get the TMDB ID, the play count, the fallback keys and the runtime of a single library movie.
+    Returns (None, 0, None, 0) if the movie doesn't exist, the fallback keys are None
+    for a movie with a TMDB ID. A movie without TMDB ID still has its play count.
+    """
+
+    #Construct the JSON-RPC query
+    json_query = {
+        "jsonrpc": "2.0",
+        "method": "VideoLibrary.GetMovieDetails",
+        "params": {
+            "movieid": int(movieid),
+            "properties": INDEX_PROPERTIES
+        },
+        "id": "libMovie"
+    }
+
+    # Execute the JSON-RPC query
+    response = xbmc.executeJSONRPC(json.dumps(json_query))
+
+    # Parse the response
+    result = json.loads(response)
+    movie_details = result.get("result", {}).get("moviedetails")
+    if not movie_details:
+        return None, 0, None, 0
+    runtime = movie_details.get("runtime") or 0
+    uniqueid = movie_details.get("uniqueid")
+    if not isinstance(uniqueid, dict) or uniqueid.get("tmdb") is None:
+        return None, movie_details.get("playcount", 0), get_fallback_keys(movie_details), runtime
+    return uniqueid.get("tmdb"), movie_details.get("playcount", 0), None, runtime
+
+def get_match_stats(index, fallback):
+    """
+    Count the library movies by the way they are found in the lists:
+    tmdb id, imdb id, title and year, or not at all.
+    """
+    stats = {"tmdb": len(index), "imdb": 0, "title": 0, "none": 0}
+    for imdbid, title_keys in fallback.values():
+        if imdbid is not None:
+            stats["imdb"] += 1
+        elif title_keys:
+            stats["title"] += 1
+        else:
+            stats["none"] += 1
+    return stats
+
+def get_movies_details(ids):
+    """
+    Get the details of several library movies with a single JSON-RPC batch call.
+    Returns a dictionary where keys are local database IDs and values are the movie details.
+    """
+
+    if not ids:
+        return {}
+
+    # Choose the properties depending on the details level setting (0: lean, 1: full)
+    if get_setting_int('details_level') == 0:
+        properties = MOVIE_DETAILS_PROPERTIES_LEAN
+    else:
+        properties = MOVIE_DETAILS_PROPERTIES_FULL
+
+    #Construct the JSON-RPC batch query, one GetMovieDetails per movie
+    json_query = []
+    for id in ids:
+        json_query.append({
+            "jsonrpc": "2.0",
+            "method": "VideoLibrary.GetMovieDetails",
+            "params": {
+                "movieid": int(id),
+                "properties": properties
+            },
+            "id": int(id)
+        })
+
+    # Execute the JSON-RPC batch query
+    with phase('details: jsonrpc'):
+        response = xbmc.executeJSONRPC(json.dumps(json_query))
+
+    # Parse the response, a batch returns one response object per query
+    with phase('details: parse'):
+        result = json.loads(response)
+    if isinstance(result, dict): # a single error object is returned if the batch itself is rejected
+        xbmc.log(f"Error getting movies details: {result.get('error')}", level=xbmc.LOGERROR)
+        return {}
+
+    details = {}
+    for item in result:
+        movie_details = item.get("result", {}).get("moviedetails")
+        if movie_details is not None:
+            details[item.get("id")] = movie_details
+
+    return details
+
+def get_fallback_indexes(fallback):
+    """
+    Get the fallback indexes {imdb: movieid} and {title key: movieid} from the fallback keys
+    {movieid: (imdb, title keys)} of the movies without tmdb id.
+    """
+    imdb = {}
+    titles = {}
+    for movieid, (imdbid, title_keys) in fallback.items():
+        if imdbid is not None:
+            imdb.setdefault(imdbid, movieid)
+        for key in title_keys:
+            titles.setdefault(key, movieid)
+    return imdb, titles
+
+def save_tmdb_index(index, watched, fallback, runtimes):
+    """
+    Save the tmdb index, the watched movies, the fallback indexes and the runtimes to the addon profile folder.
+    The fallback indexes find the movies without tmdb id by imdb id or by title and year.
+    The file is replaced atomically so a plugin invocation never reads a partial index.
+    Returns the version of the saved index, it changes each time the index is saved.
+    """
+
+    mkdir(ADDON_USER_DATA_FOLDER) #make sure the folder exists
+
+    imdb, titles = get_fallback_indexes(fallback)
+
+    updated = time.time()
+    data = {
+        "version": repr(updated),
+        "updated": updated,
+        "tmdb": index,
+        "watched": sorted(watched),
+        "imdb": imdb,
+        "titles": titles,
+        "runtimes": runtimes,
+        "stats": get_match_stats(index, fallback)
+    }
+
+    tmp_file = get_tmp_file(INDEX_FILE)
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_file, INDEX_FILE)
+
+    return data["version"]
+
+def load_library_index():
+    """
+    Load the library index maintained by the service:
+    {"version": ..., "updated": ..., "tmdb": {tmdb: movieid}, "watched": set of movieids,
+     "imdb": {imdb: movieid}, "titles": {title key: movieid}, "runtimes": {"movieid": seconds},
+     "stats": {source: movies}}
+    If the service didn't write it yet, the index is built in the foreground and saved.
+    """
+
+    try:
+        with phase('index: load'), open(INDEX_FILE, 'r', encoding='utf-8') as f:
+            library_index = json.load(f)
+        library_index["tmdb"]
+        library_index["version"]
+    except (OSError, ValueError, KeyError):
+        xbmc.log("tmdb index not available, building it", level=xbmc.LOGINFO)
+        save_tmdb_index(*build_tmdbid_to_dbid_index())
+        with open(INDEX_FILE, 'r', encoding='utf-8') as f:
+            library_index = json.load(f)
+
+    library_index["watched"] = set(library_index.get("watched", []))
+    library_index.setdefault("imdb", {})
+    library_index.setdefault("titles", {})
+    library_index.setdefault("runtimes", {})
+    return library_index
+
+def find_movie(library_index, movie):
+    """
+    Find a movie of a list in the library: by tmdb id, then by imdb id, then by title and year.
+    Returns (movieid, source), source being "tmdb", "imdb" or "title", or (None, None).
+    """
+    movieid = library_index["tmdb"].get(str(movie["id"]))
+    if movieid is not None:
+        return movieid, "tmdb"
+
+    # only the movies without tmdb id are in the fallback indexes
+    if not library_index["imdb"] and not library_index["titles"]:
+        return None, None
+
+    if movie.get("imdb_id"):
+        movieid = library_index["imdb"].get(movie["imdb_id"])
+        if movieid is not None:
+            return movieid, "imdb"
+
+    # normalizing the titles is the slow part, only done for the years of these movies
+    years = library_index.get("title_years")
+    if years is None:
+        years = library_index["title_years"] = {key.rsplit('|', 1)[1] for key in library_index["titles"]}
+    year = (movie.get("release_date") or "")[:4]
+    if year not in years:
+        return None, None
+    for title in (movie.get("title"), movie.get("original_title")):
+        movieid = library_index["titles"].get(get_title_key(title, year))
+        if movieid is not None:
+            return movieid, "title"
+
+    return None, None
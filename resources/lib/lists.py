@@ -0,0 +1,490 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Lists access shared by the plugin and the service: local and distant lists,
+the requests cache, the prefetch of the distant lists tree and the
+manifest based synchronization of the distant lists.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import xbmc
+from xbmcvfs import translatePath, mkdir
+
+from resources.lib.settings import get_addon, get_setting_bool, get_setting_int, get_setting_string
+from resources.lib.library import ADDON_USER_DATA_FOLDER, get_tmp_file
+from resources.lib.timing import phase
+from resources.lib.store import is_thin_list, open_store_db, refresh_store_db, hydrate_list
+from resources.lib.jsonstream import CHUNK_SIZE, load_list, file_chunks, decode_chunks
+from resources.lib.circuit_breaker import HostUnavailable, guarded_request
+from resources.lib.http_cache import CACHE_FILE, record_response, get_cached_response
+
+# Get addon base path
+ADDON_PATH = translatePath(get_addon().getAddonInfo('path'))
+
+#local database of the shared movie store
+STORE_DB_FILE = os.path.join(ADDON_USER_DATA_FOLDER, 'movie_store.db')
+
+#local copy of the distant lists, kept up to date with the manifest
+SYNC_DIR = os.path.join(ADDON_USER_DATA_FOLDER, 'lists')
+SYNC_MANIFEST_FILE = os.path.join(SYNC_DIR, 'manifest.json')
+
+# requests and its cache are only imported and installed on the first distant request,
+# the local lists and the synchronized lists don't need them
+_requests_cache_lock = threading.Lock()
+_requests_cache_installed = False
+
+def install_requests_cache():
+    """
+    Install the requests cache used for all the distant lists, once.
+    Expired lists are served from the cache right away and revalidated in the background
+    with a conditional request (ETag / If-Modified-Since), so an expired cache never
+    makes the user wait for the network. When the server can't be reached, the cached
+    lists are used whatever their age.
+    """
+
+    global _requests_cache_installed
+
+    with _requests_cache_lock:
+        if _requests_cache_installed:
+            return
+        _install_requests_cache()
+        _requests_cache_installed = True
+
+def _install_requests_cache():
+    import requests_cache
+
+    mkdir(ADDON_USER_DATA_FOLDER) #make sure the folder exists
+
+    # folder lists and movie lists don't change at the same rate, each type has its own expiration
+    folder_list_ttl = get_setting_int('folder_list_ttl') * 3600
+    movie_list_ttl = get_setting_int('movie_list_ttl') * 3600
+    urls_expire_after = {
+        '*/folder_list/*': folder_list_ttl,
+        '*/movie_list/*': movie_list_ttl,
+        '*/movie_store/*': movie_list_ttl
+    }
+
+    try:
+        requests_cache.install_cache(CACHE_FILE, backend='sqlite', expire_after=3600,  # Default expiration: 1 hour
+                                     urls_expire_after=urls_expire_after, stale_while_revalidate=True, stale_if_error=True)
+    except TypeError:
+        # requests-cache < 1.0 doesn't support stale-while-revalidate
+        xbmc.log("requests-cache doesn't support stale-while-revalidate, lists will be downloaded again when expired", level=xbmc.LOGWARNING)
+        requests_cache.install_cache(CACHE_FILE, backend='sqlite', expire_after=3600,
+                                     urls_expire_after=urls_expire_after)
+
+def read_list(list_type, chunks):
+    """
+    Decode a list from chunks of text. The movie lists are streamed and only the
+    movie fields used by the plugin are kept, whatever the size of the file.
+    """
+
+    if list_type == 'movie_list':
+        return load_list(chunks)
+    return json.loads(''.join(chunks))
+
+def get_local_list(list_type, list_id):
+    """
+    Get a list from the local filesystem
+    """
+
+    list_path = os.path.join(ADDON_PATH, 'resources', 'lists', list_type, f"{list_id}.json")
+    xbmc.log(f'list path: {list_path}',level=xbmc.LOGDEBUG)
+
+    try:
+        with phase('list: read local'), open(list_path, 'r', encoding='utf-8') as f:
+            return read_list(list_type, file_chunks(f))
+    except Exception as e:
+        xbmc.log("Error reading local list file", level=xbmc.LOGERROR)
+        raise
+
+
+def get_bundled_list(list_type, list_id):
+    """
+    Get a list bundled with the addon, or None if there is none.
+    """
+
+    if not os.path.exists(os.path.join(ADDON_PATH, 'resources', 'lists', list_type, f"{list_id}.json")):
+        return None
+    return get_local_list(list_type, list_id)
+
+def get_lists_url(file_path):
+    """
+    Get the URL of a file of the configured lists server.
+    """
+
+    list_url = get_setting_string('lists_url')
+    list_url = list_url if list_url.endswith('/') else list_url + '/'
+    return list_url + file_path
+
+def get_distant_file(list_type, list_id):
+    """
+    Get the response for a list file from the configured URL.
+    Returns None if the file couldn't be found.
+    """
+
+    install_requests_cache()
+    import requests
+
+    list_url = get_lists_url(f"{list_type}/{list_id}.json")
+    xbmc.log(f'list url: {list_url}',level=xbmc.LOGDEBUG)
+
+    try:
+        with phase('list: http'):
+            try:
+                response = guarded_request(requests.get, list_url, timeout=5)
+            except HostUnavailable:
+                # the lists server is down, the cached list is served whatever its age
+                response = get_cached_response(list_url)
+                if response is None:
+                    raise
+        #log if response was from cache
+        from_cache = getattr(response, 'from_cache', False)
+        is_expired = getattr(response, 'is_expired', False)
+        xbmc.log(f'GitHub requests cached: {from_cache} (expired: {is_expired})',level=xbmc.LOGDEBUG)
+        record_response(response)
+    except OSError as e: # requests errors are OSError
+        xbmc.log(f"Error requesting list url: {e}",level=xbmc.LOGERROR)
+        raise
+    else:
+        if response.status_code == 200:
+            return response
+        elif response.status_code >= 500:
+            # the server is failing, handled like an unreachable server
+            response.raise_for_status()
+        else:
+            return None
+
+def get_distant_list(list_type, list_id):
+    """
+    Get a list from the configured URL
+    """
+
+    response = get_distant_file(list_type, list_id)
+    if response is None:
+        return None
+    with phase('list: parse'):
+        return read_list(list_type, decode_chunks(response.iter_content(CHUNK_SIZE)))
+
+_synced_manifest = None
+
+def load_synced_manifest():
+    """
+    Load the manifest of the synchronized lists, it is read once per invocation.
+    Returns an empty manifest if the lists were never synchronized.
+    """
+
+    global _synced_manifest
+    if _synced_manifest is None:
+        try:
+            with open(SYNC_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                _synced_manifest = json.load(f)
+        except (OSError, ValueError):
+            _synced_manifest = {"files": {}}
+    return _synced_manifest
+
+def get_synced_file_hash(list_type, list_id):
+    """
+    Get the hash of a synchronized list file, or None if it wasn't synchronized.
+    """
+
+    entry = load_synced_manifest()["files"].get(f"{list_type}/{list_id}.json")
+    return entry["sha1"] if entry is not None else None
+
+def get_synced_list(list_type, list_id):
+    """
+    Get a list from the synchronized copy of the distant lists.
+    Returns None if the list wasn't synchronized.
+    """
+
+    if get_synced_file_hash(list_type, list_id) is None:
+        return None
+
+    list_path = os.path.join(SYNC_DIR, list_type, f"{list_id}.json")
+    xbmc.log(f'synced list path: {list_path}',level=xbmc.LOGDEBUG)
+
+    try:
+        with phase('list: read synced'), open(list_path, 'r', encoding='utf-8') as f:
+            return read_list(list_type, file_chunks(f))
+    except (OSError, ValueError):
+        xbmc.log("Error reading synced list file", level=xbmc.LOGERROR)
+        return None
+
+def sync_lists(progress=None, abort=None):
+    """
+    Synchronize the local copy of the distant lists using the manifest of the lists server.
+    The manifest gives the hash of every file, only the files that changed are downloaded,
+    concurrently. Most of the time nothing changed and the manifest is the only request.
+    progress is called with (done, total, file_path) after each download and
+    abort is polled to stop early, both are optional.
+    Returns the list of the updated files paths, or None if the server has no manifest.
+    """
+
+    global _synced_manifest
+
+    install_requests_cache()
+    import requests
+    import requests_cache
+
+    local_manifest = load_synced_manifest()
+    workers = max(1, get_setting_int('prefetch_workers'))
+
+    # the synchronization has its own change detection, the requests cache is bypassed
+    with requests_cache.disabled():
+        headers = {}
+        if local_manifest.get("etag"):
+            headers['If-None-Match'] = local_manifest["etag"]
+        try:
+            response = guarded_request(requests.get, get_lists_url('manifest.json'), headers=headers, timeout=5)
+        except OSError as e: # requests errors are OSError
+            xbmc.log("Error requesting lists manifest", level=xbmc.LOGERROR)
+            raise
+        if response.status_code == 304:
+            xbmc.log("Lists manifest not modified", level=xbmc.LOGDEBUG)
+            return []
+        if response.status_code != 200:
+            xbmc.log(f"No lists manifest on the server: {response.status_code}", level=xbmc.LOGWARNING)
+            return None
+
+        manifest = json.loads(response.text)
+        manifest["etag"] = response.headers.get('ETag')
+
+        changed = [file_path for file_path, entry in manifest["files"].items()
+                   if local_manifest["files"].get(file_path, {}).get("sha1") != entry["sha1"]]
+        xbmc.log(f"{len(changed)} lists changed on the server", level=xbmc.LOGDEBUG)
+
+        lock = threading.Lock()
+        counters = {'done': 0}
+
+        def download(file_path):
+            if abort is not None and abort():
+                return False
+            try:
+                file_response = guarded_request(requests.get, get_lists_url(file_path), timeout=5)
+            except OSError: # requests errors are OSError
+                xbmc.log(f"Error downloading {file_path}", level=xbmc.LOGERROR)
+                return False
+            content = file_response.content
+            ok = file_response.status_code == 200 and hashlib.sha1(content).hexdigest() == manifest["files"][file_path]["sha1"]
+            if ok:
+                file_name = os.path.join(SYNC_DIR, *file_path.split('/'))
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                tmp_file = get_tmp_file(file_name)
+                with open(tmp_file, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_file, file_name)
+            else:
+                xbmc.log(f"Error downloading {file_path}: {file_response.status_code}", level=xbmc.LOGERROR)
+            with lock:
+                counters['done'] += 1
+                done = counters['done']
+            if progress is not None:
+                progress(done, len(changed), file_path)
+            return ok
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(zip(changed, executor.map(download, changed)))
+
+    # the files that failed keep their previous hash, so they are downloaded again next time
+    for file_path, ok in results.items():
+        if not ok:
+            if file_path in local_manifest["files"]:
+                manifest["files"][file_path] = local_manifest["files"][file_path]
+            else:
+                del manifest["files"][file_path]
+            manifest["etag"] = None
+
+    # remove the files which are not on the server anymore
+    for file_path in local_manifest["files"]:
+        if file_path not in manifest["files"]:
+            try:
+                os.remove(os.path.join(SYNC_DIR, *file_path.split('/')))
+            except OSError:
+                pass
+
+    os.makedirs(SYNC_DIR, exist_ok=True)
+    tmp_file = get_tmp_file(SYNC_MANIFEST_FILE)
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, SYNC_MANIFEST_FILE)
+    _synced_manifest = manifest
+
+    return [file_path for file_path, ok in results.items() if ok]
+
+def get_response_signature(response):
+    """
+    Get a signature of a distant file without hashing its content: its ETag or Last-Modified
+    header, or the time its cached copy was downloaded, which changes with every download.
+    """
+
+    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+    if validator is None:
+        created_at = getattr(response, 'created_at', None)
+        if created_at is None:
+            return hashlib.sha1(response.content).hexdigest()
+        validator = created_at.isoformat()
+    return f"{response.url}:{validator}"
+
+def get_movie_store_db():
+    """
+    Get the database of the shared movie store used by the thin lists.
+    The store is imported again only when it changed on the lists source.
+    """
+
+    conn = open_store_db(STORE_DB_FILE)
+
+    if get_setting_bool('lists_source') == True:
+        store_path = os.path.join(ADDON_PATH, 'resources', 'lists', 'movie_store', 'movies.json')
+        stat = os.stat(store_path)
+        signature = f'{store_path}:{stat.st_mtime}:{stat.st_size}'
+        refresh_store_db(conn, signature, lambda: get_local_list('movie_store', 'movies'))
+    elif get_synced_file_hash('movie_store', 'movies') is not None:
+        signature = get_synced_file_hash('movie_store', 'movies')
+        refresh_store_db(conn, signature, lambda: get_synced_list('movie_store', 'movies'))
+    else:
+        response = get_distant_file('movie_store', 'movies')
+        if response is not None:
+            refresh_store_db(conn, get_response_signature(response), lambda: json.loads(response.text))
+
+    return conn
+
+def get_list_signature(list_type, list_id):
+    """
+    Get a signature of the content of a list without reading it, it changes whenever the list changes.
+    Returns None if the list has to be read to know its content: a distant list that wasn't synchronized.
+    """
+
+    if get_setting_bool('lists_source') == True:
+        list_path = os.path.join(ADDON_PATH, 'resources', 'lists', list_type, f"{list_id}.json")
+        store_path = os.path.join(ADDON_PATH, 'resources', 'lists', 'movie_store', 'movies.json')
+        try:
+            signature = f"local:{os.stat(list_path).st_mtime}"
+        except OSError:
+            return None
+        # thin lists are completed with the store
+        if list_type == 'movie_list' and os.path.exists(store_path):
+            signature += f":{os.stat(store_path).st_mtime}"
+        return signature
+
+    file_hash = get_synced_file_hash(list_type, list_id)
+    if file_hash is None:
+        return None
+    signature = f"synced:{file_hash}"
+    if list_type == 'movie_list':
+        signature += f":{get_synced_file_hash('movie_store', 'movies')}"
+    return signature
+
+def get_list(list_type, list_id):
+    """
+    Get a list, either from the local filesystem or from the configured URL depending on the settings.
+    Thin movie lists are completed with the movies of the shared store.
+    """
+
+    if get_setting_bool('lists_source') == True:
+        result = get_local_list(list_type, list_id)
+    else:
+        # the synchronized copy is used when available, no request is needed then
+        result = get_synced_list(list_type, list_id)
+        if result is None:
+            try:
+                result = get_distant_list(list_type, list_id)
+            except (OSError, ValueError): # requests errors are OSError
+                # the lists server is unreachable, the lists bundled with the addon are used instead
+                result = get_bundled_list(list_type, list_id)
+                if result is None:
+                    raise
+                xbmc.log(f"Lists server unreachable, using the bundled {list_id}", level=xbmc.LOGWARNING)
+
+    if list_type == 'movie_list' and result is not None and is_thin_list(result):
+        with phase('list: hydrate'):
+            conn = get_movie_store_db()
+            try:
+                result = hydrate_list(result, conn)
+            finally:
+                conn.close()
+
+    return result
+
+def prefetch_lists(progress=None, abort=None):
+    """
+    Walk the distant lists tree from the master list and download every folder list
+    and movie list, so they are in the requests cache when browsing.
+    progress is called with (done, total, list_id) after each download and
+    abort is polled to stop early, both are optional.
+    Returns the number of lists downloaded.
+    """
+
+    if get_setting_bool('lists_source') == True:
+        return 0 #nothing to prefetch with local lists
+
+    workers = max(1, get_setting_int('prefetch_workers'))
+    delay = get_setting_int('prefetch_delay') / 1000 # pause between two downloads of a worker, in ms
+
+    lock = threading.Lock()
+    counters = {'done': 0, 'total': 1}
+
+    def fetch(list_type, list_id):
+        if abort is not None and abort():
+            return None
+        try:
+            # only the folder lists are parsed, to find the lists below them
+            if list_type == 'folder_list':
+                result = get_distant_list(list_type, list_id)
+            else:
+                result = get_distant_file(list_type, list_id)
+        except (OSError, ValueError):  # requests errors are OSError
+            result = None # already logged, the prefetch goes on with the other lists
+        with lock:
+            counters['done'] += 1
+            done, total = counters['done'], counters['total']
+        if progress is not None:
+            progress(done, total, list_id)
+        if delay > 0:
+            time.sleep(delay)
+        return result
+
+    seen = {('folder_list', 'master')}
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # the tree is walked level by level, each level being downloaded concurrently
+        level = [('folder_list', 'master')]
+        while level:
+            results = list(executor.map(lambda entry: fetch(*entry), level))
+            next_level = []
+            for (list_type, list_id), result in zip(level, results):
+                if list_type != 'folder_list' or result is None:
+                    continue
+                for folder in result.get('folders', []):
+                    entry = (folder['type'], folder['id'])
+                    if entry not in seen:
+                        seen.add(entry)
+                        next_level.append(entry)
+            with lock:
+                counters['total'] += len(next_level)
+            level = next_level
+
+        # the thin lists also need the movie store
+        with lock:
+            counters['total'] += 1
+        fetch('movie_store', 'movies')
+
+    return counters['done']
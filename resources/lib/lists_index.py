@@ -0,0 +1,256 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Index of the lists content: which lists contain a movie, and at which rank.
+It is stored in a sqlite database of the addon profile folder so a lookup
+doesn't depend on the number of lists, and it is updated list by list
+when the lists change.
+"""
+
+import os
+import json
+import hashlib
+
+import xbmc
+from xbmcvfs import mkdir
+
+from resources.lib.settings import get_addon, get_setting_bool, get_setting_int, get_setting_string
+from resources.lib.library import ADDON_USER_DATA_FOLDER
+from resources.lib.lists import get_list
+from resources.lib.jsonstream import MOVIE_FIELDS
+
+# File of the lists index database
+LISTS_INDEX_FILE = os.path.join(ADDON_USER_DATA_FOLDER, 'lists_index.db')
+
+# Version of the index content, the lists are indexed again when it changes
+LISTS_INDEX_SCHEMA = '2'
+
+def open_lists_index():
+    """
+    Open the lists index database, creating it if needed.
+    """
+
+    mkdir(ADDON_USER_DATA_FOLDER) #make sure the folder exists
+
+    import sqlite3 # only the actions using a database load it
+    conn = sqlite3.connect(LISTS_INDEX_FILE)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS lists (list_id TEXT PRIMARY KEY, title TEXT, ordered_by TEXT, size INTEGER, signature TEXT);
+        CREATE TABLE IF NOT EXISTS entries (tmdb INTEGER, list_id TEXT, rank INTEGER);
+        CREATE INDEX IF NOT EXISTS entries_tmdb ON entries (tmdb);
+        CREATE INDEX IF NOT EXISTS entries_list_id ON entries (list_id);
+        CREATE TABLE IF NOT EXISTS tree (parent_id TEXT, position INTEGER, child_type TEXT, child_id TEXT, title TEXT);
+        CREATE TABLE IF NOT EXISTS movies (tmdb INTEGER PRIMARY KEY, data TEXT);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+    return conn
+
+def lists_source_stamp():
+    """
+    Get a stamp of the lists source, the whole index has to be checked again when it changes:
+    other source, other server, or new bundled lists with an addon update.
+    """
+
+    if get_setting_bool('lists_source') == True:
+        return f"local:{get_addon().getAddonInfo('version')}"
+    return f"distant:{get_setting_string('lists_url')}"
+
+def get_generation(conn):
+    """
+    Get the generation of the lists index, it changes each time the index content changes.
+    """
+
+    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return int(row[0]) if row is not None else 0
+
+def bump_generation(conn):
+    """
+    Change the generation of the lists index, to be called in the transaction changing it.
+    """
+
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (str(get_generation(conn) + 1),))
+
+def list_signature(movie_list):
+    """
+    Compute the signature of a movie list from its modified date and its movies,
+    it changes whenever the content of the list changes.
+    """
+
+    content = [movie_list.get("modified"), [movie["id"] for movie in movie_list["movies"]]]
+    return hashlib.sha1(json.dumps(content).encode('utf-8')).hexdigest()
+
+def read_folder_list(list_id):
+    """
+    Read a folder list, returns None if it can't be read.
+    """
+
+    try:
+        return get_list('folder_list', list_id)
+    except (OSError, ValueError):  # requests errors are OSError
+        xbmc.log(f"Lists index: can't read {list_id}", level=xbmc.LOGWARNING)
+        return None
+
+def walk_lists_tree(workers):
+    """
+    Walk the lists tree from the master list, level by level, downloading each level concurrently.
+    Returns the tree as a list of (parent_id, position, child_type, child_id, title) rows.
+    """
+
+    tree = []
+    seen = {'master'}
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        level = ['master']
+        while level:
+            next_level = []
+            for folder_id, folder_list in zip(level, executor.map(read_folder_list, level)):
+                if folder_list is None:
+                    continue
+                for position, folder in enumerate(folder_list.get('folders', [])):
+                    tree.append((folder_id, position, folder['type'], folder['id'], folder['title']))
+                    if folder['type'] == 'folder_list' and folder['id'] not in seen:
+                        seen.add(folder['id'])
+                        next_level.append(folder['id'])
+            level = next_level
+    return tree
+
+def read_movie_list(list_id):
+    """
+    Read a movie list and only keep what the index needs.
+    Returns (list_id, title, ordered_by, signature, [(tmdb, rank)], [(tmdb, movie data)])
+    or None if the list can't be read.
+    """
+
+    try:
+        movie_list = get_list('movie_list', list_id)
+    except (OSError, ValueError):  # requests errors are OSError
+        movie_list = None
+    if movie_list is None:
+        xbmc.log(f"Lists index: can't read {list_id}", level=xbmc.LOGWARNING)
+        return None
+
+    entries = [(movie["id"], movie.get("rank", index + 1)) for index, movie in enumerate(movie_list["movies"])]
+    # the movies themselves are kept for the lists computed from the index
+    movies = [(movie["id"], json.dumps({field: movie[field] for field in MOVIE_FIELDS if field in movie and field != "rank"}))
+              for movie in movie_list["movies"]]
+    return (list_id, movie_list.get("title"), movie_list.get("ordered_by"), list_signature(movie_list), entries, movies)
+
+def update_lists_index(list_ids=None, progress=None, abort=None):
+    """
+    Update the lists index.
+    With list_ids, only these movie lists are read again. Otherwise the whole lists
+    tree is walked and only the lists whose signature changed are indexed again.
+    progress is called with (done, total) and abort is polled to stop early, both are optional.
+    Returns the number of lists indexed again.
+    """
+
+    workers = max(1, get_setting_int('prefetch_workers'))
+    conn = open_lists_index()
+    try:
+        if list_ids is None:
+            tree = walk_lists_tree(workers)
+            tree_changed = conn.execute("SELECT * FROM tree ORDER BY rowid").fetchall() != tree
+            with conn:
+                conn.execute("DELETE FROM tree")
+                conn.executemany("INSERT INTO tree VALUES (?, ?, ?, ?, ?)", tree)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (lists_source_stamp(),))
+                if tree_changed:
+                    bump_generation(conn)
+            # an index of an older schema lacks some content, all the lists are indexed again
+            row = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or row[0] != LISTS_INDEX_SCHEMA:
+                with conn:
+                    conn.execute("UPDATE lists SET signature = NULL")
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (LISTS_INDEX_SCHEMA,))
+            list_ids = sorted({row[3] for row in tree if row[2] == 'movie_list'})
+            # forget the lists which are not in the tree anymore
+            with conn:
+                for (list_id,) in conn.execute("SELECT list_id FROM lists").fetchall():
+                    if list_id not in list_ids:
+                        conn.execute("DELETE FROM entries WHERE list_id = ?", (list_id,))
+                        conn.execute("DELETE FROM lists WHERE list_id = ?", (list_id,))
+                        bump_generation(conn)
+                conn.execute("DELETE FROM movies WHERE tmdb NOT IN (SELECT tmdb FROM entries)")
+
+        signatures = dict(conn.execute("SELECT list_id, signature FROM lists"))
+        nbindexed = 0
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # the lists are only kept as (tmdb, rank) pairs, so reading them all stays light
+            for done, result in enumerate(executor.map(read_movie_list, list_ids)):
+                if abort is not None and abort():
+                    break
+                if progress is not None:
+                    progress(done + 1, len(list_ids))
+                if result is None:
+                    continue
+                list_id, title, ordered_by, signature, entries, movies = result
+                if signatures.get(list_id) == signature:
+                    continue
+                with conn:
+                    conn.execute("DELETE FROM entries WHERE list_id = ?", (list_id,))
+                    conn.executemany("INSERT INTO entries VALUES (?, ?, ?)",
+                                     ((tmdb, list_id, rank) for tmdb, rank in entries))
+                    conn.executemany("INSERT OR REPLACE INTO movies VALUES (?, ?)", movies)
+                    conn.execute("INSERT OR REPLACE INTO lists VALUES (?, ?, ?, ?, ?)",
+                                 (list_id, title, ordered_by, len(entries), signature))
+                    bump_generation(conn)
+                nbindexed += 1
+    finally:
+        conn.close()
+
+    xbmc.log(f"Lists index: {nbindexed} lists indexed", level=xbmc.LOGDEBUG)
+    return nbindexed
+
+def is_lists_index_empty():
+    """
+    Tell if the lists index was never built.
+    """
+
+    conn = open_lists_index()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM lists").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+def is_lists_index_outdated():
+    """
+    Tell if the lists index was built from another lists source than the current one,
+    or with an older schema.
+    """
+
+    conn = open_lists_index()
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('source', 'schema')"))
+    finally:
+        conn.close()
+    return meta.get('source') != lists_source_stamp() or meta.get('schema') != LISTS_INDEX_SCHEMA
+
+def get_movie_lists(tmdbid):
+    """
+    Get the lists containing a movie.
+    Returns a list of (list_id, title, ordered_by, rank, size), ordered by rank.
+    """
+
+    conn = open_lists_index()
+    try:
+        return conn.execute("""
+            SELECT lists.list_id, lists.title, lists.ordered_by, entries.rank, lists.size
+            FROM entries JOIN lists ON lists.list_id = entries.list_id
+            WHERE entries.tmdb = ?
+            ORDER BY entries.rank, lists.title""", (int(tmdbid),)).fetchall()
+    finally:
+        conn.close()
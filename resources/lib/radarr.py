@@ -0,0 +1,335 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Radarr API access: all the requests of an invocation go through one
+persistent session, so the connection to Radarr is opened once.
+The state of the Radarr movies is kept in a short lived index by tmdb id.
+"""
+
+import os
+import json
+import time
+import threading
+
+import xbmc
+from xbmcvfs import mkdir
+
+from resources.lib.settings import get_setting_int, get_setting_string
+from resources.lib.library import ADDON_USER_DATA_FOLDER, get_tmp_file
+from resources.lib.timing import phase
+from resources.lib.circuit_breaker import guarded_request
+
+# File holding the state of the Radarr movies by tmdb id
+RADARR_INDEX_FILE = os.path.join(ADDON_USER_DATA_FOLDER, 'radarr_index.json')
+
+# Result of adding a movie
+ADDED = 'added'
+EXISTS = 'exists'
+FAILED = 'failed'
+
+# State of a movie in Radarr
+STATE_DOWNLOADED = 'downloaded'
+STATE_DOWNLOADING = 'downloading'
+STATE_DOWNLOAD_FAILED = 'download_failed'
+STATE_MONITORED = 'monitored'
+STATE_UNMONITORED = 'unmonitored'
+
+STATE_LABELS = {
+    STATE_DOWNLOADED: 'Downloaded by Radarr',
+    STATE_DOWNLOADING: 'Downloading in Radarr',
+    STATE_DOWNLOAD_FAILED: 'Radarr download failed',
+    STATE_MONITORED: 'Monitored by Radarr',
+    STATE_UNMONITORED: 'In Radarr, not monitored'
+}
+
+_session = None
+_radarr_index = None
+
+def get_session():
+    """
+    Get the session used for all the Radarr requests, created on first use.
+    """
+    global _session
+    if _session is None:
+        import requests
+        import requests_cache
+        with requests_cache.disabled(): #Radarr requests are never cached
+            _session = requests.Session()
+        _session.headers['X-Api-Key'] = get_setting_string('radarr_token')
+    return _session
+
+def get_api_url(endpoint):
+    """
+    Get the URL of a Radarr API endpoint.
+    """
+    radarr_url = get_setting_string('radarr_url')
+    api_url = radarr_url if radarr_url.endswith('/') else radarr_url + '/'
+    return api_url + "api/v3/" + endpoint
+
+def request(method, endpoint, **kwargs):
+    """
+    Send a request to a Radarr API endpoint, failing right away while Radarr is unreachable.
+    """
+    return guarded_request(getattr(get_session(), method), get_api_url(endpoint), **kwargs)
+
+def check_connection():
+    """
+    Check Radarr connection by requesting system status endpoint.
+    Returns True if connection is successful, False otherwise.
+    """
+    try:
+        response = request('get', "system/status", timeout=5)
+    except OSError: # requests errors are OSError
+        xbmc.log("Error requesting Radarr status", level=xbmc.LOGERROR)
+        return False
+    return response.status_code == 200
+
+def get_root_folders():
+    """
+    Get the list of Radarr root folders.
+    Returns a list of root folder objects or None if the request fails.
+    """
+    try:
+        response = request('get', "rootfolder", timeout=5)
+    except OSError:
+        xbmc.log("Error requesting Radarr root folders", level=xbmc.LOGERROR)
+        raise
+    if response.status_code == 200:
+        return json.loads(response.text)
+    return None
+
+def get_quality_profiles():
+    """
+    Get the list of Radarr quality profiles.
+    Returns a list of quality profile objects or None if the request fails.
+    """
+    try:
+        response = request('get', "qualityprofile", timeout=5)
+    except OSError:
+        xbmc.log("Error requesting Radarr quality profiles", level=xbmc.LOGERROR)
+        raise
+    if response.status_code == 200:
+        return json.loads(response.text)
+    return None
+
+def get_movie_data(movie, root_folder_path, quality_profile_id):
+    """
+    Get the data sent to Radarr to add a movie of a list.
+    """
+    movie_data = {
+        'tmdbId': int(movie['id']),  # The TMDB ID of the movie
+        'rootFolderPath': root_folder_path,  # Selected root folder path
+        'qualityProfileId': int(quality_profile_id),  # Selected quality profile ID
+        'monitored': True,  # Monitor the movie for downloads
+        'addOptions': {'searchForMovie': True}  # Search for the movie after adding
+    }
+    if movie.get('title'):
+        movie_data['title'] = movie['title']
+    if movie.get('release_date'):
+        movie_data['year'] = int(movie['release_date'][:4])
+    return movie_data
+
+def add_movie(movie_data):
+    """
+    Add a movie to Radarr.
+    Returns ADDED, EXISTS or FAILED.
+    """
+    try:
+        response = request('post', "movie", json=movie_data, timeout=10)
+    except OSError as e:
+        xbmc.log(f"Error adding movie {movie_data['tmdbId']} to Radarr: {e}", level=xbmc.LOGERROR)
+        return FAILED
+
+    if response.status_code in [200, 201]:
+        return ADDED
+    if response.status_code == 400:
+        try:
+            error_message = response.json()[0].get('errorMessage')
+        except (ValueError, LookupError, AttributeError):
+            error_message = response.text
+        if error_message == "This movie has already been added":
+            return EXISTS
+        xbmc.log(f"Failed to add movie {movie_data['tmdbId']} to Radarr: {error_message}", level=xbmc.LOGWARNING)
+        return FAILED
+    xbmc.log(f"Failed to add movie {movie_data['tmdbId']} to Radarr: {response.status_code} - {response.text}", level=xbmc.LOGWARNING)
+    return FAILED
+
+def import_movies(movies_data):
+    """
+    Add several movies in one request with the import endpoint, the one used by
+    the Radarr bulk import. Radarr skips the movies it already has, and the ones it rejects.
+    Returns {tmdbId: ADDED or EXISTS} for the movies in the response or in the Radarr movies,
+    the others are missing. Returns None if the endpoint isn't available or refused the movies.
+    """
+    try:
+        response = request('post', "movie/import", json=movies_data, timeout=60)
+    except OSError as e:
+        xbmc.log(f"Error importing movies to Radarr: {e}", level=xbmc.LOGWARNING)
+        return None
+    if response.status_code not in [200, 201, 202]:
+        xbmc.log(f"Radarr import endpoint not used: {response.status_code}", level=xbmc.LOGDEBUG)
+        return None
+
+    try:
+        added = {movie.get('tmdbId') for movie in response.json()}
+    except (ValueError, TypeError, AttributeError):
+        added = set()
+
+    # a movie skipped by Radarr is only known to exist if Radarr has it
+    try:
+        radarr_index = fetch_radarr_index()
+    except (OSError, ValueError):
+        radarr_index = {}
+    results = {}
+    for movie_data in movies_data:
+        if movie_data['tmdbId'] in added:
+            results[movie_data['tmdbId']] = ADDED
+        elif str(movie_data['tmdbId']) in radarr_index:
+            results[movie_data['tmdbId']] = EXISTS
+    return results
+
+def add_movies(movies_data, progress=None, abort=None):
+    """
+    Add several movies to Radarr: with the import endpoint when available,
+    otherwise with concurrent requests, radarr_workers at a time. The movies the
+    import endpoint skipped without Radarr having them are added one by one, to know why.
+    progress is called with (done, total) and abort is polled to stop early, both are optional.
+    Returns {tmdbId: ADDED, EXISTS or FAILED}, the movies not sent because of abort are missing.
+    """
+    if not movies_data:
+        return {}
+
+    total = len(movies_data)
+    results = import_movies(movies_data)
+    if results is None:
+        results = {}
+    else:
+        movies_data = [movie_data for movie_data in movies_data if movie_data['tmdbId'] not in results]
+        if progress is not None:
+            progress(len(results), total)
+        if not movies_data:
+            return results
+
+    lock = threading.Lock()
+
+    def add(movie_data):
+        if abort is not None and abort():
+            return
+        result = add_movie(movie_data)
+        with lock:
+            results[movie_data['tmdbId']] = result
+            if progress is not None:
+                progress(len(results), total)
+
+    workers = max(1, get_setting_int('radarr_workers'))
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(add, movies_data))
+
+    return results
+
+def fetch_radarr_index():
+    """
+    Get the state of all the Radarr movies with two requests, the movies and the queue.
+    Returns {tmdb id: state}, the tmdb ids are strings like in the tmdb index.
+    """
+    with phase('radarr: http'):
+        movies_response = request('get', "movie", timeout=30)
+        queue_response = request('get', "queue", params={'pageSize': 1000}, timeout=30)
+    if movies_response.status_code != 200:
+        raise ValueError(f"Radarr movies request failed: {movies_response.status_code}")
+
+    with phase('radarr: parse'):
+        # queued downloads by Radarr movie id
+        queue = {}
+        if queue_response.status_code == 200:
+            for record in queue_response.json().get('records', []):
+                failed = record.get('status') == 'failed' or record.get('trackedDownloadStatus') == 'error'
+                # a movie can have several downloads, one still running is enough
+                if queue.get(record.get('movieId')) != STATE_DOWNLOADING:
+                    queue[record.get('movieId')] = STATE_DOWNLOAD_FAILED if failed else STATE_DOWNLOADING
+
+        index = {}
+        for movie in movies_response.json():
+            if movie.get('hasFile'):
+                state = STATE_DOWNLOADED
+            elif movie.get('id') in queue:
+                state = queue[movie['id']]
+            elif movie.get('monitored'):
+                state = STATE_MONITORED
+            else:
+                state = STATE_UNMONITORED
+            index[str(movie.get('tmdbId'))] = state
+    return index
+
+def save_radarr_index(index):
+    """
+    Save the Radarr index to the addon profile folder.
+    Returns the saved data: {"updated": time, "movies": index}.
+    """
+    mkdir(ADDON_USER_DATA_FOLDER) #make sure the folder exists
+    data = {"updated": time.time(), "movies": index}
+    tmp_file = get_tmp_file(RADARR_INDEX_FILE)
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_file, RADARR_INDEX_FILE)
+    return data
+
+def get_radarr_index():
+    """
+    Get the state of the Radarr movies: {tmdb id: state}.
+    The index is saved and only requested again when older than radarr_index_ttl minutes.
+    If Radarr can't be reached, the saved index is used whatever its age.
+    """
+    global _radarr_index
+    if _radarr_index is not None:
+        return _radarr_index["movies"]
+
+    saved = None
+    try:
+        with open(RADARR_INDEX_FILE, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if saved is not None and time.time() - saved["updated"] < get_setting_int('radarr_index_ttl') * 60:
+        _radarr_index = saved
+        return _radarr_index["movies"]
+
+    try:
+        movies = fetch_radarr_index()
+    except (OSError, ValueError) as e: # requests errors are OSError
+        xbmc.log(f"Error requesting the Radarr movies: {e}", level=xbmc.LOGWARNING)
+        _radarr_index = saved if saved is not None else {"updated": 0, "movies": {}}
+    else:
+        _radarr_index = save_radarr_index(movies)
+    return _radarr_index["movies"]
+
+def get_radarr_index_version():
+    """
+    Get the version of the Radarr index, it changes each time the index is saved.
+    """
+    get_radarr_index()
+    return repr(_radarr_index["updated"])
+
+def set_radarr_states(states):
+    """
+    Update the saved Radarr index after movies were added, so they show without a new request.
+    """
+    global _radarr_index
+    index = dict(get_radarr_index())
+    index.update(states)
+    _radarr_index = save_radarr_index(index)
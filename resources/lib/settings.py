@@ -0,0 +1,56 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Snapshot of the addon settings: the Addon object is created once and each
+setting is read from Kodi only the first time it is used in an invocation.
+"""
+
+from xbmcaddon import Addon
+
+_addon = None
+_values = {}
+
+def get_addon():
+    """
+    Get the Addon object, created once.
+    """
+    global _addon
+    if _addon is None:
+        _addon = Addon()
+    return _addon
+
+def _get_setting(kind, id):
+    key = (kind, id)
+    if key not in _values:
+        _values[key] = getattr(get_addon(), 'getSetting' + kind)(id)
+    return _values[key]
+
+def get_setting_bool(id):
+    return _get_setting('Bool', id)
+
+def get_setting_int(id):
+    return _get_setting('Int', id)
+
+def get_setting_string(id):
+    return _get_setting('String', id)
+
+def reload_settings():
+    """
+    Forget the settings read, for the long running service when the settings change.
+    """
+    global _addon
+    _addon = None
+    _values.clear()
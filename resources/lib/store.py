@@ -0,0 +1,136 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Normalized list format: a single movie store keyed by tmdb id and thin
+movie lists only carrying (id, rank) pairs.
+
+The store is distributed as a JSON file and imported on the device into
+a sqlite database, so displaying a list only reads the movies it contains.
+
+This module doesn't depend on Kodi so it can be used by the tools.
+"""
+
+import json
+
+# Movie fields kept in the store, the ones used to render the lists
+STORE_FIELDS = [
+    "title",
+    "original_title",
+    "release_date",
+    "genre_ids",
+    "overview",
+    "poster_path",
+    "backdrop_path"
+]
+
+# Value of the "format" field of a thin movie list
+THIN_FORMAT = "thin"
+
+def is_thin_list(movie_list):
+    """
+    Tell if a movie list uses the thin format.
+    """
+    return movie_list.get("format") == THIN_FORMAT
+
+def normalize_list(movie_list, store):
+    """
+    Convert a full movie list to the thin format.
+    The movies not yet in the store are added to it.
+    Returns the thin list.
+    """
+
+    thin_movies = []
+    for index, movie in enumerate(movie_list["movies"]):
+        key = str(movie["id"])
+        if key not in store["movies"]:
+            store["movies"][key] = [movie.get(field) for field in STORE_FIELDS]
+        thin_movies.append([movie["id"], index + 1])
+
+    thin_list = {key: value for key, value in movie_list.items() if key != "movies"}
+    thin_list["format"] = THIN_FORMAT
+    thin_list["movies"] = thin_movies
+    return thin_list
+
+def new_store():
+    """
+    Create an empty movie store.
+    """
+    return {
+        "type": "movie_store",
+        "fields": STORE_FIELDS,
+        "movies": {}
+    }
+
+def open_store_db(db_path):
+    """
+    Open the local movie store database, creating it if needed.
+    """
+
+    import sqlite3 # only the actions using a database load it
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS movies (id INTEGER PRIMARY KEY, data TEXT)")
+    return conn
+
+def refresh_store_db(conn, signature, load_store):
+    """
+    Import the movie store in the database if its signature changed.
+    load_store is only called when an import is needed and returns the parsed store.
+    """
+
+    row = conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+    if row is not None and row[0] == signature:
+        return
+
+    store = load_store()
+    with conn:
+        conn.execute("DELETE FROM movies")
+        conn.executemany("INSERT INTO movies (id, data) VALUES (?, ?)",
+                         ((int(id), json.dumps(values)) for id, values in store["movies"].items()))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fields', ?)", (json.dumps(store["fields"]),))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)", (signature,))
+
+def hydrate_list(thin_list, conn):
+    """
+    Convert a thin movie list back to the full format using the movie store database,
+    so it can be displayed like any other list.
+    Movies missing from the store are skipped.
+    """
+
+    fields = json.loads(conn.execute("SELECT value FROM meta WHERE key = 'fields'").fetchone()[0])
+
+    # sqlite limits the number of variables of a query, so the ids are queried by chunks
+    ids = [entry[0] for entry in thin_list["movies"]]
+    store_movies = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        query = "SELECT id, data FROM movies WHERE id IN (%s)" % ",".join("?" * len(chunk))
+        for id, data in conn.execute(query, chunk):
+            store_movies[id] = data
+
+    movies = []
+    for id, rank in sorted(thin_list["movies"], key=lambda entry: entry[1]):
+        data = store_movies.get(id)
+        if data is None:
+            continue
+        movie = dict(zip(fields, json.loads(data)))
+        movie["id"] = id
+        movie["rank"] = rank
+        movies.append(movie)
+
+    movie_list = {key: value for key, value in thin_list.items() if key not in ("movies", "format")}
+    movie_list["movies"] = movies
+    return movie_list
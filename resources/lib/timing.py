@@ -0,0 +1,64 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Lightweight timing of the phases of an invocation (downloads, parsing,
+JSON-RPC calls...), logged at LOGDEBUG as a single JSON line.
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+import xbmc
+
+# {phase name: [total seconds, count]} since the last log_timings
+_phases = {}
+# the phases of the service threads and of the concurrent downloads are timed at the same time
+_lock = threading.Lock()
+
+@contextmanager
+def phase(name):
+    """
+    Time a phase, a phase can run several times in an invocation and even concurrently,
+    its total time and count are reported.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            timing = _phases.setdefault(name, [0.0, 0])
+            timing[0] += elapsed
+            timing[1] += 1
+
+def get_timings(reset=False):
+    """
+    Get the timings since the last log_timings as {phase name: {"ms": total, "count": count}},
+    and start over if reset.
+    """
+    with _lock:
+        phases = {name: tuple(timing) for name, timing in _phases.items()}
+        if reset:
+            _phases.clear()
+    return {name: {"ms": round(total * 1000, 2), "count": count} for name, (total, count) in phases.items()}
+
+def log_timings(label):
+    """
+    Log the timings since the last call and start over.
+    """
+    xbmc.log(f"jlom timings: {json.dumps({'label': label, 'phases': get_timings(reset=True)})}", level=xbmc.LOGDEBUG)
@@ -0,0 +1,289 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Picks of movies for the home screen widgets. Skins refresh widgets often,
+so the movies of a folder subtree are gathered once in a candidate pool:
+the movies of the library with their lists score and best rank, and the best
+movies missing from the library. A pool is saved for the versions of the
+lists index and of the library index it was built from; the service
+rebuilds the existing pools when the library changes. The movies data is
+kept apart, one line per movie, so a widget refresh reads the small pool
+file and only the lines of the movies it picked.
+"""
+
+import os
+import json
+import random
+import hashlib
+
+from resources.lib.library import ADDON_USER_DATA_FOLDER, get_tmp_file, find_movie
+from resources.lib.jsonstream import MOVIE_FIELDS
+from resources.lib.timing import phase
+from resources.lib.lists_index import LISTS_INDEX_FILE, open_lists_index, get_generation
+from resources.lib.consensus import CONSENSUS_SCORE
+
+WIDGETS_DIR = os.path.join(ADDON_USER_DATA_FOLDER, 'widgets')
+
+# Best movies missing from the library kept in a pool
+MISSING_CANDIDATES = 500
+
+# Ways to pick the movies of a widget
+MODES = ('random', 'consensus', 'next')
+# Movies a widget picks from
+FILTERS = ('unwatched', 'library', 'missing', 'all')
+
+# Keys of a saved pool, a file without them isn't a pool
+POOL_KEYS = ("folder_id", "generation", "db_mtime", "library_version", "tmdb", "movieid", "rank", "offset")
+
+def get_pool_name(folder_id):
+    # the folder id comes from the plugin URL, it is never used as a path
+    return hashlib.sha1(folder_id.encode('utf-8')).hexdigest()
+
+def get_pool_file(folder_id):
+    return os.path.join(WIDGETS_DIR, f"{get_pool_name(folder_id)}.json")
+
+def get_movies_file(folder_id):
+    return os.path.join(WIDGETS_DIR, f"{get_pool_name(folder_id)}.movies")
+
+def is_pool(pool):
+    return isinstance(pool, dict) and all(key in pool for key in POOL_KEYS)
+
+def get_lists_index_mtime():
+    """
+    Get the modified time of the lists index database, a pool is checked again when it changes.
+    """
+    try:
+        return os.stat(LISTS_INDEX_FILE).st_mtime
+    except OSError:
+        return None
+
+def get_subtree_lists(conn, folder_id):
+    """
+    Get the ids of the movie lists below a folder of the lists tree.
+    """
+    children = {}
+    for parent_id, child_type, child_id in conn.execute("SELECT parent_id, child_type, child_id FROM tree"):
+        children.setdefault(parent_id, []).append((child_type, child_id))
+
+    list_ids = set()
+    seen = {folder_id}
+    pending = [folder_id]
+    while pending:
+        for child_type, child_id in children.get(pending.pop(), []):
+            if child_type == 'movie_list':
+                list_ids.add(child_id)
+            elif child_id not in seen:
+                seen.add(child_id)
+                pending.append(child_id)
+    return sorted(list_ids)
+
+def read_movies_data(conn, tmdbs, data):
+    """
+    Read the JSON data of movies of the lists index into data: {tmdb: data}.
+    """
+    for start in range(0, len(tmdbs), 500): # stay below the sqlite variables limit
+        chunk = tmdbs[start:start + 500]
+        data.update(conn.execute(f"SELECT tmdb, data FROM movies WHERE tmdb IN ({','.join('?' * len(chunk))})", chunk))
+
+def build_pool(folder_id, library_index):
+    """
+    Build the candidate pool of a folder subtree from the lists index and the library index.
+    Returns ({"folder_id", "generation", "db_mtime", "library_version", "tmdb", "movieid", "rank"}, movies):
+    the candidates are in columns ordered by score, movieid being 0 for a movie missing from
+    the library and rank 0 for a movie of unranked lists only. movies are the candidates movies
+    with the fields needed to show them (no overview for the library movies, the library has the plot).
+    Returns None if the lists index is empty.
+    """
+    conn = open_lists_index()
+    try:
+        list_ids = get_subtree_lists(conn, folder_id)
+        if not list_ids:
+            return None
+        with phase('widget: pool query'):
+            ranking = conn.execute(f"""
+                SELECT entries.tmdb, MIN(CASE WHEN lists.ordered_by = 'rank' THEN entries.rank END)
+                FROM entries JOIN lists ON lists.list_id = entries.list_id
+                WHERE entries.list_id IN ({','.join('?' * len(list_ids))})
+                GROUP BY entries.tmdb
+                ORDER BY SUM({CONSENSUS_SCORE}) DESC, entries.tmdb""", list_ids).fetchall()
+
+        # the library movies and the best missing ones, the movies without tmdb id
+        # of the library are found by imdb id or title with the data of the lists movies
+        tmdb_index = library_index["tmdb"]
+        data = {}
+        if library_index.get("imdb") or library_index.get("titles"):
+            with phase('widget: pool movies'):
+                read_movies_data(conn, [tmdb for tmdb, best_rank in ranking if str(tmdb) not in tmdb_index], data)
+        candidates = []
+        missing = 0
+        for tmdb, best_rank in ranking:
+            movieid = tmdb_index.get(str(tmdb))
+            if movieid is None and tmdb in data:
+                movieid = find_movie(library_index, json.loads(data[tmdb]))[0]
+            if movieid is None:
+                if missing == MISSING_CANDIDATES:
+                    continue
+                missing += 1
+            candidates.append((tmdb, int(movieid or 0), best_rank or 0))
+
+        with phase('widget: pool movies'):
+            read_movies_data(conn, [tmdb for tmdb, movieid, best_rank in candidates if tmdb not in data], data)
+        generation = get_generation(conn)
+    finally:
+        conn.close()
+
+    pool = {
+        "folder_id": folder_id,
+        "generation": generation,
+        "db_mtime": get_lists_index_mtime(),
+        "library_version": library_index["version"],
+        "tmdb": [],
+        "movieid": [],
+        "rank": []
+    }
+    movies = []
+    fields = [field for field in MOVIE_FIELDS if field != 'rank']
+    for tmdb, movieid, best_rank in candidates:
+        movie = json.loads(data.get(tmdb, '{}'))
+        if not movie.get('title'):
+            continue
+        if movieid:
+            movie['overview'] = ''
+        movie = {field: movie.get(field) for field in fields}
+        movie['id'] = tmdb
+        pool["tmdb"].append(tmdb)
+        pool["movieid"].append(movieid)
+        pool["rank"].append(best_rank)
+        movies.append(movie)
+    return pool, movies
+
+def save_pool(folder_id, pool, movies=None):
+    """
+    Save a pool, with the movies of its candidates if they changed: the pool
+    gets the offset of each movie line in the movies file.
+    """
+    os.makedirs(WIDGETS_DIR, exist_ok=True)
+    if movies is not None:
+        movies_file = get_movies_file(folder_id)
+        offsets = [0]
+        tmp_file = get_tmp_file(movies_file)
+        with open(tmp_file, 'wb') as f:
+            for movie in movies:
+                line = json.dumps(movie, separators=(',', ':')).encode('utf-8') + b'\n'
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        os.replace(tmp_file, movies_file)
+        pool["offset"] = offsets
+    pool_file = get_pool_file(folder_id)
+    tmp_file = get_tmp_file(pool_file)
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(pool, f, separators=(',', ':'))
+    os.replace(tmp_file, pool_file)
+
+def read_movies(folder_id, pool, positions):
+    """
+    Read the movies of candidates of a saved pool from its movies file.
+    """
+    offsets = pool["offset"]
+    movies = []
+    with phase('widget: movies read'), open(get_movies_file(folder_id), 'rb') as f:
+        for position in positions:
+            f.seek(offsets[position])
+            movies.append(json.loads(f.read(offsets[position + 1] - offsets[position])))
+    return movies
+
+def get_pool(folder_id, library_index):
+    """
+    Get the candidate pool of a folder subtree, built again only when the library
+    or the lists changed. Returns None if the lists index is empty.
+    """
+    try:
+        with phase('widget: pool read'), open(get_pool_file(folder_id), 'r', encoding='utf-8') as f:
+            pool = json.load(f)
+        # a malformed pool is built again
+        if not is_pool(pool) or pool["folder_id"] != folder_id or not os.path.exists(get_movies_file(folder_id)):
+            pool = None
+    except (OSError, ValueError):
+        pool = None
+
+    db_mtime = get_lists_index_mtime()
+    if pool is not None and pool["library_version"] == library_index["version"]:
+        if pool["db_mtime"] == db_mtime:
+            return pool
+        # the database also changes for the coverage, only a new generation changes the pool
+        conn = open_lists_index()
+        try:
+            generation = get_generation(conn)
+        finally:
+            conn.close()
+        if generation == pool["generation"]:
+            pool["db_mtime"] = db_mtime
+            save_pool(folder_id, pool)
+            return pool
+
+    built = build_pool(folder_id, library_index)
+    if built is None:
+        return None
+    save_pool(folder_id, *built)
+    return built[0]
+
+def refresh_pools(library_index):
+    """
+    Rebuild the saved pools for the current library, used by the service when the library changed.
+    """
+    if not os.path.isdir(WIDGETS_DIR):
+        return
+    for file_name in os.listdir(WIDGETS_DIR):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(WIDGETS_DIR, file_name), 'r', encoding='utf-8') as f:
+                pool = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not is_pool(pool):
+            continue
+        folder_id = pool["folder_id"]
+        built = build_pool(folder_id, library_index)
+        if built is not None:
+            save_pool(folder_id, *built)
+
+def pick_movies(folder_id, pool, library_index, mode, library_filter, count):
+    """
+    Pick count movies of the pool of a folder subtree:
+    random, the best consensus scores, or the best ranks ("next" in the ranked lists).
+    library_filter is one of FILTERS, unwatched being the library movies not watched yet.
+    Returns the movies as in the movie lists.
+    """
+    movieids = pool["movieid"]
+    positions = range(len(movieids))
+    if library_filter == 'unwatched':
+        watched = library_index["watched"]
+        positions = [i for i in positions if movieids[i] and movieids[i] not in watched]
+    elif library_filter == 'library':
+        positions = [i for i in positions if movieids[i]]
+    elif library_filter == 'missing':
+        positions = [i for i in positions if not movieids[i]]
+
+    if mode == 'random':
+        positions = random.sample(positions, min(count, len(positions)))
+    elif mode == 'next':
+        # the movies without rank come after the ranked ones, by score
+        ranks = pool["rank"]
+        positions = sorted(positions, key=lambda i: ranks[i] or float('inf'))[:count]
+    else:
+        positions = positions[:count] # the pool is ordered by score
+    return read_movies(folder_id, pool, positions)
@@ -0,0 +1,370 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import time
+import queue
+import threading
+
+import xbmc
+
+from resources.lib.settings import get_addon, get_setting_bool, get_setting_int, reload_settings
+from resources.lib.library import build_tmdbid_to_dbid_index, get_movie_index_entry, get_match_stats, get_fallback_indexes, save_tmdb_index
+from resources.lib.timing import log_timings
+from resources.lib.lists import prefetch_lists, sync_lists
+from resources.lib.lists_index import update_lists_index, is_lists_index_empty, is_lists_index_outdated
+from resources.lib.coverage import apply_coverage_deltas
+from resources.lib.artwork import WARM_ARTWORK_MESSAGE, warm_artwork
+from resources.lib.widgets import refresh_pools
+from resources.lib.http_cache import trim_requests_cache
+from resources.lib.diagnostics import fold_usage, record_maintenance
+
+# Delay in seconds between two saves of the index, so a library scan
+# sending hundreds of notifications only rewrites the file a few times
+SAVE_INTERVAL = 2
+
+# Delay in seconds between two maintenances of the requests cache
+MAINTENANCE_INTERVAL = 3600
+
+class LibraryMonitor(xbmc.Monitor):
+    """
+    Keep the tmdb index up to date with the library notifications.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.version = None
+        #artwork warm-up requests of the plugin, one list of urls per displayed list
+        self.artwork_requests = queue.Queue()
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Build the whole index from the library.
+        """
+        index, watched, fallback, runtimes = build_tmdbid_to_dbid_index(notify=False)
+        log_timings('service: index rebuild')
+        xbmc.log(f'jlom service: library movies found by {get_match_stats(index, fallback)}', level=xbmc.LOGINFO)
+        with self.lock:
+            self.index = index
+            self.watched = set(watched)
+            #fallback keys {movieid: (imdb, title keys)} of the movies without tmdb id
+            self.fallback = fallback
+            #runtimes {movieid: seconds}, for the runtime filter of the lists
+            self.runtimes = runtimes
+            #reverse mapping {movieid: tmdb} to handle removals
+            self.movies = {movieid: tmdbid for tmdbid, movieid in index.items()}
+            #coverage changes since the last save, None when it has to be computed again
+            self.deltas = None
+            self.dirty = True
+
+    def set_movie(self, movieid, tmdbid, is_watched):
+        """
+        Set the state of a movie in the index and record the coverage changes,
+        tmdbid is None for a movie removed from the index or without tmdb id. To be called with the lock held.
+        """
+        old_tmdbid = self.movies.get(movieid)
+        was_watched = movieid in self.watched
+        if old_tmdbid == tmdbid and was_watched == is_watched:
+            return
+
+        if old_tmdbid is not None and self.index.get(old_tmdbid) == movieid:
+            del self.index[old_tmdbid]
+            self.record_delta(old_tmdbid, -1, -1 if was_watched else 0)
+        self.movies.pop(movieid, None)
+        self.watched.discard(movieid)
+
+        if tmdbid is not None and tmdbid not in self.index:
+            self.index[tmdbid] = movieid
+            self.movies[movieid] = tmdbid
+            if is_watched:
+                self.watched.add(movieid)
+            self.record_delta(tmdbid, 1, 1 if is_watched else 0)
+        elif tmdbid is None and is_watched:
+            # a movie without tmdb id, found by its imdb id or title
+            self.watched.add(movieid)
+        self.dirty = True
+
+    def record_delta(self, tmdbid, owned_change, watched_change):
+        """
+        Record a coverage change, to be applied when the index is saved.
+        """
+        if self.deltas is not None:
+            self.deltas.append((tmdbid, owned_change, watched_change))
+
+    def update_movie(self, movieid):
+        """
+        Add or update a single movie of the index.
+        """
+        tmdbid, playcount, fallback_keys, runtime = get_movie_index_entry(movieid)
+        with self.lock:
+            old_keys = self.fallback.get(movieid)
+            was_watched = movieid in self.watched
+            self.set_movie(movieid, tmdbid, playcount > 0)
+            if (old_keys is not None or fallback_keys is not None) and (old_keys != fallback_keys or was_watched != (playcount > 0)):
+                # the movies without tmdb id are matched by the coverage computation only
+                self.deltas = None
+            if fallback_keys is not None:
+                self.fallback[movieid] = fallback_keys
+            else:
+                self.fallback.pop(movieid, None)
+            if runtime:
+                self.runtimes[movieid] = runtime
+            else:
+                self.runtimes.pop(movieid, None)
+            # the details shown in the lists may have changed too (resume point, rating...),
+            # saving gives a new library version so the cached directories are resolved again
+            self.dirty = True
+
+    def remove_movie(self, movieid):
+        """
+        Remove a single movie from the index.
+        """
+        with self.lock:
+            self.set_movie(movieid, None, False)
+            if self.fallback.pop(movieid, None) is not None:
+                self.deltas = None
+                self.dirty = True
+            if self.runtimes.pop(movieid, None) is not None:
+                self.dirty = True
+
+    def save(self):
+        """
+        Save the index if it changed since the last save, and update the coverage accordingly.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            version = save_tmdb_index(self.index, self.watched, self.fallback, self.runtimes)
+            if self.deltas is not None and self.version is not None:
+                apply_coverage_deltas(self.deltas, self.version, version)
+            self.version = version
+            self.deltas = []
+            self.dirty = False
+            # the movies without tmdb id are found by imdb id or title in the pools too
+            imdb, titles = get_fallback_indexes(self.fallback)
+            library_index = {"tmdb": dict(self.index), "version": version, "imdb": imdb, "titles": titles}
+        # the widgets pools depend on the library, they are ready before the next widget refresh
+        try:
+            refresh_pools(library_index)
+        except Exception as e:
+            xbmc.log(f'jlom service: widgets pools refresh failed: {e}', level=xbmc.LOGWARNING)
+
+    def onSettingsChanged(self):
+        # the settings are read once per invocation, the service reads them again when they change
+        reload_settings()
+
+    def onNotification(self, sender, method, data):
+        if sender == get_addon().getAddonInfo('id') and method == f'Other.{WARM_ARTWORK_MESSAGE}':
+            try:
+                self.artwork_requests.put(json.loads(data)["urls"])
+            except (ValueError, KeyError, TypeError):
+                pass
+            return
+
+        if method in ('VideoLibrary.OnScanFinished', 'VideoLibrary.OnCleanFinished'):
+            xbmc.log(f'jlom service: {method}, rebuilding the tmdb index', level=xbmc.LOGDEBUG)
+            self.rebuild()
+            return
+
+        if method not in ('VideoLibrary.OnUpdate', 'VideoLibrary.OnRemove'):
+            return
+
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return
+        #OnUpdate wraps the item, OnRemove doesn't
+        item = data.get('item', data) if isinstance(data, dict) else {}
+        if item.get('type') != 'movie' or item.get('id') is None:
+            return
+
+        xbmc.log(f'jlom service: {method} for movie {item["id"]}', level=xbmc.LOGDEBUG)
+        if method == 'VideoLibrary.OnUpdate':
+            self.update_movie(item['id'])
+        else:
+            self.remove_movie(item['id'])
+
+def prefetch_due(last_prefetch):
+    """
+    Tell if the scheduled prefetch of the distant lists should run now.
+    It never runs while something is playing, to leave the bandwidth to the playback.
+    """
+    if not get_setting_bool('prefetch_enable') or get_setting_bool('lists_source'):
+        return False
+    if xbmc.Player().isPlaying():
+        return False
+    return time.time() - last_prefetch >= get_setting_int('prefetch_interval') * 3600
+
+def sync_due(last_sync):
+    """
+    Tell if the scheduled synchronization of the distant lists should run now.
+    """
+    if not get_setting_bool('sync_enable') or get_setting_bool('lists_source'):
+        return False
+    return time.time() - last_sync >= get_setting_int('sync_interval') * 3600
+
+def sync(monitor):
+    """
+    Synchronize the distant lists, run in its own thread like the prefetch.
+    """
+    try:
+        updated = sync_lists(abort=monitor.abortRequested)
+    except Exception as e:
+        xbmc.log(f'jlom service: lists synchronization failed: {e}', level=xbmc.LOGWARNING)
+        return
+    if not updated:
+        return
+    xbmc.log(f'jlom service: {len(updated)} lists synchronized', level=xbmc.LOGINFO)
+
+    # index the changed lists again, the whole tree is checked if a folder list changed
+    if is_lists_index_empty():
+        return # the index is built when first needed
+    if any(file_path.startswith('folder_list/') or file_path.startswith('movie_store/') for file_path in updated):
+        update_lists_index(abort=monitor.abortRequested)
+    else:
+        list_ids = [file_path[len('movie_list/'):-len('.json')] for file_path in updated if file_path.startswith('movie_list/')]
+        update_lists_index(list_ids, abort=monitor.abortRequested)
+
+def index_refresh_due(last_refresh):
+    """
+    Tell if the lists index should be checked against the distant lists now, when neither
+    the prefetch nor the synchronization does it: when the cached lists expire, never while
+    something is playing.
+    """
+    if get_setting_bool('lists_source') or get_setting_bool('sync_enable') or get_setting_bool('prefetch_enable'):
+        return False
+    if xbmc.Player().isPlaying():
+        return False
+    return time.time() - last_refresh >= get_setting_int('movie_list_ttl') * 3600
+
+def refresh_lists_index(monitor):
+    """
+    Index again the distant lists whose signature changed, so the coverage, the most
+    recommended lists and the widgets follow the lists without the synchronization.
+    """
+    if is_lists_index_empty():
+        return # the index is built when first needed
+    try:
+        update_lists_index(abort=monitor.abortRequested)
+    except Exception as e:
+        xbmc.log(f'jlom service: lists index update failed: {e}', level=xbmc.LOGWARNING)
+
+def check_lists_index(monitor):
+    """
+    Check the whole lists index when the lists source changed (other server, addon update...),
+    or build it if the coverage of the lists is displayed.
+    """
+    if is_lists_index_empty():
+        needed = get_setting_bool('show_coverage')
+    else:
+        needed = is_lists_index_outdated()
+    if not needed:
+        return
+
+    try:
+        update_lists_index(abort=monitor.abortRequested)
+    except Exception as e:
+        xbmc.log(f'jlom service: lists index update failed: {e}', level=xbmc.LOGWARNING)
+
+def warm_artwork_requests(monitor):
+    """
+    Load the artwork of the lists displayed by the plugin in the texture cache, run in its own thread.
+    Only the last displayed list is loaded, the previous requests are dropped.
+    """
+    while not monitor.abortRequested():
+        try:
+            urls = monitor.artwork_requests.get(timeout=1)
+        except queue.Empty:
+            continue
+        while not monitor.artwork_requests.empty():
+            urls = monitor.artwork_requests.get()
+        if xbmc.Player().isPlaying():
+            continue # leave the bandwidth to the playback
+        try:
+            nbloaded = warm_artwork(urls, abort=lambda: monitor.abortRequested() or not monitor.artwork_requests.empty())
+        except Exception as e:
+            xbmc.log(f'jlom service: artwork warm-up failed: {e}', level=xbmc.LOGWARNING)
+            continue
+        xbmc.log(f'jlom service: {nbloaded} images loaded in the texture cache', level=xbmc.LOGDEBUG)
+
+def maintenance_due(last_maintenance):
+    """
+    Tell if the maintenance of the requests cache should run now, never while something
+    is playing: trimming and vacuuming the cache rewrites it, slow on SD cards.
+    """
+    if xbmc.Player().isPlaying():
+        return False
+    return time.time() - last_maintenance >= MAINTENANCE_INTERVAL
+
+def maintenance(monitor):
+    """
+    Fold the usage of the plugin invocations, then trim the requests cache to its size
+    with the last uses of its responses, run in its own thread.
+    """
+    try:
+        accessed = fold_usage()
+        removed = trim_requests_cache(get_setting_int('requests_cache_size') * 1024 * 1024, accessed)
+        record_maintenance(removed)
+    except Exception as e:
+        xbmc.log(f'jlom service: requests cache maintenance failed: {e}', level=xbmc.LOGWARNING)
+        return
+    xbmc.log(f'jlom service: requests cache maintained, {removed} responses removed', level=xbmc.LOGDEBUG)
+
+def prefetch(monitor):
+    """
+    Prefetch the distant lists, run in its own thread to keep saving the index meanwhile.
+    """
+    nblists = prefetch_lists(abort=monitor.abortRequested)
+    xbmc.log(f'jlom service: {nblists} lists prefetched', level=xbmc.LOGINFO)
+    # the lists are fresh in the requests cache, checking them all is cheap
+    refresh_lists_index(monitor)
+
+if __name__ == '__main__':
+    monitor = LibraryMonitor()
+    # the scheduled index refreshes wait for the check at startup
+    index_thread = threading.Thread(target=check_lists_index, args=(monitor,), daemon=True)
+    index_thread.start()
+    last_index_refresh = 0
+    threading.Thread(target=warm_artwork_requests, args=(monitor,), daemon=True).start()
+    last_prefetch = 0
+    prefetch_thread = None
+    last_sync = 0
+    sync_thread = None
+    last_maintenance = 0
+    maintenance_thread = None
+    while not monitor.abortRequested():
+        monitor.save()
+        if (maintenance_thread is None or not maintenance_thread.is_alive()) and maintenance_due(last_maintenance):
+            last_maintenance = time.time()
+            maintenance_thread = threading.Thread(target=maintenance, args=(monitor,), daemon=True)
+            maintenance_thread.start()
+        if (sync_thread is None or not sync_thread.is_alive()) and sync_due(last_sync):
+            last_sync = time.time()
+            sync_thread = threading.Thread(target=sync, args=(monitor,), daemon=True)
+            sync_thread.start()
+        if (prefetch_thread is None or not prefetch_thread.is_alive()) and prefetch_due(last_prefetch):
+            last_prefetch = time.time()
+            prefetch_thread = threading.Thread(target=prefetch, args=(monitor,), daemon=True)
+            prefetch_thread.start()
+        if not index_thread.is_alive() and index_refresh_due(last_index_refresh):
+            last_index_refresh = time.time()
+            index_thread = threading.Thread(target=refresh_lists_index, args=(monitor,), daemon=True)
+            index_thread.start()
+        if monitor.waitForAbort(SAVE_INTERVAL):
+            break
+    monitor.save()
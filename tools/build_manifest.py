@@ -0,0 +1,74 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Build the manifest.json of a lists folder, listing every list file with its
+hash, size and modified date. The plugin uses it to only download the lists
+that changed.
+
+usage: python tools/build_manifest.py /path/to/lists
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import datetime
+
+# folders of the lists folder published in the manifest
+LIST_TYPES = ['folder_list', 'movie_list', 'movie_store']
+
+def build_manifest(lists_dir):
+    """
+    Build the manifest of a lists folder.
+    """
+
+    files = {}
+    for list_type in LIST_TYPES:
+        type_dir = os.path.join(lists_dir, list_type)
+        if not os.path.isdir(type_dir):
+            continue
+        for file_name in sorted(os.listdir(type_dir)):
+            if not file_name.endswith('.json'):
+                continue
+            with open(os.path.join(type_dir, file_name), 'rb') as f:
+                content = f.read()
+            try:
+                modified = json.loads(content).get('modified')
+            except ValueError:
+                print(f'{list_type}/{file_name} is not valid JSON, skipped', file=sys.stderr)
+                continue
+            files[f'{list_type}/{file_name}'] = {
+                'sha1': hashlib.sha1(content).hexdigest(),
+                'size': len(content),
+                'modified': modified
+            }
+
+    return {
+        'type': 'manifest',
+        'generated': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'files': files
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the manifest of a lists folder')
+    parser.add_argument('lists_dir', help='folder containing folder_list/ and movie_list/')
+    args = parser.parse_args()
+
+    manifest = build_manifest(args.lists_dir)
+    with open(os.path.join(args.lists_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    print(f'{len(manifest["files"])} files in the manifest', file=sys.stderr)
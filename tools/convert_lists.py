@@ -0,0 +1,68 @@
+# Copyright (C) 2023, lbnt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Convert a lists folder (folder_list/ and movie_list/) to the normalized format:
+the movie lists become thin lists of (id, rank) and the movies are stored
+once in movie_store/movies.json.
+
+usage: python tools/convert_lists.py resources/lists /path/to/output
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from resources.lib.store import new_store, normalize_list, is_thin_list
+
+def convert(src_dir, dst_dir):
+    """
+    Convert all the lists of src_dir and write them to dst_dir.
+    """
+
+    # folder lists are copied as is
+    shutil.copytree(os.path.join(src_dir, 'folder_list'), os.path.join(dst_dir, 'folder_list'), dirs_exist_ok=True)
+
+    os.makedirs(os.path.join(dst_dir, 'movie_list'), exist_ok=True)
+    os.makedirs(os.path.join(dst_dir, 'movie_store'), exist_ok=True)
+
+    store = new_store()
+    for file_name in sorted(os.listdir(os.path.join(src_dir, 'movie_list'))):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(src_dir, 'movie_list', file_name), 'r', encoding='utf-8') as f:
+            movie_list = json.load(f)
+        if is_thin_list(movie_list):
+            print(f'{file_name} is already converted, skipped', file=sys.stderr)
+            continue
+        thin_list = normalize_list(movie_list, store)
+        with open(os.path.join(dst_dir, 'movie_list', file_name), 'w', encoding='utf-8') as f:
+            json.dump(thin_list, f, ensure_ascii=False, separators=(',', ':'))
+
+    with open(os.path.join(dst_dir, 'movie_store', 'movies.json'), 'w', encoding='utf-8') as f:
+        json.dump(store, f, ensure_ascii=False, separators=(',', ':'))
+
+    print(f'{len(store["movies"])} movies stored', file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert lists to the normalized format')
+    parser.add_argument('src_dir', help='folder containing folder_list/ and movie_list/')
+    parser.add_argument('dst_dir', help='output folder')
+    args = parser.parse_args()
+    convert(args.src_dir, args.dst_dir)